@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 11, 2015
+
+Block-parallel compression. The stream is split into blocks of block_size
+bytes which are compressed independently in a thread pool (zlib, bz2 and lzma
+release the GIL), so compressing and decompressing big pickles scales with
+the number of cores.
+
+The stream consists of the header (magic, version and codec id) followed by
+the frames. Each frame has the compressed and the raw sizes of the block and
+the compressed block itself. The frame headers form the index of the blocks:
+they can be enumerated without decompressing anything (see block_index()).
+A stream is valid after any number of frames, so several streams can be
+concatenated and a stream can be flushed at any moment.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import bz2
+from collections import deque
+from multiprocessing import cpu_count
+import struct
+import threading
+import zlib
+
+import snappy
+
+from veles.compat import lzma
+from veles.thread_pool import ThreadPool
+
+
+MAGIC = b"VBLK"
+VERSION = 1
+HEADER = struct.Struct("<4sBB")
+FRAME = struct.Struct("<II")
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+#: name -> (id, compress(buffer, level), decompress(buffer))
+CODECS = {
+    "gz": (1, zlib.compress, zlib.decompress),
+    "bz2": (2, bz2.compress, bz2.decompress),
+    "xz": (3, lambda b, l: lzma.compress(b, preset=l), lzma.decompress),
+    "snappy": (4, lambda b, _: snappy.compress(b), snappy.decompress),
+}
+CODEC_BY_ID = {v[0]: k for k, v in CODECS.items()}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _daemon_thread(*args, **kwargs):
+    thread = threading.Thread(*args, **kwargs)
+    thread.daemon = True
+    return thread
+
+
+def get_pool():
+    """
+    :return: The thread pool which is shared by all the block codecs. It is
+    recreated if the previous one was shut down. Its threads are daemonic so
+    that they do not prevent the interpreter from exiting.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool not in ThreadPool.pools:
+            _pool = ThreadPool(minthreads=1, maxthreads=cpu_count(),
+                               name="codec")
+            _pool.threadFactory = _daemon_thread
+    return _pool
+
+
+class BlockCompressor(object):
+    """Incremental compressor with the interface of zlib.compressobj():
+    compress() returns the frames which are ready so far and flush() returns
+    the rest. Up to window blocks are compressed at once.
+    """
+
+    def __init__(self, codec="gz", level=6, block_size=DEFAULT_BLOCK_SIZE,
+                 pool=None, window=None):
+        if codec not in CODECS:
+            raise ValueError("Unsupported block codec \"%s\" (choose one of "
+                             "%s)" % (codec, ", ".join(sorted(CODECS))))
+        if block_size < 1:
+            raise ValueError("block_size must be positive (got %d)" %
+                             block_size)
+        self.codec = codec
+        self.level = level
+        self.block_size = block_size
+        self.pool = pool if pool is not None else get_pool()
+        self.window = window if window is not None else 2 * self.pool.max
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._header = HEADER.pack(MAGIC, VERSION, CODECS[codec][0])
+
+    def compress(self, data):
+        self._buffer += data
+        size = self.block_size
+        if len(self._buffer) < size:
+            return b""
+        count = len(self._buffer) // size
+        for i in range(count):
+            self._submit(bytes(self._buffer[i * size:(i + 1) * size]))
+        del self._buffer[:count * size]
+        return self._collect(lambda: len(self._pending) > self.window)
+
+    def flush(self):
+        if len(self._buffer) > 0:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        return self._collect(lambda: len(self._pending) > 0)
+
+    def _submit(self, block):
+        self._pending.append((len(block), self.pool.apply_async(
+            CODECS[self.codec][1], block, self.level)))
+
+    def _collect(self, more):
+        parts = [self._header]
+        self._header = b""
+        while more() or (len(self._pending) > 0 and
+                         self._pending[0][1].ready()):
+            raw_size, result = self._pending.popleft()
+            data = result.get()
+            parts.append(FRAME.pack(len(data), raw_size))
+            parts.append(data)
+        return b"".join(parts)
+
+
+class BlockDecompressor(object):
+    """Incremental decompressor with the interface of
+    zlib.decompressobj(): the complete frames of the data passed to
+    decompress() are decompressed in parallel.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool if pool is not None else get_pool()
+        self.codec = None
+        self._buffer = bytearray()
+
+    @property
+    def unused_data(self):
+        return bytes(self._buffer)
+
+    def decompress(self, data):
+        self._buffer += data
+        if self.codec is None:
+            if len(self._buffer) < HEADER.size:
+                return b""
+            self.codec = self._parse_header(
+                bytes(self._buffer[:HEADER.size]))
+            del self._buffer[:HEADER.size]
+        blocks = []
+        pos = 0
+        while len(self._buffer) - pos >= FRAME.size:
+            size, _ = FRAME.unpack_from(bytes(
+                self._buffer[pos:pos + FRAME.size]))
+            end = pos + FRAME.size + size
+            if end > len(self._buffer):
+                break
+            blocks.append(bytes(self._buffer[pos + FRAME.size:end]))
+            pos = end
+        del self._buffer[:pos]
+        if len(blocks) == 0:
+            return b""
+        decompress = CODECS[self.codec][2]
+        if len(blocks) == 1:
+            return decompress(blocks[0])
+        return b"".join(self.pool.map(decompress, blocks))
+
+    def flush(self):
+        if len(self._buffer) > 0:
+            raise ValueError("The block stream is truncated (%d bytes left)" %
+                             len(self._buffer))
+        return b""
+
+    @staticmethod
+    def _parse_header(header):
+        magic, version, codec_id = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("Not a block compressed stream")
+        if version > VERSION:
+            raise ValueError("Unsupported block stream version %d" % version)
+        try:
+            return CODEC_BY_ID[codec_id]
+        except KeyError:
+            raise ValueError("Unknown block codec id %d" % codec_id)
+
+
+class BlockFile(object):
+    """File object which compresses the written data with BlockCompressor or
+    decompresses the read data with BlockDecompressor. When reading, up to
+    read_ahead compressed bytes are read and decompressed at once.
+    """
+
+    def __init__(self, file_name_or_obj, file_mode, codec="gz", level=6,
+                 block_size=DEFAULT_BLOCK_SIZE, pool=None, read_ahead=None):
+        if isinstance(file_name_or_obj, str):
+            self._file = open(file_name_or_obj, file_mode)
+            self._owns_file = True
+        else:
+            self._file = file_name_or_obj
+            self._owns_file = False
+        self._mode = file_mode
+        if file_mode == "wb":
+            self._compressor = BlockCompressor(codec, level, block_size, pool)
+        else:
+            self._decompressor = BlockDecompressor(pool)
+            pool = self._decompressor.pool
+            self._read_ahead = read_ahead if read_ahead is not None else \
+                block_size * pool.max
+            self._data = bytearray()
+            self._eof = False
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def fileobj(self):
+        return self._file
+
+    def write(self, data):
+        self._file.write(self._compressor.compress(data))
+
+    def flush(self):
+        if self._mode == "wb":
+            self._file.write(self._compressor.flush())
+        self._file.flush()
+
+    def read(self, length=-1):
+        while not self._eof and (length < 0 or len(self._data) < length):
+            self._fill()
+        if length < 0:
+            length = len(self._data)
+        result = bytes(self._data[:length])
+        del self._data[:length]
+        return result
+
+    def readline(self):
+        while True:
+            pos = self._data.find(b"\n")
+            if pos >= 0 or self._eof:
+                break
+            self._fill()
+        length = pos + 1 if pos >= 0 else len(self._data)
+        return self.read(length)
+
+    def close(self):
+        if self._mode == "wb":
+            self.flush()
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def _fill(self):
+        data = self._file.read(self._read_ahead)
+        if not data:
+            self._eof = True
+            self._decompressor.flush()
+            return
+        self._data += self._decompressor.decompress(data)
+
+
+def compress(data, codec="gz", level=6, block_size=DEFAULT_BLOCK_SIZE,
+             pool=None):
+    """
+    Compresses the buffer in one shot.
+    :return: The block stream (bytes).
+    """
+    compressor = BlockCompressor(codec, level, block_size, pool)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data, pool=None):
+    """
+    Decompresses the whole block stream in one shot.
+    :return: The original bytes.
+    """
+    decompressor = BlockDecompressor(pool)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def block_index(fileobj):
+    """
+    Reads the frame headers of the block stream without decompressing the
+    blocks. The file object must be positioned at the stream's start.
+    :return: The codec name and the list of (offset of the compressed block,
+    compressed size, raw size) tuples.
+    """
+    start = fileobj.tell()
+    codec = BlockDecompressor._parse_header(fileobj.read(HEADER.size))
+    index = []
+    offset = start + HEADER.size
+    while True:
+        header = fileobj.read(FRAME.size)
+        if len(header) < FRAME.size:
+            break
+        size, raw_size = FRAME.unpack(header)
+        index.append((offset + FRAME.size, size, raw_size))
+        offset += FRAME.size + size
+        fileobj.seek(offset)
+    return codec, index
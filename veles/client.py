@@ -35,6 +35,7 @@ under the License.
 """
 
 import argparse
+from collections import deque
 from copy import copy
 import datetime
 import json
@@ -58,6 +59,7 @@ from veles.network_common import NetworkAgent, StringLineReceiver, IDLogger
 from veles.prng import get as get_rg
 from veles.thread_pool import errback
 from veles.timeit2 import timeit
+import veles.update_codec as update_codec
 
 
 class ZmqDealer(ZmqConnection):
@@ -82,6 +84,7 @@ class ZmqDealer(ZmqConnection):
         self.shmem = None
         self.pickles_compression = root.common.engine.network_compression \
             if not self.is_ipc else None
+        self.zero_copy = root.common.engine.network_zero_copy
         self._request_timings = {}
         self._command = None
         self._command_str = None
@@ -135,6 +138,14 @@ class ZmqDealer(ZmqConnection):
     def total_request_time(self):
         return sum((val[0] for val in self._request_timings.values()))
 
+    @property
+    def transfer_time(self):
+        """
+        Returns the average time spent on receiving a job and sending the
+        update.
+        """
+        return self.receive_timing + self.request_timings.get("update", 0)
+
     def request(self, command, message=b''):
         self.event("ZeroMQ", "begin", dir="send", command=command, height=0.5)
         if self.shmem is not None and command == 'update':
@@ -206,6 +217,9 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self.addr = addr
         self.host = host
         self._last_update = None
+        self._prefetched_jobs = deque()
+        self._prefetching = False
+        self._prefetch_postponed = False
         self.state = host.state
         self._current_deferred = None
         self._power_upload_time = 0
@@ -243,6 +257,11 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                                "but my ID is None")
                     self.request_id()
                     return
+                self.host.workflow.apply_update_encodings(
+                    msg.get("update_encodings"))
+                # The jobs which were in flight have been dropped by master
+                self._prefetched_jobs.clear()
+                self._prefetching = False
                 self.request_job()
                 return
             cid = msg.get("id")
@@ -266,6 +285,8 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             self.host.zmq_connection = self.zmq_connection = ZmqDealer(
                 cid, self, ZmqEndpoint("connect", endpoint))
             self.info("Connected to ZeroMQ endpoint %s", endpoint)
+            self.host.workflow.apply_update_encodings(
+                msg.get("update_encodings"))
             data = msg.get('data')
             if data is not None:
                 self._set_deferred(
@@ -276,6 +297,13 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self.disconnect("disconnect: invalid state %s", self.state.current)
 
     def job_received(self, job):
+        if self._prefetching:
+            self._prefetching = False
+            self._prefetch_received(job)
+            return
+        self._job_obtained(job)
+
+    def _job_obtained(self, job):
         if not job:
             # False, None or empty string mean job refusal
             self.info("Job was refused")
@@ -310,13 +338,59 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 self._power_upload_time = now
                 self.sendLine({
                     'cmd': 'change_power',
-                    'power': self.host.workflow.computing_power})
+                    'power': self.host.workflow.computing_power,
+                    'transfer_time': self.zmq_connection.transfer_time})
             # workflow.do_job may hang, so launch it in the thread pool
-            self._set_deferred(self.host.workflow.do_job, job, update,
-                               self.job_finished)
+            self._set_deferred(self._do_job, job, update, self.job_finished)
+            self._prefetch_job()
         except:
             errback(Failure())
 
+    def _prefetch_job(self):
+        """
+        Requests one more job while the current one is being done, so that
+        the next job is ready when this one is finished.
+        """
+        if self._prefetching or self._prefetch_postponed or \
+                self.state.current != "BUSY" or \
+                len(self._prefetched_jobs) + 1 >= self.host.prefetch_jobs:
+            return
+        if len(self._prefetched_jobs) > 0 and not self._prefetched_jobs[-1]:
+            # Master has refused to give more jobs
+            return
+        self.debug("Prefetching the job...")
+        self._prefetching = True
+        self.zmq_connection.request("job")
+
+    def _prefetch_received(self, job):
+        if job == b"NEED_UPDATE":
+            self.debug("Master returned NEED_UPDATE to the prefetch request")
+            self._prefetch_postponed = True
+            return
+        # The refusal is queued as well and handled in its turn
+        self._prefetched_jobs.append(job)
+        self._prefetch_job()
+
+    def _take_job(self):
+        """
+        Starts the next prefetched job or requests a new one.
+        """
+        self.state.request_job()
+        if len(self._prefetched_jobs) > 0:
+            self._job_obtained(self._prefetched_jobs.popleft())
+        elif self._prefetching:
+            # The prefetch request has not been answered yet, its reply
+            # will be the answer to this one
+            self._prefetching = False
+        else:
+            self.zmq_connection.request("job")
+
+    def _do_job(self, job, update, callback):
+        # The update sent with zero copy may refer to the arrays which the
+        # job is going to change
+        self.zmq_connection.wait_buffers_sent()
+        self.host.workflow.do_job(job, update, callback)
+
     def _set_deferred(self, f, *args, **kwargs):
         self._current_deferred = threads.deferToThreadPool(
             reactor, self.host.workflow.thread_pool,
@@ -337,11 +411,13 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self._last_update = update
         self.state.complete_job()
         if self.host.async:
-            self.request_job()
+            self._take_job()
         else:
             self.request_update()
 
     def update_result_received(self, result):
+        # Both results mean that master has decoded the update
+        self.host.workflow.acknowledge_update()
         if result == b'0':
             self.warning("Last update was rejected")
         else:
@@ -350,8 +426,11 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         if self.state.current == "END":
             self.host.launcher.stop()
             return
+        self._prefetch_postponed = False
         if not self.host.async or self.state.current == "POSTPONED":
-            self.request_job()
+            self._take_job()
+        else:
+            self._prefetch_job()
 
     def sendLine(self, line):
         if six.PY3:
@@ -370,7 +449,10 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 "argv": sys.argv,
                 "executable": sys.executable,
                 "PYTHONPATH": os.getenv("PYTHONPATH"),
-                "cwd": os.getcwd()}
+                "cwd": os.getcwd(),
+                "update_encodings": update_codec.CODECS,
+                "prefetch_jobs": self.host.prefetch_jobs,
+                "shared_memory": True}
 
     def send_id(self):
         common = self._common_id()
@@ -414,6 +496,10 @@ class Client(NetworkAgent, ReconnectingClientFactory):
         parser = Client.init_parser()
         args, _ = parser.parse_known_args(self.argv)
         self._async = args.async_slave
+        self._prefetch_jobs = args.prefetch_jobs
+        if self._prefetch_jobs < 1:
+            raise ValueError("--prefetch-jobs must be positive (got %d)" %
+                             self._prefetch_jobs)
         self._death_probability = args.slave_death_probability
         self._initial_data = None
         self.id = None
@@ -435,6 +521,13 @@ class Client(NetworkAgent, ReconnectingClientFactory):
                             help="Activate asynchronous master-slave protocol "
                             "(influences slaves only).", action='store_true') \
             .mode = ("master", "slave")
+        parser.add_argument("--prefetch-jobs", type=int,
+                            default=kwargs.get("prefetch_jobs", 1),
+                            help="The number of jobs each slave holds at "
+                            "once: the next jobs are requested while the "
+                            "current one is being done (1 means no "
+                            "prefetching).") \
+            .mode = ("slave",)
         parser.add_argument("--slave-death-probability", type=float,
                             default=0.0,
                             help="Each slave will die with the probability "
@@ -450,6 +543,10 @@ class Client(NetworkAgent, ReconnectingClientFactory):
     def async(self):
         return self._async
 
+    @property
+    def prefetch_jobs(self):
+        return self._prefetch_jobs
+
     @property
     def death_probability(self):
         return self._death_probability
@@ -202,6 +202,12 @@ root.common.update({
     "warnings": {
         "numba": True
     },
+    "profiling": {
+        # Record the unit calls with veles.profiler (see also --profile)
+        "enabled": False,
+        # The maximal number of the recorded events, older are overwritten
+        "capacity": 1 << 18,
+    },
     "exceptions": {
         "run_after_stop": False,
     },
@@ -262,6 +268,15 @@ root.common.update({
         "network_compression": (None if  # snappy is slow on CPython
                                 platform.python_implementation() == "CPython"
                                 else "snappy"),
+        # Send numpy arrays in jobs and updates as raw ZeroMQ frames
+        "network_zero_copy": False,
+        # The maximal time in seconds the master waits for the arrays sent
+        # with zero copy before it applies updates; the slaves which are too
+        # slow to receive them get the copies afterwards
+        "network_zero_copy_timeout": 1.0,
+        # Run the chains of the units with single links in a tight loop
+        # after the workflow is initialized, see Unit.compile_plan()
+        "inline_run": False,
         "source_dirs": (os.environ.get("VELES_ENGINE_DIRS", "").split(":") +
                         ["/usr/share/veles"]),
         "device_dirs": ["/usr/share/veles/devices",
@@ -276,6 +291,15 @@ root.common.update({
             "nvcc": "nvcc"
         }
     },
+    "loader": {
+        # The maximal size of decompressed chunks kept by MinibatchesLoader
+        "minibatches_cache_size": 256 * 1024 * 1024,
+        # Reuse the normalization analysis results of the unchanged datasets
+        "analysis_cache": True,
+        # Keep the data of FullBatchLoader-s in memory mapped files under
+        # dirs.cache and reuse them while the dataset does not change
+        "memmap_originals": False,
+    },
     "genetics": {
         "disable": {
             "plotting": True
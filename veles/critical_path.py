@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 20, 2015
+
+Critical path and parallelism analysis of the workflow's control flow graph
+based on the run times recorded by veles.profiler.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from collections import defaultdict, OrderedDict
+import datetime
+
+from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
+from veles.profiler import profiler
+from veles.units import Container, Unit
+
+
+class ParallelismAnalysis(Logger):
+    """
+    Analyzes the control flow graph of the workflow weighted with the run
+    times of the units. The loops are broken at the links which lead back
+    during the depth first traversal from the workflow's start point, so the
+    graph describes a single iteration. Each unit's weight is its total run
+    time divided by the number of iterations, which is the number of times
+    the most frequently running unit was run.
+
+    Attributes:
+        critical_path: the units on the longest path through the graph.
+        span: the time of the critical path per iteration, in seconds.
+        work: the sum of the weights of all the units, in seconds.
+        speedup_bound: work / span, the maximal speedup over the sequential
+            execution regardless of the number of threads.
+        threads: thread name -> (busy time, idle time) in seconds. A thread is
+            idle when it does not run any unit during the profiled interval.
+        costly_dispatches: the list of (source unit, destination unit, mean
+            dispatch time, mean run time) for the links which run_dependent()
+            dispatches to the thread pool while the dispatch takes longer
+            than the destination's run().
+    """
+
+    def __init__(self, workflow, events=None):
+        super(ParallelismAnalysis, self).__init__()
+        self.workflow = workflow
+        if events is None:
+            events = profiler.events
+        units = {u.id: u for u in workflow if not isinstance(u, Container)}
+        runs = defaultdict(list)
+        dispatches = defaultdict(list)
+        self._intervals = defaultdict(list)
+        for event in events:
+            unit = units.get(event.unit_id)
+            if unit is None:
+                continue
+            if event.category == "dispatch":
+                dispatches[unit].append(event.end - event.start)
+            elif event.name == "run":
+                runs[unit].append(event.end - event.start)
+                self._intervals[event.thread_name].append(
+                    (event.start, event.end))
+        iterations = max(len(times) for times in runs.values()) \
+            if len(runs) > 0 else 1
+        self.weights = {u: sum(times) / iterations
+                        for u, times in runs.items()}
+        self.run_times = {u: sum(times) / len(times)
+                          for u, times in runs.items()}
+        self.dispatch_times = {u: sum(times) / len(times)
+                               for u, times in dispatches.items()}
+        self.links = self._forward_links(workflow.start_point)
+        self.critical_path, self.span = self._find_critical_path()
+        self.work = sum(self.weights.get(u, 0) for u in self.links)
+        self.threads = self._measure_threads()
+        self.costly_dispatches = self._find_costly_dispatches()
+
+    @property
+    def speedup_bound(self):
+        return self.work / self.span if self.span > 0 else 1.0
+
+    def print_report(self, top_number=5):
+        table = PrettyTable("#", "unit", "time")
+        table.align["unit"] = "l"
+        for index, unit in enumerate(self.critical_path):
+            table.add_row(index + 1, unit.name, self._timedelta(
+                self.weights.get(unit, 0)))
+        self.info("Critical path (%s per iteration, work %s, speedup bound "
+                  "%.2f):\n%s", self._timedelta(self.span),
+                  self._timedelta(self.work), self.speedup_bound, table)
+        if len(self.threads) > 0:
+            table = PrettyTable("thread", "busy", "idle", "idle,%")
+            table.align["thread"] = "l"
+            for name, (busy, idle) in sorted(self.threads.items()):
+                table.add_row(name, self._timedelta(busy),
+                              self._timedelta(idle),
+                              int(idle * 100 / ((busy + idle) or 1)))
+            self.info("Thread utilization:\n%s", table)
+        if len(self.costly_dispatches) > 0:
+            table = PrettyTable("link", "dispatch", "run")
+            table.align["link"] = "l"
+            for src, dst, dispatch, run in \
+                    self.costly_dispatches[:top_number]:
+                table.add_row("%s -> %s" % (src.name, dst.name),
+                              self._timedelta(dispatch),
+                              self._timedelta(run))
+            self.info("The thread pool dispatch takes longer than the work "
+                      "on these links:\n%s", table)
+
+    @staticmethod
+    def _forward_links(start_point):
+        """
+        Walks the graph depth first and drops the links to the units which
+        are being visited, that is, the loops.
+        :return: unit -> list of the destination units, in topological order.
+        """
+        links = {}
+        order = []
+        active = set()
+        stack = [(start_point, iter(start_point.links_to_sorted))]
+        links[start_point] = []
+        active.add(start_point)
+        while len(stack) > 0:
+            unit, children = stack[-1]
+            for child in children:
+                if child in active:
+                    continue
+                links[unit].append(child)
+                if child not in links:
+                    links[child] = []
+                    active.add(child)
+                    stack.append((child, iter(child.links_to_sorted)))
+                break
+            else:
+                stack.pop()
+                active.remove(unit)
+                order.append(unit)
+        return OrderedDict((u, links[u]) for u in reversed(order))
+
+    def _find_critical_path(self):
+        finish = {}
+        previous = {}
+        for unit in self.links:
+            # finish[unit] is the latest finish of the unit's sources here
+            finish.setdefault(unit, 0)
+            finish[unit] += self.weights.get(unit, 0)
+            for child in self.links[unit]:
+                if finish[unit] > finish.get(child, -1):
+                    finish[child] = finish[unit]
+                    previous[child] = unit
+        if len(finish) == 0:
+            return [], 0
+        last = None
+        for unit in self.links:
+            # Ties are resolved in favor of the later units, e.g. end_point
+            if last is None or finish[unit] >= finish[last]:
+                last = unit
+        span = finish[last]
+        path = [last]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return path, span
+
+    def _measure_threads(self):
+        intervals = self._intervals
+        if len(intervals) == 0:
+            return {}
+        start = min(s for times in intervals.values() for s, _ in times)
+        end = max(e for times in intervals.values() for _, e in times)
+        threads = {}
+        for name, times in intervals.items():
+            busy = 0
+            last = start
+            for s, e in sorted(times):
+                s = max(s, last)
+                if e > s:
+                    busy += e - s
+                    last = e
+            threads[name] = busy, end - start - busy
+        return threads
+
+    def _find_costly_dispatches(self):
+        result = []
+        for src in self.links:
+            if len(src.links_to) < 2:
+                # run_dependent() calls the only destination directly
+                continue
+            for dst in Unit._sorted_links(src.links_to):
+                dispatch = self.dispatch_times.get(dst)
+                run = self.run_times.get(dst)
+                if dispatch is not None and run is not None and \
+                        dispatch > run:
+                    result.append((src, dst, dispatch, run))
+        result.sort(key=lambda r: r[3] - r[2])
+        return result
+
+    @staticmethod
+    def _timedelta(seconds):
+        return datetime.timedelta(seconds=seconds)
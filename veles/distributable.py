@@ -222,6 +222,14 @@ class Distributable(Pickleable):
 class IDistributable(Interface):
     """Classes which provide this interface can be used in distributed
     computation environments.
+
+    The implementations may also define merge_data_from_slaves(data) which
+    combines the updates from several slaves into one, e.g., sums the
+    gradients. data is the list of the values returned by
+    generate_data_for_master() on the slaves in arrival order; the result is
+    passed to apply_data_from_slave() with slave set to None. Master then
+    applies the pending updates in one pass (see
+    Workflow.apply_data_from_slaves()).
     """
 
     negotiates_on_connect = Attribute(
@@ -75,6 +75,11 @@ class ZmqSubscriber(ZmqConnection):
         self.graphics = graphics
 
     def messageReceived(self, message):
+        if len(message) > 1:
+            plotter_id, data = message[1]
+            self.graphics.debug("Received the plot data of %s", plotter_id)
+            self.graphics.update_plot_data(plotter_id, data)
+            return
         self.graphics.debug("Received %d bytes", len(message[0]))
         raw_data = snappy.decompress(message[0][len('graphics'):])
         obj = pickle.loads(raw_data)
@@ -104,6 +109,8 @@ class GraphicsClient(Logger):
         self.webagg_fifo = webagg_fifo
         self._gc_counter = 0
         self._balance = defaultdict(int)
+        self._plotters = {}
+        self._keyframes = {}
         self._dump_dir = kwargs.get("dump_dir")
         self._pdf_lock = threading.Lock()
         self._pdf_trigger = False
@@ -200,7 +207,9 @@ class GraphicsClient(Logger):
         """Processes one plotting event.
         """
         if plotter is not None:
+            self._plotters[plotter.id] = plotter
             if self._dump_dir:
+                self._keyframes[plotter.id] = raw_data
                 file_name = os.path.join(self._dump_dir, "%s_%s.pickle" % (
                     plotter.name.replace(" ", "_"),
                     datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')))
@@ -251,6 +260,22 @@ class GraphicsClient(Logger):
             self.debug("Received the command to terminate")
             self.shutdown()
 
+    def update_plot_data(self, plotter_id, data):
+        """Applies the plot data to the last received plotter and redraws it.
+        """
+        plotter = self._plotters.get(plotter_id)
+        if plotter is None:
+            self.debug("Skipped the plot data of %s: the plotter has not been "
+                       "received yet", plotter_id)
+            return
+        plotter.apply_plot_data(data)
+        raw_data = None
+        if self._dump_dir:
+            dumped = pickle.loads(self._keyframes[plotter_id])
+            dumped.apply_plot_data(data)
+            raw_data = pickle.dumps(dumped)
+        self.update(plotter, raw_data)
+
     def show_figure(self, figure):
         if self.pp.get_backend() != "WebAgg":
             figure.show()
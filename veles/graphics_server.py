@@ -36,6 +36,7 @@ under the License.
 
 
 import argparse
+from collections import OrderedDict
 import errno
 from fcntl import fcntl, F_GETFL, F_SETFL
 from io import UnsupportedOperation
@@ -68,16 +69,39 @@ class ZmqPublisher(ZmqConnection):
     def send(self, message):
         super(ZmqPublisher, self).send(b'graphics' + message)
 
+    def send_plot_data(self, plotter_id, data):
+        """
+        Sends the plot data in two or more frames, so that the subscribers
+        can tell it from the whole plotters. The numpy arrays are sent as
+        raw frames.
+        """
+        super(ZmqPublisher, self).send(b'graphics', (plotter_id, data),
+                                       zero_copy=True)
+
 
 @six.add_metaclass(CommandLineArgumentsRegistry)
 class GraphicsServer(Logger):
     """
     Graphics server which uses ZeroMQ PUB socket to publish updates.
+
+    The updates are sent by the background thread. The pending updates of
+    the same plotter are coalesced: only the latest one is sent. If more than
+    max_pending updates are waiting, the oldest plot data is dropped, so that
+    plotting never slows down the workflow. The whole plotters are never
+    dropped since the plot data is applied to the last received plotter;
+    there is at most one of them pending per plotter.
+
+    Attributes:
+        sent: the number of the sent updates.
+        coalesced: the number of the updates replaced by the newer ones.
+        dropped: the number of the updates dropped due to backpressure.
     """
 
     class InitializationError(Exception):
         pass
 
+    max_pending = 16
+
     _instance = None
     _pair_fds = {}
 
@@ -120,6 +144,14 @@ class GraphicsServer(Logger):
         self._shutdown_ = self.shutdown
         thread_pool.register_on_shutdown(self._shutdown_)
 
+        self.sent = self.coalesced = self.dropped = 0
+        self._pending = OrderedDict()
+        self._pending_condition = threading.Condition()
+        self._sender = threading.Thread(target=self._send_loop,
+                                        name="graphics sender")
+        self._sender.daemon = True
+        self._sender.start()
+
         # tmpfn, *ports = self.zmq_connection.rnd_vals
         tmpfn = self.zmq_connection.rnd_vals[0]
         ports = self.zmq_connection.rnd_vals[1:]
@@ -151,25 +183,82 @@ class GraphicsServer(Logger):
         return parser
 
     def enqueue(self, obj):
+        """
+        Pickles the object (the plotter or None to terminate the clients)
+        and schedules sending it. It supersedes the pending plot data of the
+        same plotter.
+        """
         data = pickle.dumps(obj)
         if getattr(self, "_debug_pickle", False):
             import objgraph
             restored = pickle.loads(data)
             objgraph.show_refs(restored, too_many=40)
-        data = snappy.compress(data)
-        self.debug("Broadcasting %d bytes" % len(data))
-        zmq_connection = getattr(self, "zmq_connection")
-        if zmq_connection is not None:
-            zmq_connection.send(data)
+        if obj is None:
+            self._post(None, data)
+            return
+        with self._pending_condition:
+            if self._pending.pop((obj.id, "data"), None) is not None:
+                self.coalesced += 1
+        self._post((obj.id, "object"), data)
+
+    def enqueue_plot_data(self, plotter_id, data):
+        """
+        Schedules sending the plot data (see Plotter.get_plot_data()). The
+        values must not change after this call.
+        """
+        self._post((plotter_id, "data"), data)
 
     def shutdown(self):
         self.debug("Shutting down")
         if hasattr(self, "fifo_shutting_down"):
             self.fifo_shutting_down = True
         self.enqueue(None)
+        if self._sender.is_alive():
+            self._sender.join()
+        self.debug("Sent %d updates, coalesced %d, dropped %d",
+                   self.sent, self.coalesced, self.dropped)
         if hasattr(self, "fifo_thread") and self.fifo_thread.is_alive():
             self.fifo_thread.join()
 
+    def _post(self, key, payload):
+        with self._pending_condition:
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+            self._pending[key] = payload
+            if len(self._pending) > self.max_pending:
+                stale = next((k for k in self._pending
+                              if k is not None and k[1] == "data"), None)
+                if stale is not None:
+                    del self._pending[stale]
+                    self.dropped += 1
+            self._pending_condition.notify()
+
+    def _send_loop(self):
+        while True:
+            with self._pending_condition:
+                while len(self._pending) == 0:
+                    self._pending_condition.wait()
+                key, payload = self._pending.popitem(last=False)
+            try:
+                self._send(key, payload)
+            except Exception:
+                self.exception("Failed to send the update of %s", key)
+            if key is None:
+                break
+
+    def _send(self, key, payload):
+        zmq_connection = getattr(self, "zmq_connection")
+        if zmq_connection is None:
+            return
+        if key is not None and key[1] == "data":
+            self.debug("Broadcasting the plot data of %s", key[0])
+            zmq_connection.send_plot_data(key[0], payload)
+        else:
+            data = snappy.compress(payload)
+            self.debug("Broadcasting %d bytes" % len(data))
+            zmq_connection.send(data)
+        self.sent += 1
+
     @staticmethod
     def launch(thread_pool, backend, webagg_callback=None, only_server=False):
         server = GraphicsServer(thread_pool)
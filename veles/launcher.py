@@ -66,6 +66,7 @@ from veles.compat import from_none
 from veles.config import root
 import veles.graphics_server as graphics_server
 from veles.plotter import Plotter
+from veles.profiler import profiler
 import veles.logger as logger
 from veles.server import Server as MasterManager
 from veles.thread_pool import ThreadPool
@@ -143,6 +144,9 @@ class Launcher(logger.Logger):
             logger.Logger.redirect_all_logging_to_file(log_file)
 
         self._result_file = self.args.result_file
+        if self.args.profile or self.args.critical_path or \
+                root.common.profiling.enabled:
+            profiler.enable()
 
         self.info("My Python is %s %s", platform.python_implementation(),
                   platform.python_version())
@@ -260,6 +264,17 @@ class Launcher(logger.Logger):
                             help="Transformation of the slave remote launch "
                             "command given over ssh (%%s corresponds to the "
                             "original command).").mode = ("master",)
+        parser.add_argument("--profile", default=kwargs.get("profile", ""),
+                            help="Record the unit calls and write them to "
+                                 "this file in Chrome trace event format or "
+                                 "in speedscope format if the name ends with "
+                                 "\".speedscope.json\".")
+        parser.add_argument("--critical-path", default=False,
+                            action="store_true",
+                            help="Record the unit calls and print the "
+                                 "critical path of the workflow, the thread "
+                                 "utilization and the links which are not "
+                                 "worth dispatching to the thread pool.")
         parser.add_argument("--result-file",
                             help="The path where to store the execution "
                                  "results (in JSON format).").mode = \
@@ -778,6 +793,10 @@ class Launcher(logger.Logger):
 
     def _print_stats(self):
         self.workflow.print_stats()
+        if self.args.critical_path:
+            self.workflow.analyze_parallelism().print_report()
+        if self.args.profile:
+            profiler.export(self.args.profile)
         if self.agent is not None:
             self.agent.print_stats()
         if self.start_time is not None:
@@ -39,8 +39,10 @@ from __future__ import division
 import argparse
 from collections import defaultdict
 from copy import copy
+import hashlib
 import logging
 import marshal
+import os
 import time
 import types
 
@@ -64,6 +66,8 @@ import veles.memory as memory
 from veles.mutable import Bool
 import veles.normalization as normalization
 from veles.opencl_types import dtypes
+from veles.pickle2 import pickle, best_protocol
+from veles.loader.prefetch import MinibatchPrefetcher
 import veles.prng as random_generator
 from veles.result_provider import IResultProvider
 from veles.units import Unit, IUnit, nothing
@@ -142,10 +146,16 @@ class Loader(Unit):
         global_offset: first sample index which was not served during the
                        current epoch.
         minibatch_size: current minibatch size <= max_minibatch_size.
+        prefetch: the number of minibatches which are filled in advance by
+                  the background workers (0 disables prefetching).
+        prefetch_workers: the number of threads which fill the prefetched
+                          minibatches.
     """
 
     LABEL_DTYPE = numpy.int32
     INDEX_DTYPE = numpy.int32
+    PREFETCHED_ARRAYS = "minibatch_data", "minibatch_labels", \
+        "minibatch_indices"
     exports = "epoch_ended", "epoch_number", "train_ended", "class_lengths", \
         "minibatch_data", "minibatch_class", "minibatch_data", "has_labels", \
         "minibatch_labels", "minibatch_size", "max_minibatch_size", \
@@ -201,12 +211,21 @@ class Loader(Unit):
         self.normalization_parameters = kwargs.get(
             "normalization_parameters", {})
         self.train_ratio = kwargs.get("train_ratio", self.train_ratio)
+        self.prefetch = kwargs.get("prefetch", 0)
+        self.prefetch_workers = kwargs.get("prefetch_workers", 1)
+        self.analysis_workers = kwargs.get("analysis_workers", 1)
+        self.analysis_checkpoint = kwargs.get("analysis_checkpoint")
+        self.analysis_checkpoint_interval = kwargs.get(
+            "analysis_checkpoint_interval", 100)
+        self.analysis_cache = kwargs.get(
+            "analysis_cache", config.root.common.loader.analysis_cache)
 
     def init_unpickled(self):
         super(Loader, self).init_unpickled()
         self._minibatch_offset_ = 0
         self._minibatch_size_ = 0
         self.pending_minibatches_ = defaultdict(list)
+        self._prefetcher_ = None
         self._minibatch_serve_timestamp_ = time.time()
         self.initialize = self._with_initialized_callback(self.initialize)
         parser = Loader.init_parser()
@@ -222,6 +241,10 @@ class Loader(Unit):
                 state["failed_minibatches"].extend(pmb)
         else:
             state["failed_minibatches"] = []
+        if self.prefetcher is not None:
+            # Prefetched minibatches have already advanced global_offset
+            state["failed_minibatches"].extend(
+                reversed(self.prefetcher.pending_minibatches))
         oni = self._on_initialized
         if oni == nothing:
             state["_on_initialized"] = None
@@ -417,6 +440,188 @@ class Loader(Unit):
     def pending_minibatches_count(self):
         return sum(len(v) for v in self.pending_minibatches_.values())
 
+    @property
+    def prefetch(self):
+        return getattr(self, "_prefetch", 0)
+
+    @prefetch.setter
+    def prefetch(self, value):
+        if not isinstance(value, int):
+            raise TypeError("prefetch must be an integer (got %s)" %
+                            type(value))
+        if value < 0:
+            raise ValueError("prefetch must be greater than or equal to 0 "
+                             "(got %d)" % value)
+        self._prefetch = value
+
+    @property
+    def prefetch_workers(self):
+        return getattr(self, "_prefetch_workers", 1)
+
+    @prefetch_workers.setter
+    def prefetch_workers(self, value):
+        if not isinstance(value, int):
+            raise TypeError("prefetch_workers must be an integer (got %s)" %
+                            type(value))
+        if value < 1:
+            raise ValueError("prefetch_workers must be greater than 0 (got "
+                             "%d)" % value)
+        self._prefetch_workers = value
+
+    @property
+    def analysis_workers(self):
+        """
+        The number of threads which run the normalization analysis of
+        separate shards of the train set in analyze_dataset().
+        """
+        return getattr(self, "_analysis_workers", 1)
+
+    @analysis_workers.setter
+    def analysis_workers(self, value):
+        if not isinstance(value, int):
+            raise TypeError("analysis_workers must be an integer (got %s)" %
+                            type(value))
+        if value < 1:
+            raise ValueError("analysis_workers must be greater than 0 (got "
+                             "%d)" % value)
+        self._analysis_workers = value
+
+    @property
+    def analysis_checkpoint(self):
+        """
+        The path to the file where the intermediate normalization analysis
+        results are periodically saved, so that the interrupted analysis is
+        resumed from the last checkpoint. None disables checkpointing.
+        """
+        return getattr(self, "_analysis_checkpoint", None)
+
+    @analysis_checkpoint.setter
+    def analysis_checkpoint(self, value):
+        if value is not None and not isinstance(value, six.string_types):
+            raise TypeError("analysis_checkpoint must be a string (got %s)" %
+                            type(value))
+        self._analysis_checkpoint = value
+
+    @property
+    def analysis_checkpoint_interval(self):
+        return getattr(self, "_analysis_checkpoint_interval", 100)
+
+    @analysis_checkpoint_interval.setter
+    def analysis_checkpoint_interval(self, value):
+        if not isinstance(value, int):
+            raise TypeError("analysis_checkpoint_interval must be an integer "
+                            "(got %s)" % type(value))
+        if value < 1:
+            raise ValueError("analysis_checkpoint_interval must be greater "
+                             "than 0 (got %d)" % value)
+        self._analysis_checkpoint_interval = value
+
+    @property
+    def analysis_cache(self):
+        """
+        Indicates whether the results of analyze_dataset() are saved to and
+        loaded from the cache directory, see dataset_fingerprint.
+        """
+        return getattr(self, "_analysis_cache", False)
+
+    @analysis_cache.setter
+    def analysis_cache(self, value):
+        if not isinstance(value, bool):
+            raise TypeError("analysis_cache must be a boolean (got %s)" %
+                            type(value))
+        self._analysis_cache = value
+
+    @property
+    def dataset_files(self):
+        """
+        :return: The files the dataset is loaded from. Empty if unknown, in
+                 which case the analysis results are never cached.
+        """
+        return tuple()
+
+    @property
+    def dataset_parameters(self):
+        """
+        :return: Picklable settings which change the loaded data besides the
+                 dataset files, e.g. the image preprocessing. They are mixed
+                 into dataset_fingerprint.
+        """
+        return tuple()
+
+    @property
+    def dataset_fingerprint(self):
+        """
+        Cheap hash of the dataset which changes if any of the dataset files
+        is modified, the normalization settings change or the loader is
+        different. None if dataset_files is empty.
+        """
+        return self._hash_dataset(tuple(self.class_lengths))
+
+    def _hash_dataset(self, *parameters):
+        """
+        Calculates dataset_fingerprint with the specified picklable
+        parameters instead of class_lengths.
+        """
+        files = [f for f in self.dataset_files if f]
+        if len(files) == 0:
+            return None
+        hasher = hashlib.sha1()
+        hasher.update(("%s.%s" % (type(self).__module__,
+                                  type(self).__name__)).encode("utf-8"))
+        for path in sorted(os.path.abspath(f) for f in files):
+            stat = os.stat(path)
+            hasher.update(("%s:%d:%d" % (path, stat.st_size, int(
+                stat.st_mtime * 1000))).encode("utf-8"))
+        hasher.update(pickle.dumps((
+            self.normalization_type,
+            sorted(self.normalization_parameters.items())) + parameters +
+            (self.dataset_parameters,), protocol=2))
+        return hasher.hexdigest()
+
+    @property
+    def analysis_cache_path(self):
+        """
+        :return: The path to the cached analysis results of this dataset or
+                 None if it cannot be cached.
+        """
+        if not self.analysis_cache:
+            return None
+        fingerprint = self.dataset_fingerprint
+        if fingerprint is None:
+            return None
+        return os.path.join(config.root.common.dirs.cache, "analysis",
+                            fingerprint + ".pickle")
+
+    @property
+    def fills_randomly(self):
+        """
+        :return: True if fill_minibatch() draws from prng. Such loaders are
+        not prefetched since the draws would depend on the order in which
+        the workers run.
+        """
+        return False
+
+    @property
+    def prefetcher(self):
+        """
+        :return: :class:`veles.loader.prefetch.MinibatchPrefetcher` instance
+        if prefetching is active; otherwise, None.
+        """
+        return self._prefetcher_
+
+    @property
+    def prefetched_arrays(self):
+        """
+        :return: The names of the minibatch arrays which are filled by
+        fill_minibatch() (see PREFETCHED_ARRAYS in the class hierarchy).
+        """
+        names = []
+        for klass in reversed(type(self).__mro__):
+            for name in klass.__dict__.get("PREFETCHED_ARRAYS", tuple()):
+                if name not in names:
+                    names.append(name)
+        return names
+
     @property
     def minibatch_class(self):
         return self._minibatch_class
@@ -577,7 +782,8 @@ class Loader(Unit):
         except AttributeError:
             pass
         try:
-            self.load_data()
+            if not self.restore_data():
+                self.load_data()
         except AttributeError as e:
             self.exception("Failed to load the data")
             raise from_none(e)
@@ -614,15 +820,29 @@ class Loader(Unit):
         self.analyze_dataset()
         if not self.restored_from_snapshot:
             self.shuffle()
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+            self._prefetcher_ = None
 
     def run(self):
         """Prepares the minibatch.
         """
         if None in self.pending_minibatches_:
             del self.pending_minibatches_[None]
-        self.serve_next_minibatch(None)
+        if self.prefetch > 0 and self.prefetcher is None:
+            self._setup_prefetcher()
+        if self.prefetcher is not None:
+            self.prefetcher.serve()
+        else:
+            self.serve_next_minibatch(None)
         self._on_successful_serve()
 
+    def stop(self):
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+            self._prefetcher_ = None
+        super(Loader, self).stop()
+
     def generate_data_for_master(self):
         return True
 
@@ -664,10 +884,12 @@ class Loader(Unit):
         if slave is None:
             # Partial update
             return
+        # The slave may have several jobs in flight (see --prefetch-jobs),
+        # the updates come in the same order as the jobs were sent
         try:
             self.minibatch_offset, self.minibatch_size = \
-                self.pending_minibatches_[slave.id].pop()
-        except KeyError:
+                self.pending_minibatches_[slave.id].pop(0)
+        except (KeyError, IndexError):
             raise error.Bug("pending_minibatches_ does not contain %s" %
                             slave.id)
         self._on_successful_serve()
@@ -686,21 +908,43 @@ class Loader(Unit):
 
     def get_metric_names(self):
         if not self.testing:
-            return {"Total epochs"}
-        if self.has_labels:
-            return {"Labels"}
-        return set()
+            names = {"Total epochs"}
+        elif self.has_labels:
+            names = {"Labels"}
+        else:
+            names = set()
+        if self.prefetcher is not None:
+            names.update(("Prefetch queue depth", "Prefetch stall time"))
+        return names
 
     def get_metric_values(self):
         if not self.testing:
-            return {"Total epochs": self.epoch_number}
-        if self.has_labels:
-            return {"Labels": self.reversed_labels_mapping}
-        return {}
+            values = {"Total epochs": self.epoch_number}
+        elif self.has_labels:
+            values = {"Labels": self.reversed_labels_mapping}
+        else:
+            values = {}
+        if self.prefetcher is not None:
+            values["Prefetch queue depth"] = self.prefetcher.average_depth
+            values["Prefetch stall time"] = self.prefetcher.stall_time
+        return values
+
+    def restore_data(self):
+        """
+        Restores the data which was loaded by a previous run instead of
+        calling load_data().
+        :return: True if the data was restored; otherwise, False.
+        """
+        return False
 
     def reset_normalization(self):
         self.normalizer.reset()
 
+    def _init_shuffled_indices(self):
+        if self.shuffled_indices.mem is None:
+            self.shuffled_indices.mem = numpy.arange(
+                self.total_samples, dtype=Loader.INDEX_DTYPE)
+
     def on_before_create_minibatch_data(self):
         self.minibatch_data.reset()
         self.minibatch_labels.reset()
@@ -709,9 +953,7 @@ class Loader(Unit):
     def shuffle(self):
         """Randomly shuffles the TRAIN dataset.
         """
-        if self.shuffled_indices.mem is None:
-            self.shuffled_indices.mem = numpy.arange(
-                self.total_samples, dtype=Loader.INDEX_DTYPE)
+        self._init_shuffled_indices()
         if self.shuffle_limit <= 0 or self.class_lengths[TRAIN] == 0:
             return
         self.shuffle_limit -= 1
@@ -740,10 +982,16 @@ class Loader(Unit):
         if self.is_master:
             return
 
+        self.prepare_minibatch()
+
+    def prepare_minibatch(self):
+        """Fills, normalizes and pads the current minibatch on CPU.
+        """
         self.fill_minibatch()
         self.normalize_minibatch()
         self.map_minibatch_labels()
 
+        minibatch_size = self.minibatch_size
         if minibatch_size < self.max_minibatch_size:
             self.minibatch_data[minibatch_size:] = 0.0
             if self.has_labels:
@@ -751,6 +999,17 @@ class Loader(Unit):
             self.minibatch_indices[minibatch_size:] = -1
 
     def analyze_dataset(self):
+        if self.class_lengths[TRAIN] == 0 or not self.analysis_cache:
+            self._analyze_dataset()
+            return
+        path = self.analysis_cache_path
+        if path is not None and self._load_analysis_cache(path):
+            return
+        self._analyze_dataset()
+        if path is not None:
+            self._save_analysis_cache(path)
+
+    def _analyze_dataset(self):
         if self.class_lengths[TRAIN] == 0:
             assert self.normalizer.is_initialized, \
                 "There are no train samples and the normalizer has not been " \
@@ -771,14 +1030,9 @@ class Loader(Unit):
         self.info("Performing \"%s\" normalization analysis...",
                   type(self.normalizer).MAPPING)
         train_different_labels = defaultdict(int)
-
-        def callback():
-            if self.has_labels and len(self.labels_mapping) == 0:
-                for lbl in self.raw_minibatch_labels:
-                    train_different_labels[lbl] += 1
-            self.normalizer.analyze(self.minibatch_data[:self.minibatch_size])
-
-        self._iterate_class(TRAIN, callback)
+        start = self._load_analysis_checkpoint(train_different_labels)
+        self._analyze_train(self.normalizer, train_different_labels, start)
+        self._remove_analysis_checkpoint()
 
         if not self.has_labels or (len(self.labels_mapping) > 0 and
                                    len(self._samples_mapping) > 0):
@@ -786,7 +1040,7 @@ class Loader(Unit):
 
         other_different_labels = defaultdict(int), defaultdict(int)
 
-        for index, diff_labels in other_different_labels:
+        for index, diff_labels in enumerate(other_different_labels):
             def other_callback():
                 for sind, lbl in zip(self.minibatch_indices,
                                      self.raw_minibatch_labels):
@@ -799,6 +1053,153 @@ class Loader(Unit):
             self._setup_labels_mapping(
                 other_different_labels + (train_different_labels,))
 
+    def _save_analysis_cache(self, path):
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp_name = path + ".tmp"
+        with open(tmp_name, "wb") as fout:
+            pickle.dump({
+                "class_lengths": tuple(self.class_lengths),
+                "normalizer": self.normalizer.state,
+                "labels_mapping": dict(self.labels_mapping),
+                "reversed_labels_mapping": list(self.reversed_labels_mapping),
+                "samples_mapping": dict(self._samples_mapping),
+                "unique_labels_count": self._unique_labels_count,
+                "diff_labels": tuple(getattr(self, a, None) for a in (
+                    "test_diff_labels", "valid_diff_labels",
+                    "train_diff_labels"))
+            }, fout, protocol=best_protocol)
+        os.rename(tmp_name, path)
+        self.debug("Saved the dataset analysis results to %s", path)
+
+    def _load_analysis_cache(self, path):
+        """
+        :return: True if the analysis results were restored from the cache;
+                 otherwise, False.
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "rb") as fin:
+                cache = pickle.load(fin)
+        except Exception as e:
+            self.warning("Failed to read the cached analysis results %s: %s",
+                         path, e)
+            return False
+        if cache["class_lengths"] != tuple(self.class_lengths):
+            return False
+        self.normalizer.state = cache["normalizer"]
+        if self.has_labels:
+            self.labels_mapping.clear()
+            self.labels_mapping.update(cache["labels_mapping"])
+            self._reversed_labels_mapping[:] = \
+                cache["reversed_labels_mapping"]
+            self._samples_mapping.clear()
+            self._samples_mapping.update(cache["samples_mapping"])
+            self._unique_labels_count = cache["unique_labels_count"]
+            diff_labels = cache["diff_labels"]
+            if diff_labels[TRAIN] is not None:
+                self.test_diff_labels, self.valid_diff_labels, \
+                    self.train_diff_labels = diff_labels
+                self._print_label_stats(self.train_diff_labels,
+                                        CLASS_NAME[TRAIN])
+        self.info("Skipped the dataset analysis: restored the cached results "
+                  "from %s", path)
+        return True
+
+    def analyze_shard(self, shard, shards):
+        """Performs the normalization analysis of every shards-th train
+        minibatch starting from shard with a partial copy of the normalizer.
+        Thus the analysis of a huge dataset can be distributed among several
+        processes or slaves.
+
+        :param shard: The index of the shard.
+        :param shards: The total number of shards.
+        :return: (partial normalizer state or None, dict label -> count). Pass
+                 the states into normalizer.merge() to get the final result.
+        """
+        if not 0 <= shard < shards:
+            raise ValueError("shard must be in [0, %d) (got %d)" %
+                             (shards, shard))
+        normalizer = self.normalizer.partial()
+        different_labels = defaultdict(int)
+        self._analyze_train(normalizer, different_labels, shard, shards,
+                            checkpoint=False)
+        return (normalizer.state if normalizer.is_initialized else None,
+                dict(different_labels))
+
+    def _analyze_train(self, normalizer, different_labels, start=0, step=1,
+                       checkpoint=True):
+        position = [start]
+        interval = self.analysis_checkpoint_interval * step
+        checkpoint = checkpoint and self.analysis_checkpoint is not None
+
+        with normalization.ParallelAnalyzer(
+                normalizer, self.analysis_workers) as analyzer:
+            def callback():
+                if self.has_labels and len(self.labels_mapping) == 0:
+                    for lbl in self.raw_minibatch_labels[:self.minibatch_size]:
+                        different_labels[lbl] += 1
+                analyzer.analyze(self.minibatch_data[:self.minibatch_size])
+                position[0] += step
+                if checkpoint and (position[0] - start) % interval == 0:
+                    analyzer.flush()
+                    self._save_analysis_checkpoint(
+                        position[0], different_labels)
+
+            self._iterate_class(TRAIN, callback, start, step)
+
+    def _analysis_checkpoint_key(self):
+        return (type(self.normalizer).MAPPING, tuple(self.class_lengths),
+                self.max_minibatch_size)
+
+    def _save_analysis_checkpoint(self, position, different_labels):
+        tmp_name = self.analysis_checkpoint + ".tmp"
+        with open(tmp_name, "wb") as fout:
+            pickle.dump({
+                "key": self._analysis_checkpoint_key(),
+                "position": position,
+                "state": self.normalizer.state
+                if self.normalizer.is_initialized else None,
+                "labels": dict(different_labels)
+            }, fout, protocol=best_protocol)
+        os.rename(tmp_name, self.analysis_checkpoint)
+        self.debug("Saved the analysis checkpoint at minibatch %d to %s",
+                   position, self.analysis_checkpoint)
+
+    def _load_analysis_checkpoint(self, different_labels):
+        """
+        :return: The number of the train minibatch to resume the analysis
+                 from.
+        """
+        if self.analysis_checkpoint is None or \
+                not os.path.exists(self.analysis_checkpoint):
+            return 0
+        try:
+            with open(self.analysis_checkpoint, "rb") as fin:
+                checkpoint = pickle.load(fin)
+        except Exception as e:
+            self.warning("Failed to read the analysis checkpoint %s: %s",
+                         self.analysis_checkpoint, e)
+            return 0
+        if checkpoint["key"] != self._analysis_checkpoint_key():
+            self.warning("Ignored the analysis checkpoint %s since it was "
+                         "made for a different dataset or settings",
+                         self.analysis_checkpoint)
+            return 0
+        if checkpoint["state"] is not None:
+            self.normalizer.state = checkpoint["state"]
+        different_labels.update(checkpoint["labels"])
+        self.info("Resuming the analysis from minibatch %d",
+                  checkpoint["position"])
+        return checkpoint["position"]
+
+    def _remove_analysis_checkpoint(self):
+        if self.analysis_checkpoint is not None and \
+                os.path.exists(self.analysis_checkpoint):
+            os.remove(self.analysis_checkpoint)
+
     def normalize_minibatch(self):
         self.normalizer.normalize(self.minibatch_data[:self.minibatch_size])
 
@@ -842,6 +1243,21 @@ class Loader(Unit):
         raise error.Bug("Could not convert sample index to class index, "
                         "probably due to incorrect class_end_offsets.")
 
+    def class_indices_by_sample_indices(self, indices):
+        """Vectorized version of class_index_by_sample_index().
+
+        :param indices: numpy array with global sample indices.
+        :return: tuple of two numpy arrays of the same length as indices:
+                 class indices and remainders.
+        """
+        class_end_offsets = numpy.array(self.effective_class_end_offsets)
+        class_indices = numpy.searchsorted(
+            class_end_offsets, indices, side="right")
+        if len(indices) > 0 and class_indices.max() >= len(class_end_offsets):
+            raise error.Bug("Could not convert sample index to class index, "
+                            "probably due to incorrect class_end_offsets.")
+        return class_indices, class_end_offsets[class_indices] - indices
+
     def _calc_class_end_offsets(self):
         """Fills self.class_end_offsets from self.class_lengths.
         """
@@ -863,16 +1279,32 @@ class Loader(Unit):
         if self.is_slave:
             # The flags will be explicitly set in apply_data_from_master()
             return
+        last_mb, epoch_ended = self._calc_flags(self.minibatch_class)
+        self.last_minibatch <<= last_mb
+        self.epoch_ended <<= epoch_ended
+
+    def _calc_flags(self, minibatch_class):
+        """
+        :return: last_minibatch and epoch_ended values for the minibatch of
+        the specified class which ends at the current global_offset.
+        """
         last_mb = (
             self.class_ended and
             (not self.pending_minibatches_count or not self.is_master) and
             not len(self.failed_minibatches))
-        self.last_minibatch <<= last_mb
-        self.epoch_ended <<= last_mb and (
-            self.minibatch_class == VALID or
-            (self.minibatch_class == TEST and self.class_lengths[TRAIN] ==
+        return last_mb, last_mb and (
+            minibatch_class == VALID or
+            (minibatch_class == TEST and self.class_lengths[TRAIN] ==
                 self.class_lengths[VALID] == 0) or
-            (self.minibatch_class == TRAIN and self.class_lengths[VALID] == 0))
+            (minibatch_class == TRAIN and self.class_lengths[VALID] == 0))
+
+    def _calc_ended_flags(self):
+        """
+        :return: train_ended and test_ended values for the current
+        global_offset.
+        """
+        return (self.global_offset >= self.effective_total_samples,
+                self.global_offset >= self.class_end_offsets[TEST])
 
     def _advance_global_offset(self):
         """Increments global_offset by an appropriate minibatch_size.
@@ -880,19 +1312,64 @@ class Loader(Unit):
         # Slave mode is much simpler than others
         if self.is_slave:
             return self.minibatch_offset, self.minibatch_size
+        self.minibatch_class, minibatch_size = self._step_global_offset()
+        train_ended, test_ended = self._calc_ended_flags()
+        self.train_ended <<= train_ended
+        self.test_ended <<= test_ended
+        return self.global_offset, minibatch_size
+
+    def _step_global_offset(self):
+        """Moves global_offset to the end of the next minibatch. Does not
+        change minibatch_class and the flags.
+
+        Returns:
+            The class and the size of the next minibatch.
+        """
         # Shuffle again when the end of data is reached.
         if self.global_offset >= self.effective_total_samples:
             self.global_offset = 0
             self.shuffle()
 
         # Compute next minibatch class and size
-        self.minibatch_class, remainder = self.class_index_by_sample_index(
+        minibatch_class, remainder = self.class_index_by_sample_index(
             self.global_offset)
         minibatch_size = min(remainder, self.max_minibatch_size)
         self.global_offset += minibatch_size
-        self.train_ended <<= self.global_offset >= self.effective_total_samples
-        self.test_ended <<= self.global_offset >= self.class_end_offsets[TEST]
-        return self.global_offset, minibatch_size
+        return minibatch_class, minibatch_size
+
+    def _setup_prefetcher(self):
+        if not self.is_standalone:
+            self.warning("Prefetching is disabled in %s mode",
+                         "master" if self.is_master else "slave")
+            self.prefetch = 0
+            return
+        if self.fills_randomly:
+            self.warning("Prefetching is disabled since fill_minibatch() "
+                         "uses prng")
+            self.prefetch = 0
+            return
+        self._prefetcher_ = MinibatchPrefetcher(
+            self, self.prefetch, self.prefetch_workers)
+
+    def _serve_prefetched_minibatch(self, slot):
+        """Sets the minibatch prepared by the prefetcher as the current one.
+        """
+        self.pending_minibatches_[None].append(slot.minibatch_def)
+        self.minibatch_class = slot.minibatch_class
+        train_ended, test_ended, last_mb, epoch_ended = slot.flags
+        self.train_ended <<= train_ended
+        self.test_ended <<= test_ended
+        # Bypass the setters since global_offset has already gone further
+        self._minibatch_offset_, self._minibatch_size_ = slot.minibatch_def
+        self.last_minibatch <<= last_mb
+        self.epoch_ended <<= epoch_ended
+        for name in self.prefetched_arrays:
+            dst = getattr(self, name)
+            if not dst:
+                continue
+            dst.map_invalidate()
+            dst.mem[:] = getattr(slot.view, name).mem
+        self.raw_minibatch_labels[:] = slot.view.raw_minibatch_labels
 
     def _on_successful_serve(self):
         self.samples_served += self.minibatch_size
@@ -905,15 +1382,17 @@ class Loader(Unit):
             # for small datasets
             self._minibatch_serve_timestamp_ = time.time()
 
-    def _iterate_class(self, class_index, fn):
+    def _iterate_class(self, class_index, fn, start=0, step=1):
         size = int(numpy.ceil(
             self.class_lengths[class_index] / self.max_minibatch_size))
-        for i in ProgressBar(term_width=40)(range(size)):
+        self._init_shuffled_indices()
+        for i in ProgressBar(term_width=40)(range(start, size, step)):
             start_index = i * self.max_minibatch_size
             self.minibatch_size = min(
                 self.max_minibatch_size,
                 self.class_lengths[class_index] - start_index)
-            offset = self.class_end_offsets[class_index - 1] + start_index
+            offset = (self.class_end_offsets[class_index - 1]
+                      if class_index > 0 else 0) + start_index
             self.minibatch_indices[:self.minibatch_size] = \
                 self.shuffled_indices[offset:offset + self.minibatch_size]
             self.fill_minibatch()
@@ -1037,6 +1516,7 @@ class LoaderMSEMixin(Unit):
         class_targets: target for each class.
         minibatch_targets: target data.
     """
+    PREFETCHED_ARRAYS = "minibatch_targets",
 
     def __init__(self, workflow, **kwargs):
         super(LoaderMSEMixin, self).__init__(workflow, **kwargs)
@@ -1111,6 +1591,10 @@ class LoaderMSEMixin(Unit):
     def minibatch_targets(self):
         return self._minibatch_targets
 
+    @minibatch_targets.setter
+    def minibatch_targets(self, value):
+        self._minibatch_targets = value
+
     def initialize(self, **kwargs):
         super(LoaderMSEMixin, self).initialize(**kwargs)
         if self.class_lengths[TRAIN] > 0:
@@ -1138,6 +1622,12 @@ class LoaderMSEMixin(Unit):
         if self.minibatch_size < self.max_minibatch_size:
             self.minibatch_targets[self.minibatch_size:] = 0.0
 
+    def prepare_minibatch(self):
+        super(LoaderMSEMixin, self).prepare_minibatch()
+
+        if self.minibatch_size < self.max_minibatch_size:
+            self.minibatch_targets[self.minibatch_size:] = 0.0
+
     def fill_indices(self, start_offset, count):
         self.minibatch_targets.map_invalidate()
         return super(LoaderMSEMixin, self).fill_indices(start_offset, count)
@@ -61,6 +61,10 @@ class FileImageLoaderBase(ImageLoader, FileFilter):
         kwargs["file_subtypes"] = kwargs.get("file_subtypes", ["jpeg", "png"])
         super(FileImageLoaderBase, self).__init__(workflow, **kwargs)
 
+    @property
+    def dataset_files(self):
+        return tuple(chain.from_iterable(self.class_keys))
+
     def get_image_info(self, key):
         """
         :param key: The full path to the analysed image.
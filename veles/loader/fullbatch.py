@@ -38,17 +38,21 @@ under the License.
 from __future__ import division
 from collections import Counter
 import numpy
+import os
 from cuda4py import CUDARuntimeError, CUDA_ERROR_OUT_OF_MEMORY
 from opencl4py import CLRuntimeError, CL_MEM_OBJECT_ALLOCATION_FAILURE
 import six
+import uuid
 from zope.interface import implementer, Interface
 
 from veles.accelerated_units import AcceleratedUnit, IOpenCLUnit, ICUDAUnit, \
     INumpyUnit
 from veles.backends import NumpyDevice
 from veles.compat import from_none
+import veles.config as config
 import veles.memory as memory
 from veles.opencl_types import numpy_dtype_to_opencl
+from veles.pickle2 import pickle, best_protocol
 from veles.units import UnitCommandLineArgumentsRegistry
 from veles.loader.base import ILoader, Loader, LoaderMSEMixin, \
     UserLoaderRegistry, LoaderWithValidationRatio
@@ -58,6 +62,27 @@ VALID = 1
 TEST = 0
 
 
+#: numpy.take() is faster than copying the samples one by one only if they
+#: are smaller than this number of bytes
+GATHER_TAKE_MAX_SAMPLE_SIZE = 4096
+
+
+def gather(source, indices, out):
+    """Copies source[indices] to out along the first axis, the same way
+    fill_minibatch_data_labels kernel does on the device. Small samples are
+    taken at once and written directly to out if the dtypes match; big ones
+    are copied row by row, which is faster for them.
+    """
+    if source[:1].nbytes > GATHER_TAKE_MAX_SAMPLE_SIZE:
+        for i, index in enumerate(indices.tolist()):
+            out[i] = source[index]
+    elif source.dtype == out.dtype:
+        # The indices are valid; mode="raise" would buffer out
+        numpy.take(source, indices, axis=0, out=out, mode="clip")
+    else:
+        out[:] = numpy.take(source, indices, axis=0, mode="clip")
+
+
 class FullBatchUserLevelLoaderRegistry(UnitCommandLineArgumentsRegistry,
                                        UserLoaderRegistry):
     pass
@@ -85,19 +110,33 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
         original_data: original data (Array).
         original_labels: original labels (Array, dtype=Loader.LABEL_DTYPE)
             (in case of classification).
+        memmap_originals: keep the normalized original data in memory mapped
+            files under root.common.dirs.cache, so that the datasets larger
+            than RAM can be used and the next runs skip load_data().
+        restored_attributes: the names of the attributes which load_data()
+            sets besides the original data and labels. They are saved
+            together with the memory mapped data.
 
     Should be overriden in child class:
         load_data()
     """
+    restored_attributes = tuple()
+
     def __init__(self, workflow, **kwargs):
         super(FullBatchLoader, self).__init__(workflow, **kwargs)
         self.verify_interface(IFullBatchLoader)
+        self.memmap_originals = kwargs.get(
+            "memmap_originals", config.root.common.loader.memmap_originals)
+        self._originals_dir = None
 
     def init_unpickled(self):
         super(FullBatchLoader, self).init_unpickled()
         self._original_data_ = memory.Array()
         self._original_labels_ = []
         self._mapped_original_labels_ = memory.Array()
+        self._originals_fingerprint_ = None
+        self._originals_meta_ = None
+        self._loaded_class_lengths_ = None
         self.sources_["fullbatch_loader"] = {}
         self._global_size = None
         self._krn_const = numpy.zeros(2, dtype=Loader.LABEL_DTYPE)
@@ -122,6 +161,35 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
             raise TypeError("on_device must be boolean (got %s)" % type(value))
         self.force_numpy = not value
 
+    @property
+    def memmap_originals(self):
+        return getattr(self, "_memmap_originals", False)
+
+    @memmap_originals.setter
+    def memmap_originals(self, value):
+        if not isinstance(value, bool):
+            raise TypeError("memmap_originals must be a boolean (got %s)" %
+                            type(value))
+        self._memmap_originals = value
+
+    @property
+    def originals_dir(self):
+        """
+        :return: The directory with the memory mapped original data. It is
+                 the only thing about the data which gets into the snapshots.
+        """
+        return getattr(self, "_originals_dir", None)
+
+    @property
+    def originals_fingerprint(self):
+        """
+        :return: The hash which identifies the memory mapped original data.
+                 Unlike dataset_fingerprint, it is calculated before
+                 load_data() and does not depend on class_lengths. None if
+                 dataset_files is empty until the data is loaded.
+        """
+        return self._hash_dataset("originals", self.validation_ratio)
+
     @property
     def original_data(self):
         return self._original_data_
@@ -158,7 +226,15 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
     def initialize(self, device, **kwargs):
         super(FullBatchLoader, self).initialize(device=device, **kwargs)
         assert self.total_samples > 0
-        self.analyze_original_dataset()
+        if self.prefetch > 0 and not isinstance(self.device, NumpyDevice):
+            self.warning("Prefetching is disabled since the minibatches are "
+                         "filled on the device")
+            self.prefetch = 0
+        if self._originals_meta_ is None:
+            self.analyze_original_dataset()
+            self._originals_normalized()
+        elif self._originals_meta_["normalizer"] is not None:
+            self.normalizer.state = self._originals_meta_["normalizer"]
         self._map_original_labels()
 
         if isinstance(self.device, NumpyDevice):
@@ -265,6 +341,7 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
 
     def on_before_create_minibatch_data(self):
         self._has_labels = len(self.original_labels) > 0
+        self._loaded_class_lengths_ = tuple(self.class_lengths)
         try:
             super(FullBatchLoader, self).on_before_create_minibatch_data()
         except AttributeError:
@@ -280,12 +357,12 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
         Create original_data.mem and original_labels.mem.
         :param dshape: Future original_data.shape[1:]
         """
-        self.original_data.reset(
-            numpy.zeros((self.total_samples,) + dshape, self.dtype))
+        self.original_data.reset(self._allocate_original(
+            "original_data", (self.total_samples,) + dshape, self.dtype))
         if not labels:
             return
-        self._mapped_original_labels_.reset(
-            numpy.zeros(self.total_samples, Loader.LABEL_DTYPE))
+        self._mapped_original_labels_.reset(self._allocate_original(
+            "mapped_original_labels", self.total_samples, Loader.LABEL_DTYPE))
         del self.original_labels[:]
         self.original_labels.extend(None for _ in range(self.total_samples))
 
@@ -310,6 +387,19 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
         return True
 
     def fill_minibatch(self):
+        size = self.minibatch_size
+        indices = self.minibatch_indices.mem[:size]
+        self.original_data.map_read()
+        gather(self.original_data.mem, indices, self.minibatch_data.mem[:size])
+        if self.has_labels:
+            self._mapped_original_labels_.map_read()
+            gather(self._mapped_original_labels_.mem, indices,
+                   self.minibatch_labels.mem[:size])
+
+    def fill_minibatch_by_samples(self):
+        """Reference implementation of fill_minibatch() which copies one
+        sample at a time.
+        """
         for i, sample_index in enumerate(
                 self.minibatch_indices.mem[:self.minibatch_size]):
             # int() is required by (guess what...) PyPy
@@ -339,8 +429,12 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
             "Data range: (%.6f, %.6f), "
             % (self.original_data.min(), self.original_data.max()))
         if self.class_lengths[TRAIN] > 0:
-            self.normalizer.analyze(
-                self.original_data[self.class_end_offsets[VALID]:])
+            path = self.analysis_cache_path
+            if path is None or not self._load_analysis_cache(path):
+                self.normalizer.analyze(
+                    self.original_data[self.class_end_offsets[VALID]:])
+                if path is not None:
+                    self._save_analysis_cache(path)
         self.normalizer.normalize(self.original_data.mem)
         self.debug(
             "Normalized data range: (%.6f, %.6f), "
@@ -458,11 +552,127 @@ class FullBatchLoader(AcceleratedUnit, FullBatchLoaderBase):
         self._init_mapped_original_labels()
 
     def _init_mapped_original_labels(self):
-        self._mapped_original_labels_.reset(
-            numpy.zeros(self.total_samples, Loader.LABEL_DTYPE))
+        self._mapped_original_labels_.reset(self._allocate_original(
+            "mapped_original_labels", self.total_samples, Loader.LABEL_DTYPE))
         for i, label in enumerate(self.original_labels):
             self._mapped_original_labels_[i] = self.labels_mapping[label]
 
+    def restore_data(self):
+        """
+        Opens the memory mapped original data of a previous run if
+        memmap_originals is enabled. The data is found either by
+        originals_fingerprint or by originals_dir of the snapshot.
+        """
+        self._originals_meta_ = None
+        if not self.memmap_originals:
+            return False
+        fingerprint = self._originals_fingerprint_ = \
+            self.originals_fingerprint
+        paths = []
+        if fingerprint is not None:
+            paths.append(os.path.join(
+                config.root.common.dirs.cache, "originals", fingerprint))
+        if self.restored_from_snapshot and self.originals_dir is not None:
+            paths.append(self.originals_dir)
+        for path in paths:
+            meta = self._load_originals(path)
+            if meta is not None:
+                self._originals_dir = path
+                self._originals_meta_ = meta
+                self.info("Reused the memory mapped data in %s", path)
+                return True
+        if fingerprint is not None:
+            self._originals_dir = paths[0]
+        elif self.originals_dir is None:
+            self._originals_dir = os.path.join(
+                config.root.common.dirs.cache, "originals", uuid.uuid4().hex)
+        # The data is going to be overwritten
+        meta_path = os.path.join(self.originals_dir, "meta.pickle")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        return False
+
+    def _allocate_original(self, name, shape, dtype):
+        if not self.memmap_originals or self.originals_dir is None:
+            return numpy.zeros(shape, dtype)
+        if not os.path.exists(self.originals_dir):
+            os.makedirs(self.originals_dir)
+        return numpy.lib.format.open_memmap(
+            os.path.join(self.originals_dir, name + ".npy"), mode="w+",
+            dtype=dtype, shape=shape)
+
+    def _originals_normalized(self):
+        """
+        Called by initialize() when the loaded original data is normalized.
+        """
+        if self.memmap_originals:
+            self._save_originals()
+
+    def _originals_meta(self):
+        """
+        :return: The dictionary which is required to reuse the memory mapped
+                 original data. "arrays" lists the names of the memory mapped
+                 attributes.
+        """
+        return {
+            "fingerprint": self._originals_fingerprint_,
+            "arrays": ("original_data",),
+            "class_lengths": self._loaded_class_lengths_,
+            "original_labels": list(self.original_labels),
+            "normalizer": self.normalizer.state
+            if self.normalizer.is_initialized else None,
+            "attributes": {name: getattr(self, name)
+                           for name in self.restored_attributes}
+        }
+
+    def _save_originals(self):
+        if not os.path.exists(self.originals_dir):
+            os.makedirs(self.originals_dir)
+        meta = self._originals_meta()
+        for name in meta["arrays"]:
+            array = getattr(self, name)
+            if isinstance(array.mem, numpy.memmap):
+                array.mem.flush()
+                continue
+            # load_data() did not use create_originals()
+            path = os.path.join(self.originals_dir, name + ".npy")
+            numpy.save(path, array.mem)
+            array.reset(numpy.load(path, mmap_mode="r+"))
+        path = os.path.join(self.originals_dir, "meta.pickle")
+        tmp_name = path + ".tmp"
+        with open(tmp_name, "wb") as fout:
+            pickle.dump(meta, fout, protocol=best_protocol)
+        os.rename(tmp_name, path)
+        self.info("Saved the memory mapped data to %s", self.originals_dir)
+
+    def _load_originals(self, path):
+        """
+        :return: The dictionary returned by _originals_meta() if the data in
+                 path matches the current dataset; otherwise, None.
+        """
+        meta_path = os.path.join(path, "meta.pickle")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "rb") as fin:
+                meta = pickle.load(fin)
+            if meta["fingerprint"] != self._originals_fingerprint_:
+                return None
+            arrays = {name: numpy.load(os.path.join(path, name + ".npy"),
+                                       mmap_mode="r+")
+                      for name in meta["arrays"]}
+        except Exception as e:
+            self.warning("Failed to reuse the memory mapped data in %s: %s",
+                         path, e)
+            return None
+        for name, mem in arrays.items():
+            getattr(self, name).reset(mem)
+        self.class_lengths[:] = meta["class_lengths"]
+        self.original_labels[:] = meta["original_labels"]
+        for name, value in meta["attributes"].items():
+            setattr(self, name, value)
+        return meta
+
 
 class FullBatchLoaderMSEMixin(LoaderMSEMixin):
     hide_from_registry = True
@@ -484,9 +694,15 @@ class FullBatchLoaderMSEMixin(LoaderMSEMixin):
         super(FullBatchLoaderMSEMixin, self).initialize(
             device=device, **kwargs)
         assert self.total_samples > 0
+        if self._originals_meta_ is not None:
+            if self._originals_meta_["target_normalizer"] is not None:
+                self.target_normalizer.state = \
+                    self._originals_meta_["target_normalizer"]
+            return
         self.info("Normalizing targets to %s...",
                   self.target_normalization_type)
         self.analyze_and_normalize_targets()
+        super(FullBatchLoaderMSEMixin, self)._originals_normalized()
 
     def create_minibatch_data(self):
         super(FullBatchLoaderMSEMixin, self).create_minibatch_data()
@@ -509,6 +725,24 @@ class FullBatchLoaderMSEMixin(LoaderMSEMixin):
             "Normalized target range: (%.6f, %.6f)"
             % (self.original_targets.min(), self.original_targets.max()))
 
+    def _originals_normalized(self):
+        # The targets are normalized later in initialize()
+        pass
+
+    def _originals_meta(self):
+        meta = super(FullBatchLoaderMSEMixin, self)._originals_meta()
+        meta["arrays"] += ("original_targets",)
+        meta["class_targets"] = self.class_targets.mem
+        meta["target_normalizer"] = self.target_normalizer.state \
+            if self.target_normalizer.is_initialized else None
+        return meta
+
+    def _load_originals(self, path):
+        meta = super(FullBatchLoaderMSEMixin, self)._load_originals(path)
+        if meta is not None:
+            self.class_targets.reset(meta["class_targets"])
+        return meta
+
     def get_ocl_defines(self):
         return {
             "TARGET": 1,
@@ -555,6 +789,13 @@ class FullBatchLoaderMSEMixin(LoaderMSEMixin):
 
     def fill_minibatch(self):
         super(FullBatchLoaderMSEMixin, self).fill_minibatch()
+        size = self.minibatch_size
+        self.original_targets.map_read()
+        gather(self.original_targets.mem, self.minibatch_indices.mem[:size],
+               self.minibatch_targets.mem[:size])
+
+    def fill_minibatch_by_samples(self):
+        super(FullBatchLoaderMSEMixin, self).fill_minibatch_by_samples()
         for i, v in enumerate(self.minibatch_indices[:self.minibatch_size]):
             # int() is required by PyPy
             self.minibatch_targets[i] = self.original_targets[int(v)]
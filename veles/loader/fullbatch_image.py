@@ -60,33 +60,14 @@ class FullBatchImageLoader(ImageLoader, FullBatchLoader):
         super(FullBatchImageLoader, self).__init__(workflow, **kwargs)
         self.original_label_values = Array()
 
-    class DistortionIterator(object):
-        def __init__(self, data, loader):
-            self.data = data
-            self.loader = loader
-            stages = []
-            for rot in self.loader.rotations:
-                mirror_state = False
-                if self.loader.mirror == "random":
-                    mirror_state = bool(self.loader.prng.randint(2))
-                stages.append((mirror_state, rot))
-                if self.loader.mirror is True:
-                    stages.append((True, rot))
-            self.state = iter(stages)
-
-        def __next__(self):
-            return self.loader.distort(self.data, *next(self.state))
-
-        def __iter__(self):
-            return self
-
     def load_data(self):
         super(FullBatchImageLoader, self).load_data()
 
         # Allocate data
         required_mem = self.total_samples * numpy.prod(self.shape) * \
             numpy.dtype(self.source_dtype).itemsize
-        if virtual_memory().available < required_mem:
+        if not self.memmap_originals and \
+                virtual_memory().available < required_mem:
             gb = 1.0 / (1000 * 1000 * 1000)
             self.critical("Not enough memory (free %.3f Gb, required %.3f Gb)",
                           virtual_memory().free * gb, required_mem * gb)
@@ -97,6 +78,8 @@ class FullBatchImageLoader(ImageLoader, FullBatchLoader):
             self.total_samples, numpy.float32)
 
         has_labels = self._fill_original_data()
+        self.info("Image stage times: %s", ", ".join(
+            "%s %.1f sec" % p for p in sorted(self.stage_times.items())))
 
         # Delete labels mem if no labels was extracted
         if numpy.prod(has_labels) == 0 and sum(has_labels) > 0:
@@ -116,26 +99,43 @@ class FullBatchImageLoader(ImageLoader, FullBatchLoader):
             return
         self.debug("Skipped _resize_validation()")
 
+    def _get_distortion_stages(self):
+        """
+        :return: The list of (mirror, rotation) tuples to apply to each crop.
+        """
+        stages = []
+        for rot in self.rotations:
+            mirror_state = False
+            if self.mirror == "random":
+                mirror_state = bool(self.prng.randint(2))
+            stages.append((mirror_state, rot))
+            if self.mirror is True:
+                stages.append((True, rot))
+        return stages
+
     def _load_distorted_keys(self, keys, data, labels, label_values, offset,
                              pbar):
         has_labels = False
-        for key in keys:
-            img, _, bbox = self._load_image(key, crop=False)
+        for key, img, _, bbox in self.iterate_images(keys, crop=False):
             label, has_labels = self._load_label(key, has_labels)
+            distortions = []
             for ci in range(self.crop_number):
                 if self.crop is not None:
-                    cropped, label_value = self.crop_image(img, bbox)
+                    cropped, label_value = self.measure_stage(
+                        "crop", self.crop_image, img, bbox)
                 else:
                     cropped = img
                     label_value = 1.0
-                for dist in FullBatchImageLoader.DistortionIterator(
-                        cropped, self):
-                    data[offset] = self.distort(cropped, *dist)
+                for dist in self._get_distortion_stages():
+                    # distort_inplace() overwrites data[offset]
+                    data[offset] = cropped
+                    distortions.append((offset,) + dist)
                     labels[offset] = label
                     label_values[offset] = label_value
                     offset += 1
                     if pbar is not None:
                         pbar.inc()
+            self.distort_inplace(data, distortions)
         return offset, has_labels
 
     def fill_minibatch(self):
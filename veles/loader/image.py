@@ -38,6 +38,7 @@ under the License.
 from __future__ import division
 from collections import defaultdict
 from itertools import chain
+import threading
 try:
     import cv2
 except ImportError:
@@ -53,6 +54,8 @@ from veles.loader.base import CLASS_NAME, ILoader, Loader, \
     TRAIN, VALID, TEST, LoaderError, LoaderWithValidationRatio
 from veles.memory import Array
 from veles.prng import RandomGenerator
+from veles.thread_pool import ThreadPool
+from veles.timeit2 import timeit
 
 
 MODE_COLOR_MAP = {
@@ -112,6 +115,14 @@ class ImageLoader(LoaderWithValidationRatio):
                      the values supported by OpenCV, e.g., GRAY or HSV.
         source_dtype: dtype to work with during various image operations.
         shape: image shape (tuple) - set after initialize().
+        decode_workers: the number of threads which decode, scale and distort
+                        images. OpenCV releases the GIL, so they run in
+                        parallel. Cropping and random distortion choices
+                        remain on the calling thread, so the results do not
+                        depend on this number.
+        stage_times: the total time spent in each image processing stage
+                     ("decode", "color", "sobel", "scale", "crop",
+                     "distort").
 
      Must be overriden in child classes:
         get_image_label()
@@ -119,6 +130,7 @@ class ImageLoader(LoaderWithValidationRatio):
         get_image_data()
         get_keys()
     """
+    PREFETCHED_ARRAYS = "minibatch_label_values",
 
     def __init__(self, workflow, **kwargs):
         super(ImageLoader, self).__init__(workflow, **kwargs)
@@ -141,8 +153,15 @@ class ImageLoader(LoaderWithValidationRatio):
         self.background_color = kwargs.get(
             "background_color", (0xff, 0x14, 0x93))
         self.smart_crop = kwargs.get("smart_crop", True)
+        self.decode_workers = kwargs.get("decode_workers", 1)
         self.minibatch_label_values = Array()
 
+    def init_unpickled(self):
+        super(ImageLoader, self).init_unpickled()
+        self._decode_pool_ = None
+        self._stage_times_ = defaultdict(float)
+        self._stage_times_lock_ = threading.Lock()
+
     @property
     def source_dtype(self):
         return self._source_dtype
@@ -307,6 +326,51 @@ class ImageLoader(LoaderWithValidationRatio):
                     "rotations[%d] = %s is greater than 2π" % (i, rot))
         self._rotations = tuple(sorted(value))
 
+    @property
+    def decode_workers(self):
+        return self._decode_workers
+
+    @decode_workers.setter
+    def decode_workers(self, value):
+        if not isinstance(value, int):
+            raise TypeError(
+                "decode_workers must be an integer (got %s)" % type(value))
+        if value < 1:
+            raise ValueError(
+                "decode_workers must be greater than 0 (got %d)" % value)
+        self._decode_workers = value
+
+    @property
+    def decode_pool(self):
+        """
+        :return: The thread pool which processes images or None if
+                 decode_workers is 1.
+        """
+        if self.decode_workers == 1:
+            return None
+        if self._decode_pool_ is None:
+            self._decode_pool_ = ThreadPool(
+                minthreads=1, maxthreads=self.decode_workers,
+                name="%s decode" % self.name)
+        return self._decode_pool_
+
+    @property
+    def dataset_parameters(self):
+        return (self.color_space, self.add_sobel, self.mirror, self.scale,
+                self.scale_maintain_aspect_ratio, tuple(self.rotations),
+                self.crop, self.crop_number, self.path_to_mean,
+                self.background_image, self.background_color,
+                self.smart_crop)
+
+    @property
+    def fills_randomly(self):
+        return self.crop is not None or (
+            self.samples_inflation > 1 and self.mirror == "random")
+
+    @property
+    def stage_times(self):
+        return dict(self._stage_times_)
+
     @property
     def samples_inflation(self):
         return (1 if self.mirror is not True else 2) * len(self.rotations) * \
@@ -412,34 +476,52 @@ class ImageLoader(LoaderWithValidationRatio):
         (ymin, ymax, xmin, xmax).
         :return: The transformed image data, the label value (from 0 to 1).
         """
-        if color != self.color_space:
-            method = getattr(
-                cv2, "COLOR_%s2%s" % (color, self.color_space), None)
-            if method is None:
-                aux_method = getattr(cv2, "COLOR_%s2BGR" % color)
-                try:
-                    data = cv2.cvtColor(data, aux_method)
-                except cv2.error as e:
-                    self.error("Failed to perform '%s' conversion", aux_method)
-                    raise from_none(e)
-                method = getattr(cv2, "COLOR_BGR2%s" % self.color_space)
-            try:
-                data = cv2.cvtColor(data, method)
-            except cv2.error as e:
-                self.error("Failed to perform '%s' conversion", method)
-                raise from_none(e)
-
-        if self.add_sobel:
-            data = self.add_sobel_channel(data)
-        if self.scale != 1.0:
-            data, bbox = self.scale_image(data, bbox)
+        data, bbox = self.prepare_image(data, color, bbox)
         if crop and self.crop is not None:
-            data, label_value = self.crop_image(data, bbox)
+            data, label_value = self.measure_stage(
+                "crop", self.crop_image, data, bbox)
         else:
             label_value = 1
 
         return data, label_value, bbox
 
+    def prepare_image(self, data, color, bbox):
+        """
+        Performs the deterministic part of preprocess_image(): color space
+        conversion, adding sobel channel and scaling. It is safe to call this
+        method from several threads at once.
+        :param data: the loaded image data.
+        :param color: The loaded image color space.
+        :param bbox: The bounding box of the labeled object.
+        :return: The transformed image data and the transformed bbox.
+        """
+        if color != self.color_space:
+            data = self.measure_stage("color", self.convert_color, data, color)
+        if self.add_sobel:
+            data = self.measure_stage("sobel", self.add_sobel_channel, data)
+        if self.scale != 1.0:
+            data, bbox = self.measure_stage(
+                "scale", self.scale_image, data, bbox)
+        return data, bbox
+
+    def convert_color(self, data, color):
+        method = getattr(
+            cv2, "COLOR_%s2%s" % (color, self.color_space), None)
+        if method is None:
+            aux_method = getattr(cv2, "COLOR_%s2BGR" % color)
+            try:
+                data = cv2.cvtColor(data, aux_method)
+            except cv2.error as e:
+                self.error("Failed to perform '%s' conversion", aux_method)
+                raise from_none(e)
+            method = getattr(cv2, "COLOR_BGR2%s" % self.color_space)
+        try:
+            data = cv2.cvtColor(data, method)
+        except cv2.error as e:
+            self.error("Failed to perform '%s' conversion", method)
+            raise from_none(e)
+        return data
+
     def scale_image(self, data, bbox):
         bbox = numpy.array(bbox, float)
         if self.scale_maintain_aspect_ratio:
@@ -556,8 +638,7 @@ class ImageLoader(LoaderWithValidationRatio):
         """
         index = 0
         has_labels = False
-        for key in keys:
-            obj, label_value, _ = self._load_image(key)
+        for key, obj, label_value, _ in self.iterate_images(keys):
             label, has_labels = self._load_label(key, has_labels)
             if (self.crop is None or not crop) and \
                     obj.shape[:2] != self.uncropped_shape:
@@ -576,6 +657,72 @@ class ImageLoader(LoaderWithValidationRatio):
                 pbar.inc()
         return has_labels
 
+    def iterate_images(self, keys, crop=True):
+        """Loads and preprocesses the images with the specified keys. If
+        decode_workers is greater than 1, the images are prepared in
+        decode_pool, while cropping is performed on the calling thread in
+        the order of keys.
+        :return: Generator of (key, data, label value, bbox) tuples in the
+                 order of keys.
+        """
+        pool = self.decode_pool
+        if pool is None:
+            for key in keys:
+                yield (key,) + self._load_image(key, crop)
+            return
+        keys = list(keys)
+        for key, (data, bbox) in zip(
+                keys, pool.imap(self._prepare_image_by_key, keys)):
+            if crop and self.crop is not None:
+                data, label_value = self.measure_stage(
+                    "crop", self.crop_image, data, bbox)
+            else:
+                label_value = 1
+            yield key, data, label_value, bbox
+
+    def distort_inplace(self, data, distortions):
+        """Applies distort() to the samples of data, in decode_pool if it
+        exists.
+        :param data: numpy array with samples.
+        :param distortions: iterable of (position in data, mirror, rotation)
+                            tuples.
+        """
+        def distort(args):
+            pos, mirror, rot = args
+            data[pos] = self.measure_stage(
+                "distort", self.distort, data[pos], mirror, rot)
+
+        pool = self.decode_pool
+        if pool is None:
+            for args in distortions:
+                distort(args)
+        else:
+            pool.map(distort, distortions)
+
+    def measure_stage(self, stage, fn, *args, **kwargs):
+        """Executes fn and adds the elapsed time to stage_times[stage].
+        """
+        res, delta = timeit(fn, *args, **kwargs)
+        with self._stage_times_lock_:
+            self._stage_times_[stage] += delta
+        return res
+
+    def stop(self):
+        super(ImageLoader, self).stop()
+        if self._decode_pool_ is not None:
+            self._decode_pool_.shutdown(execute_remaining=False)
+            self._decode_pool_ = None
+
+    def get_metric_names(self):
+        names = super(ImageLoader, self).get_metric_names()
+        names.add("Image stage times")
+        return names
+
+    def get_metric_values(self):
+        values = super(ImageLoader, self).get_metric_values()
+        values["Image stage times"] = self.stage_times
+        return values
+
     def load_labels(self):
         if not self.has_labels:
             return
@@ -657,12 +804,13 @@ class ImageLoader(LoaderWithValidationRatio):
             self.raw_minibatch_labels, self.minibatch_label_values)
         if self.samples_inflation == 1:
             return
+        distortions = []
         for pos, index in enumerate(indices):
             _, _, dist_index = \
                 self._get_class_origin_distortion_from_index(index)
-            self.minibatch_data[pos] = self.distort(
-                self.minibatch_data[pos],
-                *self.get_distortion_by_index(dist_index))
+            distortions.append(
+                (pos,) + self.get_distortion_by_index(dist_index))
+        self.distort_inplace(self.minibatch_data.mem, distortions)
 
     def _resize_validation_keys(self, label_analysis):
         if label_analysis is None:
@@ -762,11 +910,17 @@ class ImageLoader(LoaderWithValidationRatio):
         """Returns the data to serve corresponding to the given image key and
         the label value (from 0 to 1).
         """
-        data = self.get_image_data(key)
+        data = self.measure_stage("decode", self.get_image_data, key)
         size, color = self.get_image_info(key)
         bbox = self.get_image_bbox(key, size)
         return self.preprocess_image(data, color, crop, bbox)
 
+    def _prepare_image_by_key(self, key):
+        data = self.measure_stage("decode", self.get_image_data, key)
+        size, color = self.get_image_info(key)
+        bbox = self.get_image_bbox(key, size)
+        return self.prepare_image(data, color, bbox)
+
     def _load_label(self, key, has_labels):
         label = self.get_image_label(key)
         if label is not None:
@@ -57,6 +57,10 @@ class HDF5LoaderBase(Loader):
     def files(self):
         return self._files
 
+    @property
+    def dataset_files(self):
+        return tuple(f for f in self.files if f)
+
     @Loader.shape.getter
     def shape(self):
         return self._shape
@@ -110,6 +114,30 @@ class HDF5Loader(HDF5LoaderBase):
 
     def fill_minibatch(self):
         """Fill minibatch data labels and indexes according to current shuffle.
+        Each class dataset is read once with a sorted fancy index, then the
+        samples are scattered back to the minibatch order.
+        """
+        indices = self.minibatch_indices.mem[:self.minibatch_size]
+        class_indices, remainders = \
+            self.class_indices_by_sample_indices(indices)
+        offsets = numpy.array(self.class_lengths)[class_indices] - remainders
+        for ci in numpy.unique(class_indices):
+            dataset = self._datasets[ci]
+            where = numpy.nonzero(class_indices == ci)[0]
+            # h5py requires the indices to be increasing and unique
+            unique_offsets, inverse = numpy.unique(
+                offsets[where], return_inverse=True)
+            unique_offsets = unique_offsets.tolist()
+            self.minibatch_data.mem[where] = \
+                dataset[0][unique_offsets][inverse]
+            if self.has_labels:
+                labels = dataset[1][unique_offsets][inverse]
+                for i, label in zip(where, labels):
+                    self.raw_minibatch_labels[i] = label
+
+    def fill_minibatch_by_samples(self):
+        """Reference implementation of fill_minibatch() which reads one
+        sample at a time.
         """
         for i, sample_index in enumerate(
                 self.minibatch_indices.mem[:self.minibatch_size]):
@@ -123,6 +151,8 @@ class HDF5Loader(HDF5LoaderBase):
 
 @implementer(IFullBatchLoader)
 class FullBatchHDF5Loader(FullBatchLoader, HDF5LoaderBase):
+    restored_attributes = ("_shape",)
+
     @FullBatchLoader.shape.getter
     def shape(self):
         return self._shape
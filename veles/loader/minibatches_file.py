@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 8, 2015
+
+Random access file format for the minibatches written by
+:class:`veles.loader.saver.MinibatchesSaver`.
+
+The file consists of the fixed header (magic, index offset and index size),
+the data and labels columns and the index at the end. The samples are stored
+in the global order (test, validation, train). Uncompressed columns are
+contiguous and page aligned, so that they can be memory mapped; compressed
+columns are split into blocks of block_size samples which are compressed
+independently and addressed by (offset, size) pairs in the index.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import bz2
+from io import SEEK_END
+import struct
+import zlib
+
+import numpy
+import snappy
+
+from veles import block_codec, error
+from veles.compat import lzma
+from veles.logger import Logger
+from veles.pickle2 import pickle, best_protocol
+
+
+MAGIC = b"VELESMMB"
+HEADER = struct.Struct("<8sQQ")
+ALIGNMENT = 4096
+COLUMNS = "data", "labels"
+
+#: name -> (compress(buffer, level), decompress(buffer))
+CODECS = {
+    "raw": (None, None),
+    "snappy": (lambda b, _: snappy.compress(b), snappy.decompress),
+    "gz": (zlib.compress, zlib.decompress),
+    "bz2": (bz2.compress, bz2.decompress),
+    "xz": (lambda b, l: lzma.compress(b, preset=l), lzma.decompress),
+    "pgz": (lambda b, l: block_codec.compress(b, "gz", l),
+            block_codec.decompress),
+    "pbz2": (lambda b, l: block_codec.compress(b, "bz2", l),
+             block_codec.decompress),
+    "pxz": (lambda b, l: block_codec.compress(b, "xz", l),
+            block_codec.decompress),
+}
+
+
+def is_minibatches_file(file_name):
+    """
+    :return: True if the file was written by MinibatchesFileWriter, False
+             otherwise (e.g., it has the old pickled chunks format).
+    """
+    with open(file_name, "rb") as fin:
+        return fin.read(len(MAGIC)) == MAGIC
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class MinibatchesFileWriter(Logger):
+    """Writes the samples sequentially to the random access minibatches file.
+
+    Attributes:
+        file_name: the path to the output file.
+        class_lengths: the number of samples in each class.
+        sample_shape: the shape of a single data sample.
+        sample_dtype: the dtype of the data.
+        label_shape: the shape of a single label or None if there are no
+                     labels.
+        label_dtype: the dtype of the labels.
+        labels_mapping: the loader's labels mapping.
+        compression: the name of the codec in CODECS.
+        compression_level: the codec's compression level.
+        block_size: the number of samples in each compressed block.
+        count: the number of samples written so far.
+    """
+
+    def __init__(self, file_name, class_lengths, sample_shape, sample_dtype,
+                 label_shape=None, label_dtype=None, labels_mapping=None,
+                 compression="raw", compression_level=9, block_size=1024):
+        super(MinibatchesFileWriter, self).__init__()
+        if compression not in CODECS:
+            raise ValueError("Unsupported compression \"%s\" (choose one of "
+                             "%s)" % (compression, ", ".join(sorted(CODECS))))
+        if block_size < 1:
+            raise ValueError("block_size must be positive (got %d)" %
+                             block_size)
+        self.file_name = file_name
+        self.class_lengths = tuple(class_lengths)
+        self.sample_shape = tuple(sample_shape)
+        self.sample_dtype = numpy.dtype(sample_dtype)
+        self.label_shape = tuple(label_shape) \
+            if label_shape is not None else None
+        self.label_dtype = numpy.dtype(label_dtype) \
+            if label_shape is not None else None
+        self.labels_mapping = labels_mapping
+        self.compression = compression
+        self.compression_level = compression_level
+        self.block_size = block_size
+        self.count = 0
+        self._file = None
+        self._offsets = {}
+        self._pending = {}
+
+    @property
+    def total_samples(self):
+        return sum(self.class_lengths)
+
+    @property
+    def has_labels(self):
+        return self.label_shape is not None
+
+    @property
+    def is_full(self):
+        return self.count >= self.total_samples
+
+    def open(self):
+        self._file = open(self.file_name, "wb")
+        self._file.write(HEADER.pack(MAGIC, 0, 0))
+        if self.compression == "raw":
+            offset = _align(HEADER.size)
+            for column in self._columns:
+                self._offsets[column] = offset
+                offset = _align(offset + self.total_samples *
+                                self._sample_nbytes(column))
+            self._file.truncate(offset)
+        else:
+            for column in self._columns:
+                self._offsets[column] = []
+                self._pending[column] = []
+
+    def write(self, data, labels=None):
+        """Appends the samples to the file.
+
+        :param data: numpy array with the samples.
+        :param labels: numpy array with the labels, may be omitted if the
+                       writer was created without labels.
+        """
+        size = len(data)
+        if self.count + size > self.total_samples:
+            raise error.BadFormatError(
+                "Attempted to write %d samples while there are only %d left" %
+                (size, self.total_samples - self.count))
+        arrays = {"data": data, "labels": labels}
+        for column in self._columns:
+            arr = numpy.ascontiguousarray(
+                arrays[column], dtype=self._dtype(column))
+            if self.compression == "raw":
+                self._file.seek(self._offsets[column] +
+                                self.count * self._sample_nbytes(column))
+                self._file.write(arr.tobytes())
+            else:
+                self._pending[column].append(arr)
+                self._flush(column, False)
+        self.count += size
+
+    def close(self):
+        if self._file is None or self._file.closed:
+            return
+        if self.count < self.total_samples:
+            self.warning("Only %d samples out of %d were written",
+                         self.count, self.total_samples)
+        if self.compression != "raw":
+            for column in self._columns:
+                self._flush(column, True)
+        self._file.seek(0, SEEK_END)
+        index_offset = self._file.tell()
+        pickle.dump(self._index, self._file, protocol=best_protocol)
+        index_size = self._file.tell() - index_offset
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, index_offset, index_size))
+        self._file.close()
+        self.debug("Index took %d bytes", index_size)
+
+    @property
+    def _columns(self):
+        return COLUMNS if self.has_labels else COLUMNS[:1]
+
+    @property
+    def _index(self):
+        return {
+            "class_lengths": self.class_lengths,
+            "count": self.count,
+            "sample_shape": self.sample_shape,
+            "sample_dtype": self.sample_dtype.str,
+            "label_shape": self.label_shape,
+            "label_dtype": self.label_dtype.str if self.has_labels else None,
+            "labels_mapping": self.labels_mapping,
+            "compression": self.compression,
+            "block_size": self.block_size,
+            "offsets": self._offsets
+        }
+
+    def _shape(self, column):
+        return self.sample_shape if column == "data" else self.label_shape
+
+    def _dtype(self, column):
+        return self.sample_dtype if column == "data" else self.label_dtype
+
+    def _sample_nbytes(self, column):
+        return int(numpy.prod(self._shape(column))) * \
+            self._dtype(column).itemsize
+
+    def _flush(self, column, final):
+        pending = self._pending[column]
+        if len(pending) == 0:
+            return
+        arr = numpy.concatenate(pending)
+        compress = CODECS[self.compression][0]
+        start = 0
+        while len(arr) - start >= self.block_size or \
+                (final and start < len(arr)):
+            block = arr[start:start + self.block_size]
+            buffer = compress(block.tobytes(), self.compression_level)
+            self._offsets[column].append((self._file.tell(), len(buffer)))
+            self._file.write(buffer)
+            start += len(block)
+        self._pending[column] = [arr[start:]] if start < len(arr) else []
+
+
+class MinibatchesFileReader(Logger):
+    """Serves random samples from the file written by MinibatchesFileWriter.
+    Uncompressed columns are memory mapped; compressed blocks are
+    decompressed with read_block().
+
+    Attributes:
+        file_name: the path to the file.
+        class_lengths: the number of samples in each class.
+        sample_shape: the shape of a single data sample.
+        sample_dtype: the dtype of the data.
+        label_shape: the shape of a single label or None if there are no
+                     labels.
+        label_dtype: the dtype of the labels.
+        labels_mapping: the labels mapping of the loader which wrote the file.
+        compression: the name of the codec in CODECS.
+        block_size: the number of samples in each compressed block.
+        columns: dictionary with numpy.memmap-s of the uncompressed columns.
+        cache: veles.lru_cache.LRUCache for the decompressed blocks or None.
+    """
+
+    def __init__(self, file_name, cache=None):
+        super(MinibatchesFileReader, self).__init__()
+        self.file_name = file_name
+        self.cache = cache
+        with open(file_name, "rb") as fin:
+            magic, index_offset, index_size = HEADER.unpack(
+                fin.read(HEADER.size))
+            if magic != MAGIC:
+                raise error.BadFormatError(
+                    "%s is not a minibatches file" % file_name)
+            fin.seek(index_offset)
+            index = pickle.loads(fin.read(index_size))
+        self.class_lengths = index["class_lengths"]
+        self.sample_shape = index["sample_shape"]
+        self.sample_dtype = numpy.dtype(index["sample_dtype"])
+        self.label_shape = index["label_shape"]
+        self.label_dtype = numpy.dtype(index["label_dtype"]) \
+            if self.label_shape is not None else None
+        self.labels_mapping = index["labels_mapping"]
+        self.compression = index["compression"]
+        self.block_size = index["block_size"]
+        if index["count"] < self.total_samples:
+            raise error.BadFormatError(
+                "%s is truncated: %d samples out of %d" % (
+                    file_name, index["count"], self.total_samples))
+        self._offsets = index["offsets"]
+        self.columns = {}
+        if self.compression == "raw":
+            for column in self._offsets:
+                self.columns[column] = numpy.memmap(
+                    file_name, dtype=self._dtype(column), mode="r",
+                    offset=self._offsets[column],
+                    shape=(self.total_samples,) + self._shape(column))
+            self._raw = None
+        else:
+            self._raw = numpy.memmap(file_name, dtype=numpy.uint8, mode="r")
+        self.decompress = CODECS[self.compression][1]
+
+    @property
+    def total_samples(self):
+        return sum(self.class_lengths)
+
+    @property
+    def has_labels(self):
+        return self.label_shape is not None
+
+    def read(self, indices, data, labels=None):
+        """Copies the samples with the specified global indices.
+
+        :param indices: numpy array with sample indices.
+        :param data: the destination array for the samples, at least
+                     len(indices) long.
+        :param labels: the destination array for the labels or None.
+        """
+        outputs = {"data": data, "labels": labels}
+        columns = COLUMNS if labels is not None else COLUMNS[:1]
+        # Reading in the increasing order is friendly to the page cache
+        order = numpy.argsort(indices, kind="mergesort")
+        sorted_indices = indices[order]
+        if self.compression == "raw":
+            for column in columns:
+                outputs[column][order] = self.columns[column][sorted_indices]
+            return
+        blocks = sorted_indices // self.block_size
+        bounds = numpy.nonzero(numpy.diff(blocks))[0] + 1
+        for start, group in zip(numpy.concatenate(([0], bounds)),
+                                numpy.split(order, bounds)):
+            number = blocks[start]
+            offsets = indices[group] - number * self.block_size
+            for column in columns:
+                outputs[column][group] = \
+                    self.read_block(column, number)[offsets]
+
+    def read_block(self, column, number):
+        """Decompresses the block of the column.
+
+        :param column: "data" or "labels".
+        :param number: the block number.
+        :return: numpy array with the block's samples.
+        """
+        if self.cache is not None:
+            return self.cache.get(
+                (column, number),
+                lambda: self._decompress_block(column, number))
+        return self._decompress_block(column, number)
+
+    def _decompress_block(self, column, number):
+        offset, size = self._offsets[column][number]
+        buffer = self._raw[offset:offset + size].tobytes()
+        return numpy.frombuffer(
+            self.decompress(buffer), dtype=self._dtype(column)).reshape(
+            (-1,) + self._shape(column))
+
+    def _shape(self, column):
+        return self.sample_shape if column == "data" else self.label_shape
+
+    def _dtype(self, column):
+        return self.sample_dtype if column == "data" else self.label_dtype
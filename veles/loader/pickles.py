@@ -76,6 +76,10 @@ class PicklesLoader(FullBatchLoader):
     def train_pickles(self):
         return self._train_pickles
 
+    @property
+    def dataset_files(self):
+        return tuple(f for pickles in self._pickles for f in pickles)
+
     def reshape(self, shape):
         return shape
 
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 6, 2015
+
+Background minibatch prefetching for loaders.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from __future__ import division
+from collections import deque
+from functools import partial
+import threading
+import time
+
+import numpy
+
+from veles.logger import Logger
+import veles.memory as memory
+from veles.thread_pool import ThreadPool
+
+
+class PrefetchSlot(object):
+    """Preallocated minibatch buffers together with the definition of the
+    minibatch which is filled into them.
+
+    Attributes:
+        view: shallow copy of the loader which owns the buffers.
+        ready: the event which is set after the buffers have been filled.
+        failure: twisted.python.failure.Failure if the filling failed.
+        minibatch_def: (minibatch_offset, minibatch_size) tuple.
+        minibatch_class: the class of the minibatch.
+        flags: train_ended, test_ended, last_minibatch, epoch_ended values
+               at the moment the minibatch was defined.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.ready = threading.Event()
+        self.failure = None
+        self.minibatch_def = None
+        self.minibatch_class = None
+        self.flags = None
+
+
+class MinibatchPrefetcher(Logger):
+    """Fills the next minibatches of a loader in a bounded thread pool while
+    the current one is being processed by the workflow.
+
+    The minibatch definitions are taken on the workflow's thread strictly in
+    the same order as Loader.serve_next_minibatch() does, so the sequence of
+    served samples does not depend on prefetching. Each definition is bound
+    to one of the preallocated slots; fill_minibatch(), normalize_minibatch()
+    and map_minibatch_labels() are executed on a shallow copy of the loader
+    ("view") whose minibatch arrays point to the slot buffers. serve() copies
+    the ready slot into the loader's own arrays, since they may be already
+    bound to device buffers by the other units.
+
+    Attributes:
+        loader: the owning loader.
+        depth: the number of slots (maximal number of minibatches in flight).
+        stall_time: the total time spent in serve() waiting for the workers.
+        average_depth: the mean number of ready minibatches in serve().
+    """
+
+    def __init__(self, loader, depth, workers):
+        super(MinibatchPrefetcher, self).__init__()
+        self.loader = loader
+        self.depth = depth
+        self.stall_time = 0.0
+        self._served = 0
+        self._ready_sum = 0
+        self._queue = deque()
+        self._free = [PrefetchSlot(self._create_view(i))
+                      for i in range(depth)]
+        self._pool = ThreadPool(
+            name="prefetch", minthreads=workers, maxthreads=workers,
+            workflow=loader.workflow)
+        # The state which the loader would have after serving the defined
+        # minibatches, see Loader._advance_global_offset()
+        self._minibatch_class = loader.minibatch_class
+        self._train_ended = bool(loader.train_ended)
+        self._test_ended = bool(loader.test_ended)
+        self.info("Will prefetch %d minibatches using %d threads", depth,
+                  workers)
+
+    @property
+    def pending_minibatches(self):
+        """
+        :return: The definitions of the minibatches which were taken but not
+        served yet, in the order of serving.
+        """
+        return [slot.minibatch_def for slot in self._queue]
+
+    @property
+    def average_depth(self):
+        if self._served == 0:
+            return 0
+        return self._ready_sum / self._served
+
+    def serve(self):
+        """Sets the next prefetched minibatch to the loader. Blocks if it has
+        not been filled yet.
+        """
+        self._top_up()
+        slot = self._queue.popleft()
+        self._ready_sum += sum(1 for s in self._queue if s.ready.is_set())
+        if slot.ready.is_set():
+            self._ready_sum += 1
+        else:
+            start = time.time()
+            slot.ready.wait()
+            self.stall_time += time.time() - start
+        self._served += 1
+        if slot.failure is not None:
+            failure = slot.failure
+            slot.failure = None
+            self._release(slot)
+            failure.raiseException()
+        self.loader._serve_prefetched_minibatch(slot)
+        self._release(slot)
+        self._top_up()
+
+    def shutdown(self):
+        self._pool.shutdown(execute_remaining=False)
+
+    def _create_view(self, index):
+        loader = self.loader
+        view = object.__new__(type(loader))
+        view.__dict__.update(loader.__dict__)
+        # Unit.__del__() removes Unit.timers[self.id]
+        view._id = "%s@prefetch%d" % (loader.id, index)
+        for name in loader.prefetched_arrays:
+            mem = getattr(loader, name).mem
+            setattr(view, name, memory.Array(
+                numpy.zeros_like(mem) if mem is not None else None,
+                shallow_pickle=True))
+        view._raw_minibatch_labels = [None] * loader.max_minibatch_size
+        return view
+
+    def _release(self, slot):
+        slot.ready.clear()
+        self._free.append(slot)
+
+    def _top_up(self):
+        while len(self._free) > 0:
+            slot = self._free.pop()
+            self._define(slot)
+            self._queue.append(slot)
+            if not self._pool.started:
+                self._pool.start()
+            self._pool.callInThreadWithCallback(
+                partial(self._on_filled, slot), self._fill, slot)
+
+    def _define(self, slot):
+        """Takes the next minibatch definition as
+        Loader.serve_next_minibatch() does, but without changing the state
+        which is visible to the other units.
+        """
+        loader = self.loader
+        try:
+            minibatch_def = loader.failed_minibatches.pop()
+        except IndexError:
+            self._minibatch_class, minibatch_size = \
+                loader._step_global_offset()
+            minibatch_def = loader.global_offset, minibatch_size
+            self._train_ended, self._test_ended = loader._calc_ended_flags()
+        slot.minibatch_def = minibatch_def
+        slot.minibatch_class = self._minibatch_class
+        slot.flags = (self._train_ended, self._test_ended) + \
+            loader._calc_flags(self._minibatch_class)
+        offset, size = minibatch_def
+        loader.shuffled_indices.map_read()
+        slot.view.minibatch_indices.mem[:size] = \
+            loader.shuffled_indices.mem[offset - size:offset]
+
+    @staticmethod
+    def _fill(slot):
+        view = slot.view
+        view._minibatch_offset_, view._minibatch_size_ = slot.minibatch_def
+        view._minibatch_class = slot.minibatch_class
+        view.prepare_minibatch()
+
+    @staticmethod
+    def _on_filled(slot, success, result):
+        if not success:
+            slot.failure = result
+        slot.ready.set()
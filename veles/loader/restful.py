@@ -34,9 +34,11 @@ under the License.
 ███████████████████████████████████████████████████████████████████████████████
 """
 
-import numpy
+from collections import deque
 import threading
-from twisted.internet.task import LoopingCall
+import time
+
+import numpy
 from zope.interface import implementer
 
 from veles.loader.base import Loader, ILoader, TEST, TRAIN, VALID
@@ -48,14 +50,68 @@ class NotFeededError(Exception):
     pass
 
 
+class FeedBuffer(object):
+    """
+    Minibatch which accumulates the fed samples and the corresponding
+    requests before it is passed to the workflow.
+    """
+
+    def __init__(self, shape, dtype):
+        self.data = numpy.zeros(shape, dtype)
+        self.requests = [None] * shape[0]
+        self.size = 0
+        self.started = None
+
+    @property
+    def full(self):
+        return self.size == len(self.requests)
+
+    def append(self, sample, request):
+        if self.size == 0:
+            self.started = time.time()
+        self.data[self.size] = sample
+        self.requests[self.size] = request
+        self.size += 1
+
+    def reset(self):
+        self.requests[:self.size] = (None,) * self.size
+        self.size = 0
+        self.started = None
+
+
 @implementer(ILoader)
 class RestfulLoader(Loader):
+    """
+    Serves the minibatches of the samples which are fed by
+    :class:`veles.restful_api.RESTfulAPI`.
+
+    The samples are accumulated in one of the feed buffers while the
+    workflow computes the previous minibatch. A buffer is passed to the
+    workflow when it is full or when its first request has waited for the
+    flush deadline. The deadline is max_response_time minus the observed
+    time the workflow takes to process a minibatch, so that the requests are
+    batched as much as possible while still being answered in
+    max_response_time.
+
+    Attributes:
+        max_response_time: the target latency of the responses in seconds.
+        buffers: the maximal number of the feed buffers. If all of them are
+                 full, feed() raises NotFeededError.
+        compute_time: the average time the workflow takes to process a
+                      minibatch.
+        flushes: the number of minibatches flushed because the buffer was
+                 full ("size"), the deadline expired ("deadline") or flush()
+                 was called ("forced").
+    """
     MAPPING = "restful"
+    #: The smoothing factor of compute_time
+    COMPUTE_TIME_ALPHA = 0.3
 
     def __init__(self, workflow, **kwargs):
         super(RestfulLoader, self).__init__(workflow, **kwargs)
         self.complete = Bool(False)
         self.max_response_time = kwargs.get("max_response_time", 0.1)
+        self.buffers = kwargs.get("buffers", 2)
         self._requests = []
 
     def init_unpickled(self):
@@ -63,8 +119,14 @@ class RestfulLoader(Loader):
         self._event_ = threading.Event()
         self._event_.clear()
         self._lock_ = threading.Lock()
-        self._flusher_ = LoopingCall(self.locked_flush)
-        self._minibatch_size_ = 0
+        self._free_buffers_ = []
+        self._ready_buffers_ = deque()
+        self._buffer_ = None
+        self._buffers_count_ = 0
+        self._compute_time_ = 0.0
+        self._served_time_ = None
+        self._stopped_ = False
+        self._flushes_ = {"size": 0, "deadline": 0, "forced": 0}
 
     @property
     def max_response_time(self):
@@ -80,10 +142,47 @@ class RestfulLoader(Loader):
             raise ValueError("max_response_time must be >= 0 (got %s)" % value)
         self._max_response_time = value
 
+    @property
+    def buffers(self):
+        return self._buffers
+
+    @buffers.setter
+    def buffers(self, value):
+        if not isinstance(value, int):
+            raise TypeError("buffers must be an integer (got %s)" %
+                            type(value))
+        if value < 1:
+            raise ValueError("buffers must be > 0 (got %d)" % value)
+        self._buffers = value
+
     @property
     def requests(self):
         return self._requests
 
+    @property
+    def flushes(self):
+        return self._flushes_
+
+    @property
+    def compute_time(self):
+        return self._compute_time_
+
+    @property
+    def flush_deadline(self):
+        """
+        :return: How long the first request in the feed buffer may wait
+                 before the buffer is passed to the workflow.
+        """
+        return max(0.0, self.max_response_time - self.compute_time)
+
+    @property
+    def queued_minibatches(self):
+        """
+        :return: The number of the full feed buffers which wait for the
+                 workflow.
+        """
+        return len(self._ready_buffers_)
+
     def reset_normalization(self):
         pass
 
@@ -92,42 +191,121 @@ class RestfulLoader(Loader):
         self.class_lengths[TRAIN] = self.class_lengths[VALID] = 0
         del self._requests[:]
         self._requests.extend((None,) * self.max_minibatch_size)
-        self._flusher_.start(self.max_response_time)
 
     def create_minibatch_data(self):
         self.minibatch_data.reset(numpy.zeros(
-            self._minibatch_data_shape, dtype=self.dtype))
+            (self.max_minibatch_size,) + self._minibatch_data_shape[1:],
+            dtype=self.dtype))
 
     def fill_minibatch(self):
-        self._minibatch_size_ = 0
-        try:
-            self._event_.wait()
-        finally:
+        now = time.time()
+        if self._served_time_ is not None:
+            self._compute_time_ += self.COMPUTE_TIME_ALPHA * (
+                now - self._served_time_ - self._compute_time_)
+        while True:
+            with self._lock_:
+                if self._stopped_:
+                    return
+                buffer, timeout = self._take_buffer()
+            if buffer is not None:
+                break
+            self._event_.wait(timeout)
             self._event_.clear()
+        size = buffer.size
+        self.minibatch_data.mem[:size] = buffer.data[:size]
+        self._requests[:size] = buffer.requests[:size]
+        self._requests[size:] = (None,) * (len(self._requests) - size)
+        self.minibatch_size = size
+        buffer.reset()
+        with self._lock_:
+            self._free_buffers_.append(buffer)
+        self._served_time_ = time.time()
 
     def stop(self):
-        self._flusher_.stop()
+        with self._lock_:
+            self._stopped_ = True
         self._event_.set()
+        super(RestfulLoader, self).stop()
 
     def feed(self, obj, request):
+        """
+        Adds the sample to the current minibatch. Can be called from any
+        thread.
+        """
         assert isinstance(obj, numpy.ndarray)
+        sample = self._feed(obj, request)
         with self._lock_:
-            self._feed(obj, request)
-            self.requests[self._minibatch_size_] = request
-            self._minibatch_size_ += 1
-            if self._minibatch_size_ == self.max_minibatch_size:
-                self.flush()
+            buffer = self._get_feed_buffer()
+            buffer.append(sample, request)
+            if buffer.full:
+                self._flushes_["size"] += 1
+                self._ready_buffers_.append(buffer)
+                self._buffer_ = None
+            elif buffer.size > 1:
+                return
+        self._event_.set()
 
-    def locked_flush(self):
+    def flush(self):
+        """
+        Passes the current feed buffer to the workflow without waiting for
+        the deadline.
+        """
         with self._lock_:
-            self.flush()
+            if self._buffer_ is None or self._buffer_.size == 0:
+                return
+            self._flushes_["forced"] += 1
+            self._ready_buffers_.append(self._buffer_)
+            self._buffer_ = None
+        self._event_.set()
 
-    def flush(self):
-        if self._minibatch_size_ > 0:
-            self._event_.set()
+    def get_metric_values(self):
+        values = super(RestfulLoader, self).get_metric_values()
+        values["Flushes"] = dict(self.flushes)
+        values["Compute time"] = self.compute_time
+        return values
+
+    def get_metric_names(self):
+        names = super(RestfulLoader, self).get_metric_names()
+        names.update(("Flushes", "Compute time"))
+        return names
 
     def _feed(self, obj, request):
-        self.minibatch_data.mem[self._minibatch_size_] = obj
+        """
+        :return: The sample to put into the minibatch.
+        """
+        return obj
+
+    def _get_feed_buffer(self):
+        if self._buffer_ is not None:
+            return self._buffer_
+        if len(self._free_buffers_) > 0:
+            self._buffer_ = self._free_buffers_.pop()
+        elif self._buffers_count_ < self.buffers:
+            self._buffer_ = FeedBuffer(self.minibatch_data.shape,
+                                       self.minibatch_data.dtype)
+            self._buffers_count_ += 1
+        else:
+            raise NotFeededError(
+                "All %d feed buffers are waiting for the workflow" %
+                self.buffers)
+        return self._buffer_
+
+    def _take_buffer(self):
+        """
+        :return: The buffer to pass to the workflow (or None) and for how
+                 long to wait for it otherwise.
+        """
+        if len(self._ready_buffers_) > 0:
+            return self._ready_buffers_.popleft(), None
+        buffer = self._buffer_
+        if buffer is None or buffer.size == 0:
+            return None, None
+        remaining = buffer.started + self.flush_deadline - time.time()
+        if remaining > 0:
+            return None, remaining
+        self._flushes_["deadline"] += 1
+        self._buffer_ = None
+        return buffer, None
 
 
 class RestfulImageLoader(RestfulLoader, ImageLoader):
@@ -163,5 +341,5 @@ class RestfulImageLoader(RestfulLoader, ImageLoader):
     def _feed(self, data, request):
         color = request.get("color_space", self.color_space)
         bbox = ImageLoader.get_image_bbox(self, None, data.shape[:2])
-        self.minibatch_data.mem[self._minibatch_size_], _, _ = \
-            self.preprocess_image(data, color, True, bbox)
+        sample, _, _ = self.preprocess_image(data, color, True, bbox)
+        return sample
@@ -39,16 +39,21 @@ import bz2
 import gzip
 from io import SEEK_END
 import os
+import threading
 
 import numpy
 from six import BytesIO
 import snappy
 from zope.interface import implementer
 
-from veles import error
+from veles import block_codec, error
+from veles.block_codec import BlockFile
 from veles.compat import from_none, lzma
 from veles.config import root
 from veles.loader.base import Loader, ILoader, CLASS_NAME, TRAIN
+from veles.loader.minibatches_file import MinibatchesFileReader, \
+    MinibatchesFileWriter, is_minibatches_file
+from veles.lru_cache import LRUCache
 from veles.pickle2 import pickle, best_protocol
 from veles.snapshotter import SnappyFile
 from veles.units import Unit, IUnit
@@ -67,14 +72,25 @@ if not hasattr(gzip, "decompress"):
 
 @implementer(IUnit)
 class MinibatchesSaver(Unit):
-    """Saves data from Loader to pickle file.
+    """Saves data from Loader to the file which can be read by
+    MinibatchesLoader.
+
+    Attributes:
+        file_format: "mmap" to write the random access format (see
+                     veles.loader.minibatches_file) or "chunks" to write the
+                     pickled chunks stream.
+        block_size: the number of samples in each compressed block of the
+                    "mmap" format.
     """
     CODECS = {
         "raw": lambda f, _: f,
         "snappy": lambda f, _: SnappyFile(f, "wb"),
         "gz": lambda f, l: gzip.GzipFile(None, fileobj=f, compresslevel=l),
         "bz2": lambda f, l: bz2.BZ2File(f, compresslevel=l),
-        "xz": lambda f, l: lzma.LZMAFile(f, preset=l)
+        "xz": lambda f, l: lzma.LZMAFile(f, preset=l),
+        "pgz": lambda f, l: BlockFile(f, "wb", "gz", l),
+        "pbz2": lambda f, l: BlockFile(f, "wb", "bz2", l),
+        "pxz": lambda f, l: BlockFile(f, "wb", "xz", l)
     }
 
     def __init__(self, workflow, **kwargs):
@@ -83,9 +99,14 @@ class MinibatchesSaver(Unit):
         self.file_name = os.path.abspath(kwargs.get(
             "file_name", os.path.join(root.common.dirs.cache,
                                       "minibatches.dat")))
-        self.compression = kwargs.get("compression", "snappy")
+        self.file_format = kwargs.get("file_format", "mmap")
+        if self.file_format not in ("mmap", "chunks"):
+            raise ValueError("Unknown file format: %s" % self.file_format)
+        self.compression = kwargs.get(
+            "compression", "raw" if self.file_format == "mmap" else "snappy")
         self.compression_level = kwargs.get("compression_level", 9)
         self.class_chunk_sizes = kwargs.get("class_chunk_sizes", (0, 0, 1))
+        self.block_size = kwargs.get("block_size", 1024)
         self.offset_table = []
         self.demand(
             "minibatch_data", "minibatch_labels", "minibatch_class",
@@ -95,6 +116,7 @@ class MinibatchesSaver(Unit):
     def init_unpickled(self):
         super(MinibatchesSaver, self).init_unpickled()
         self._file_ = None
+        self._writer_ = None
 
     @property
     def file(self):
@@ -118,6 +140,16 @@ class MinibatchesSaver(Unit):
             raise error.VelesException(
                 "You must disable shuffling in your loader (set shuffle_limit "
                 "to 0)")
+        if self.file_format == "mmap":
+            self._writer_ = MinibatchesFileWriter(
+                self.file_name, self.class_lengths,
+                self.minibatch_data.shape[1:], self.minibatch_data.dtype,
+                self.minibatch_labels.shape[1:] if self.has_labels else None,
+                self.minibatch_labels.dtype if self.has_labels else None,
+                self.labels_mapping, self.compression, self.compression_level,
+                self.block_size)
+            self._writer_.open()
+            return
         self._file_ = open(self.file_name, "wb")
         pickle.dump(self.get_header_data(), self.file, protocol=best_protocol)
 
@@ -149,6 +181,9 @@ class MinibatchesSaver(Unit):
             prepared[1][:] = self.minibatch_labels[interval[0]:interval[1]]
 
     def run(self):
+        if self._writer_ is not None:
+            self.write_samples()
+            return
         prepared = self.prepare_chunk_data()
         chunk_size = self.effective_class_chunk_sizes[self.minibatch_class]
         chunks_number = int(numpy.ceil(self.max_minibatch_size / chunk_size))
@@ -161,7 +196,21 @@ class MinibatchesSaver(Unit):
             pickle.dump(prepared, file, protocol=best_protocol)
             file.flush()
 
+    def write_samples(self):
+        if self._writer_.is_full:
+            return
+        self.minibatch_data.map_read()
+        self.minibatch_labels.map_read()
+        size = self.minibatch_size
+        self._writer_.write(
+            self.minibatch_data.mem[:size],
+            self.minibatch_labels.mem[:size] if self.has_labels else None)
+
     def stop(self):
+        if self._writer_ is not None:
+            self._writer_.close()
+            self.info("Wrote %s", self.file_name)
+            return
         if self.file.closed:
             return
         pos = self.file.tell()
@@ -171,6 +220,16 @@ class MinibatchesSaver(Unit):
         self.info("Wrote %s", self.file_name)
 
 
+def chunk_nbytes(chunk):
+    """
+    :return: The size of the decoded chunk (data and labels tuple) or of the
+             decompressed block (numpy array) in bytes.
+    """
+    if isinstance(chunk, tuple):
+        return sum(arr.nbytes for arr in chunk if arr is not None)
+    return chunk.nbytes
+
+
 def decompress_snappy(data):
     bio_in = BytesIO(data)
     bio_out = BytesIO()
@@ -180,6 +239,14 @@ def decompress_snappy(data):
 
 @implementer(ILoader)
 class MinibatchesLoader(Loader):
+    """Loads the minibatches written by MinibatchesSaver. Both the random
+    access ("mmap") and the pickled chunks formats are supported.
+
+    Attributes:
+        cache_size: the maximal size in bytes of the decompressed chunks
+                    (or compressed blocks of the "mmap" format) which are kept
+                    in memory. 0 disables caching.
+    """
 
     CODECS = {
         "raw": lambda b: b,
@@ -187,13 +254,17 @@ class MinibatchesLoader(Loader):
         "gz": gzip.decompress,
         "bz2": bz2.decompress,
         "xz": lzma.decompress,
+        "pgz": block_codec.decompress,
+        "pbz2": block_codec.decompress,
+        "pxz": block_codec.decompress,
     }
     MAPPING = "minibatches_loader"
 
     def __init__(self, workflow, **kwargs):
         super(MinibatchesLoader, self).__init__(workflow, **kwargs)
         self.file_name = kwargs["file_name"]
-        self._file_ = None
+        self.cache_size = kwargs.get(
+            "cache_size", root.common.loader.minibatches_cache_size)
         self.offset_table = []
         self.chunk_numbers = None
         self.mb_chunk_numbers = None
@@ -204,11 +275,82 @@ class MinibatchesLoader(Loader):
         self.minibatch_labels_dtype = None
         self.decompress = None
 
+    def init_unpickled(self):
+        super(MinibatchesLoader, self).init_unpickled()
+        self._file_ = None
+        # Prefetching views share the file
+        self._file_lock_ = threading.Lock()
+        self._reader_ = None
+        self._cache_ = None
+
     @property
     def file(self):
         return self._file_
 
+    @property
+    def reader(self):
+        """
+        :return: MinibatchesFileReader instance if the file has "mmap" format
+                 or None.
+        """
+        return self._reader_
+
+    @property
+    def cache(self):
+        """
+        :return: veles.lru_cache.LRUCache with the decompressed chunks or
+                 None if caching is disabled.
+        """
+        return self._cache_
+
+    @property
+    def dataset_files(self):
+        return self.file_name,
+
+    def get_metric_names(self):
+        names = super(MinibatchesLoader, self).get_metric_names()
+        if self.cache is not None:
+            names.update(("Chunks cache hits", "Chunks cache misses"))
+        return names
+
+    def get_metric_values(self):
+        values = super(MinibatchesLoader, self).get_metric_values()
+        if self.cache is not None:
+            values["Chunks cache hits"] = self.cache.hits
+            values["Chunks cache misses"] = self.cache.misses
+        return values
+
     def load_data(self):
+        self._cache_ = LRUCache(self.cache_size, size_of=chunk_nbytes) \
+            if self.cache_size > 0 else None
+        if is_minibatches_file(self.file_name):
+            self.open_reader()
+        else:
+            self.load_chunks_table()
+        if self.class_lengths[TRAIN] == 0:
+            assert self.normalization_type == "none", \
+                "You specified \"%s\" normalization but there are no train " \
+                "samples to analyze." % self.normalization_type
+            self.normalizer.analyze(self.minibatch_data.mem)
+
+    def open_reader(self):
+        reader = self._reader_ = MinibatchesFileReader(
+            self.file_name, self.cache)
+        self.class_lengths[:] = reader.class_lengths
+        self.minibatch_data_shape = (reader.total_samples,) + \
+            reader.sample_shape
+        self.minibatch_data_dtype = reader.sample_dtype
+        if reader.has_labels:
+            self.minibatch_labels_shape = (reader.total_samples,) + \
+                reader.label_shape
+            self.minibatch_labels_dtype = reader.label_dtype
+        self._has_labels = reader.has_labels
+        self._labels_mapping = reader.labels_mapping
+        self._reversed_labels_mapping[:] = sorted(self.labels_mapping)
+        self.info("Opened %s (%s compression)", self.file_name,
+                  reader.compression)
+
+    def load_chunks_table(self):
         self._file_ = open(self.file_name, "rb")
         (codec, class_lengths, self.old_max_minibatch_size,
          self.class_chunk_lengths,
@@ -250,11 +392,6 @@ class MinibatchesLoader(Loader):
         # Virtual end
         self.offset_table.append(self.file.tell() - bm.size)
         self.debug("Offsets: %s", self.offset_table)
-        if self.class_lengths[TRAIN] == 0:
-            assert self.normalization_type == "none", \
-                "You specified \"%s\" normalization but there are no train " \
-                "samples to analyze." % self.normalization_type
-            self.normalizer.analyze(self.minibatch_data.mem)
 
     def create_minibatch_data(self):
         self.minibatch_data.reset(numpy.zeros(
@@ -262,6 +399,37 @@ class MinibatchesLoader(Loader):
             dtype=self.minibatch_data_dtype))
 
     def fill_minibatch(self):
+        indices = self.minibatch_indices.mem[:self.minibatch_size]
+        if self.reader is not None:
+            self.reader.read(
+                indices, self.minibatch_data.mem,
+                self.minibatch_labels.mem if self.has_labels else None)
+            return
+        chunk_numbers, chunk_offsets = self.get_addresses(indices)
+        # Read each chunk only once
+        order = numpy.argsort(chunk_numbers, kind="mergesort")
+        chunk_numbers = chunk_numbers[order]
+        bounds = numpy.nonzero(numpy.diff(chunk_numbers))[0] + 1
+        for start, group in zip(numpy.concatenate(([0], bounds)),
+                                numpy.split(order, bounds)):
+            mb_data, mb_labels = self.read_chunk(chunk_numbers[start])
+            offsets = chunk_offsets[group]
+            self.minibatch_data.mem[group] = mb_data[offsets]
+            if self.has_labels:
+                self.minibatch_labels.mem[group] = mb_labels[offsets]
+
+    def fill_minibatch_by_samples(self):
+        """Reference implementation of fill_minibatch() which resolves the
+        address of each sample separately.
+        """
+        if self.reader is not None:
+            data = self.minibatch_data.mem
+            labels = self.minibatch_labels.mem if self.has_labels else None
+            for i in range(self.minibatch_size):
+                self.reader.read(
+                    self.minibatch_indices.mem[i:i + 1], data[i:i + 1],
+                    labels[i:i + 1] if labels is not None else None)
+            return
         chunks_map = [
             self.get_address(sample) + (i,) for i, sample in
             enumerate(self.minibatch_indices.mem[:self.minibatch_size])]
@@ -271,15 +439,25 @@ class MinibatchesLoader(Loader):
         for chunk_number, chunk_offset, index in chunks_map:
             if prev_chunk_number != chunk_number:
                 prev_chunk_number = chunk_number
-                self.file.seek(self.offset_table[chunk_number])
-                buffer = self.file.read(self.offset_table[chunk_number + 1] -
-                                        self.offset_table[chunk_number])
-                chunk = pickle.loads(self.decompress(buffer))
+                chunk = self.read_chunk(chunk_number)
             mb_data, mb_labels = chunk
             self.minibatch_data[index] = mb_data[chunk_offset]
             if self.has_labels:
                 self.minibatch_labels[index] = mb_labels[chunk_offset]
 
+    def read_chunk(self, chunk_number):
+        if self.cache is not None:
+            return self.cache.get(
+                chunk_number, lambda: self.decode_chunk(chunk_number))
+        return self.decode_chunk(chunk_number)
+
+    def decode_chunk(self, chunk_number):
+        with self._file_lock_:
+            self.file.seek(self.offset_table[chunk_number])
+            buffer = self.file.read(self.offset_table[chunk_number + 1] -
+                                    self.offset_table[chunk_number])
+        return pickle.loads(self.decompress(buffer))
+
     def map_minibatch_labels(self):
         # Already done in fill_minibatch()
         pass
@@ -293,4 +471,66 @@ class MinibatchesLoader(Loader):
         mb_ind, mb_off = divmod(class_offset, self.old_max_minibatch_size)
         chunk_number += mb_ind * mb_chunks
         mb_ind, mb_off = divmod(mb_off, chunk_length)
-        return chunk_number, mb_off
+        return chunk_number + mb_ind, mb_off
+
+    def get_addresses(self, indices):
+        """Vectorized version of get_address().
+
+        :param indices: numpy array with global sample indices.
+        :return: tuple of two numpy arrays: chunk numbers and offsets inside
+                 the chunks.
+        """
+        class_indices, class_remainders = \
+            self.class_indices_by_sample_indices(indices)
+        chunk_lengths = numpy.array(self.class_chunk_lengths)[class_indices]
+        chunk_bases = numpy.cumsum([0] + self.chunk_numbers[:-1])
+        class_offsets = \
+            numpy.array(self.class_lengths)[class_indices] - class_remainders
+        mb_chunks = (self.old_max_minibatch_size + chunk_lengths - 1) // \
+            chunk_lengths
+        mb_inds = class_offsets // self.old_max_minibatch_size
+        mb_offs = class_offsets % self.old_max_minibatch_size
+        chunk_inds = mb_offs // chunk_lengths
+        chunk_offs = mb_offs % chunk_lengths
+        return (chunk_bases[class_indices] + mb_inds * mb_chunks + chunk_inds,
+                chunk_offs)
+
+
+def convert_chunks_file(src, dst, compression="raw", compression_level=9,
+                        block_size=1024):
+    """Converts the file in the pickled chunks format to the random access
+    format (see veles.loader.minibatches_file).
+
+    :param src: the path to the existing file written by MinibatchesSaver
+                with file_format="chunks".
+    :param dst: the path to the output file.
+    :return: the number of converted samples.
+    """
+    from veles.dummy import DummyWorkflow
+
+    with DummyWorkflow() as workflow:
+        loader = MinibatchesLoader(workflow, file_name=src, shuffle_limit=0)
+        loader.initialize()
+        if loader.reader is not None:
+            raise ValueError("%s already has the random access format" % src)
+        writer = MinibatchesFileWriter(
+            dst, loader.class_lengths, loader.minibatch_data.shape[1:],
+            loader.minibatch_data.dtype,
+            loader.minibatch_labels.shape[1:] if loader.has_labels else None,
+            loader.minibatch_labels.dtype if loader.has_labels else None,
+            loader.labels_mapping, compression, compression_level, block_size)
+        writer.open()
+        size = loader.max_minibatch_size
+        for start in range(0, loader.total_samples, size):
+            count = min(size, loader.total_samples - start)
+            loader.minibatch_indices.mem[:count] = numpy.arange(
+                start, start + count, dtype=loader.minibatch_indices.dtype)
+            loader.minibatch_size = count
+            loader.fill_minibatch()
+            writer.write(
+                loader.minibatch_data.mem[:count],
+                loader.minibatch_labels.mem[:count]
+                if loader.has_labels else None)
+        writer.close()
+        loader.file.close()
+        return writer.count
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 9, 2015
+
+Least recently used cache limited by the total size of the values.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache(object):
+    """Maps keys to values, evicting the least recently used items when the
+    total size of the values exceeds max_size. Thread safe.
+
+    Attributes:
+        max_size: the maximal total size of the cached values.
+        size_of: the function which returns the size of a value.
+        ttl: if not None, the items expire after this number of seconds
+             since they were put.
+        size: the current total size of the cached values.
+        hits: the number of get() and find() calls which found the key.
+        misses: the number of get() and find() calls which did not find the
+                key (including the expired items).
+        expired: the number of the items which were dropped because they
+                 expired.
+    """
+
+    def __init__(self, max_size, size_of=len, ttl=None):
+        self.max_size = max_size
+        self.size_of = size_of
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        item = self._items.get(key)
+        return item is not None and not self._is_expired(item)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total > 0 else 0.0
+
+    def get(self, key, factory):
+        """Returns the cached value or calls factory() and caches its result.
+        factory() is executed outside of the lock.
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+        if found:
+            return value
+        value = factory()
+        self.put(key, value)
+        return value
+
+    def find(self, key, default=None):
+        """Returns the cached value or default if there is no such key.
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+        return value if found else default
+
+    def put(self, key, value):
+        size = self.size_of(value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= self.size_of(old[0])
+            self._items[key] = (value, time.time())
+            self.size += size
+            while self.size > self.max_size:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self.size -= self.size_of(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def _is_expired(self, item):
+        return self.ttl is not None and time.time() - item[1] > self.ttl
+
+    def _lookup(self, key):
+        """Must be called under the lock.
+        :return: True and the value if the key was found; otherwise, False
+        and None.
+        """
+        item = self._items.pop(key, None)
+        if item is not None and self._is_expired(item):
+            self.size -= self.size_of(item[0])
+            self.expired += 1
+            item = None
+        if item is None:
+            self.misses += 1
+            return False, None
+        self._items[key] = item
+        self.hits += 1
+        return True, item[0]
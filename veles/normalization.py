@@ -35,14 +35,19 @@ under the License.
 """
 
 
+from copy import deepcopy
 import numpy
 import pickle
 from PIL import Image
 from six import add_metaclass
+from six.moves import queue
+import threading
 from zope.interface import implementer, Interface
 
 from veles.compat import from_none
+from veles.logger import Logger
 from veles.numpy_ext import reshape, transpose, assert_addr
+from veles.thread_pool import ThreadPool
 from veles.verified import Verified
 from veles.mapped_object_registry import MappedObjectsRegistry
 
@@ -106,6 +111,16 @@ class INormalizer(Interface):
         :return: The recalculated normalization coefficients.
         """
 
+    def _merge(state):
+        """
+        Combines the internal state with the partial state of another
+        normalizer of the same type which analyzed a different part of the
+        data. The result must be the same as if all the data was passed into
+        analyze() of this instance. This method is protected and should not be
+        called by users, see :meth:`NormalizerBase.merge()`.
+        :param state: The state of the other normalizer (dict).
+        """
+
 
 class NormalizerRegistry(MappedObjectsRegistry):
     """Metaclass to record Unit descendants. Used for introspection and
@@ -156,13 +171,48 @@ class NormalizerBase(Verified):
         if state is not None:
             if not isinstance(state, dict):
                 raise TypeError("state must be a dictionary")
-            self.__dict__.update(state)
+            self.__dict__.update(self._upgrade_state(state))
+            self._restore_cache()
             self._initialized = True
 
     def analyze_and_normalize(self, data):
         self.analyze(data)
         self.normalize(data)
 
+    def merge(self, other):
+        """
+        Combines the analysis results of another normalizer of the same type
+        into this one. Thus analyze() can be executed on separate shards of
+        the data (in parallel or on different machines) and the partial
+        states can be merged afterwards.
+        :param other: Either the normalizer or its state (dict).
+        """
+        if isinstance(other, NormalizerBase):
+            if type(other) is not type(self):
+                raise TypeError("Cannot merge %s into %s" % (
+                    type(other).__name__, type(self).__name__))
+            if not other.is_initialized:
+                return
+            other = other.state
+        elif not isinstance(other, dict):
+            raise TypeError(
+                "other must be either a normalizer or a state dictionary "
+                "(got %s)" % type(other))
+        if not self._initialized:
+            self.state = deepcopy(other)
+            return
+        self._merge(other)
+
+    def partial(self):
+        """
+        :return: A new uninitialized normalizer with the same parameters
+                 which can analyze a shard of the data to be merged back with
+                 :meth:`merge()`.
+        """
+        clone = deepcopy(self)
+        clone.reset()
+        return clone
+
     @property
     def state(self):
         """
@@ -178,7 +228,8 @@ class NormalizerBase(Verified):
             raise TypeError(
                 "state must be a dictionary (got %s)" % type(value))
         self._initialized = False
-        self.__dict__.update(value)
+        self.__dict__.update(self._upgrade_state(value))
+        self._restore_cache()
         self._initialized = True
 
     @property
@@ -205,6 +256,7 @@ class NormalizerBase(Verified):
         return state
 
     def __setstate__(self, state):
+        state = self._upgrade_state(state)
         self.__dict__.update(state)
         super(NormalizerBase, self).__setstate__(state)
         initialized = self._initialized
@@ -256,6 +308,45 @@ class NormalizerBase(Verified):
                 if k not in ("_initialized", "_cache", "_logger_")
                 and not hasattr(v, "__call__")}
 
+    def _upgrade_state(self, state):
+        """
+        Converts the state saved by the older versions of the class.
+        """
+        return state
+
+    def _restore_cache(self):
+        """
+        Recreates the cached values after the state was assigned.
+        """
+        pass
+
+    def _merge(self, state):
+        raise NotImplementedError(
+            "%s does not support merging" % type(self).__name__)
+
+    @staticmethod
+    def _merge_mean(mean, count, other_mean, other_count):
+        """
+        Chan's parallel update of the running mean, stable with regard to
+        float saturation, unlike summing everything up.
+        :return: The merged count.
+        """
+        total = count + other_count
+        if other_count > 0:
+            mean += (other_mean - mean) * (float(other_count) / total)
+        return total
+
+
+def _upgrade_sum_state(state):
+    """
+    Mean based normalizers used to store the plain sum of the samples.
+    """
+    if "_sum" not in state:
+        return state
+    state = dict(state)
+    state["_mean"] = state.pop("_sum") / max(state["_count"], 1)
+    return state
+
 
 class StatelessNormalizer(NormalizerBase):
     """
@@ -279,6 +370,9 @@ class StatelessNormalizer(NormalizerBase):
     def _calculate_coefficients(self):
         return None
 
+    def _merge(self, state):
+        pass
+
 
 @implementer(INormalizer)
 class MeanDispersionNormalizer(NormalizerBase):
@@ -292,19 +386,29 @@ class MeanDispersionNormalizer(NormalizerBase):
 
     def _initialize(self, data):
         # We force float64 to fix possible float32 saturation
-        self._sum = numpy.zeros_like(data[0], dtype=numpy.float64)
+        self._mean = numpy.zeros_like(data[0], dtype=numpy.float64)
         self._count = 0
         self._min = numpy.array(data[0])
         self._max = numpy.array(data[0])
 
     def analyze(self, data):
-        self._count += data.shape[0]
-        self._sum += numpy.sum(data, axis=0, dtype=numpy.float64)
+        self._count = self._merge_mean(
+            self._mean, self._count,
+            numpy.mean(data, axis=0, dtype=numpy.float64), data.shape[0])
         numpy.minimum(self._min, numpy.min(data, axis=0), self._min)
         numpy.maximum(self._max, numpy.max(data, axis=0), self._max)
 
+    def _merge(self, state):
+        self._count = self._merge_mean(
+            self._mean, self._count, state["_mean"], state["_count"])
+        numpy.minimum(self._min, state["_min"], self._min)
+        numpy.maximum(self._max, state["_max"], self._max)
+
+    def _upgrade_state(self, state):
+        return _upgrade_sum_state(state)
+
     def _calculate_coefficients(self):
-        return self._sum / self._count, self._max - self._min
+        return self._mean.copy(), self._max - self._min
 
     def normalize(self, data):
         mean, disp = self._calculate_coefficients()
@@ -429,6 +533,9 @@ class RangeLinearNormalizer(IntervalNormalizer):
                     "because it's %s is %f while the global %s is %f" %
                     (extr, yours, extr, mine))
 
+    def _merge(self, state):
+        self.analyze(numpy.array((state["_min"], state["_max"])))
+
     def normalize(self, data):
         orig_shape_data = data
         data, _ = NormalizerBase.prepare(data)
@@ -532,9 +639,18 @@ class PointwiseNormalizer(NormalizerBase):
         numpy.minimum(self._min, numpy.min(data, axis=0), self._min)
         numpy.maximum(self._max, numpy.max(data, axis=0), self._max)
 
+    def _merge(self, state):
+        numpy.minimum(self._min, state["_min"], self._min)
+        numpy.maximum(self._max, state["_max"], self._max)
+
+    def _restore_cache(self):
+        self._reset_cache()
+
     def __setstate__(self, state):
         super(PointwiseNormalizer, self).__setstate__(state)
         initialized = self._initialized
+        if not initialized:
+            return
         self._initialized = False
         self._reset_cache()
         self._initialized = initialized
@@ -642,15 +758,23 @@ class InternalMeanNormalizer(MeanNormalizerBase, NormalizerBase):
     MAPPING = "internal_mean"
 
     def analyze(self, data):
-        self._count += data.shape[0]
-        self._sum += numpy.sum(data, axis=0, dtype=numpy.float64)
+        self._count = self._merge_mean(
+            self._mean, self._count,
+            numpy.mean(data, axis=0, dtype=numpy.float64), data.shape[0])
 
     def _initialize(self, data):
-        self._sum = numpy.zeros_like(data[0], dtype=numpy.float64)
+        self._mean = numpy.zeros_like(data[0], dtype=numpy.float64)
         self._count = 0
 
+    def _merge(self, state):
+        self._count = self._merge_mean(
+            self._mean, self._count, state["_mean"], state["_count"])
+
+    def _upgrade_state(self, state):
+        return _upgrade_sum_state(state)
+
     def _calculate_coefficients(self):
-        return self._sum / self._count
+        return self._mean.copy()
 
     def normalize(self, data):
         data -= self._calculate_coefficients()
@@ -660,3 +784,92 @@ class InternalMeanNormalizer(MeanNormalizerBase, NormalizerBase):
         self.unapply_scale(data)
         data += self._calculate_coefficients()
         return data
+
+
+class ParallelAnalyzer(Logger):
+    """
+    Feeds the arrays to analyze() of several partial copies of the normalizer
+    in a thread pool (numpy releases the GIL in reductions) and merges the
+    partial states back into the original normalizer in flush(). Each array
+    is copied, so the caller may overwrite it right after analyze() returns.
+    With a single worker, it simply calls normalizer.analyze().
+    """
+
+    def __init__(self, normalizer, workers=1):
+        super(ParallelAnalyzer, self).__init__()
+        self.normalizer = normalizer
+        self.workers = workers
+        self._pool = None
+        if workers <= 1:
+            return
+        self._pool = ThreadPool(minthreads=1, maxthreads=workers,
+                                name="analysis")
+        self._pool.start()
+        self._partials = queue.Queue()
+        for _ in range(workers):
+            self._partials.put(normalizer.partial())
+        # Limits the number of the copied arrays in flight
+        self._slots = threading.Semaphore(workers * 2)
+        self._done = threading.Condition()
+        self._in_flight = 0
+        self._failures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+        self.close()
+
+    def analyze(self, data):
+        if self._pool is None:
+            self.normalizer.analyze(data)
+            return
+        self._raise_failure()
+        self._slots.acquire()
+        with self._done:
+            self._in_flight += 1
+        self._pool.callInThreadWithCallback(
+            self._on_analyzed, self._analyze, data.copy())
+
+    def flush(self):
+        """
+        Waits for the pending arrays and merges the partial states into the
+        original normalizer.
+        """
+        if self._pool is None:
+            return
+        with self._done:
+            while self._in_flight > 0:
+                self._done.wait()
+        self._raise_failure()
+        for _ in range(self.workers):
+            partial = self._partials.get()
+            self.normalizer.merge(partial)
+            partial.reset()
+            self._partials.put(partial)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(execute_remaining=False)
+            self._pool = None
+
+    def _analyze(self, data):
+        partial = self._partials.get()
+        try:
+            partial.analyze(data)
+        finally:
+            self._partials.put(partial)
+
+    def _on_analyzed(self, success, result):
+        with self._done:
+            if not success:
+                self._failures.append(result)
+            self._in_flight -= 1
+            self._done.notify_all()
+        self._slots.release()
+
+    def _raise_failure(self):
+        if len(self._failures) > 0:
+            self._failures.pop(0).raiseException()
@@ -33,6 +33,7 @@ under the License.
 """
 
 
+import copy
 from importlib import import_module
 from time import time
 from zope.interface import implementer
@@ -47,9 +48,15 @@ from veles.units import Unit, IUnit
 @implementer(IUnit)
 class Plotter(Unit, TriviallyDistributable):
     """Base class for all plotters.
+
+    If plot_data_attributes is not empty, the whole plotter is sent to the
+    graphics client only every keyframe_interval redraws; in between, only
+    the values of those attributes are sent (see get_plot_data()).
     """
     hide_from_registry = True
     server_shutdown_registered = False
+    plot_data_attributes = ()
+    keyframe_interval = 10
 
     MATPLOTLIB_PKG_MAPPING = {
         "matplotlib": "matplotlib",
@@ -72,6 +79,7 @@ class Plotter(Unit, TriviallyDistributable):
         super(Plotter, self).init_unpickled()
         for pkg in self.MATPLOTLIB_PKG_MAPPING:
             setattr(self, "_%s_" % pkg, None)
+        self._frames_since_keyframe_ = self.keyframe_interval
 
     @property
     def matplotlib(self):
@@ -153,6 +161,13 @@ class Plotter(Unit, TriviallyDistributable):
             return
         assert self.graphics_server is not None
         self._last_run_ = time()
+        data = self.get_plot_data() \
+            if self._frames_since_keyframe_ < self.keyframe_interval else None
+        if data is not None:
+            self._frames_since_keyframe_ += 1
+            self.graphics_server.enqueue_plot_data(self.id, data)
+            return
+        self._frames_since_keyframe_ = 0
         self.stripped_pickle = True
         self.graphics_server.enqueue(self)
         self.stripped_pickle = False
@@ -160,6 +175,30 @@ class Plotter(Unit, TriviallyDistributable):
     def fill(self):
         pass
 
+    def get_plot_data(self):
+        """
+        :return: The copies of the values of plot_data_attributes as they
+        would be in the stripped pickle or None if the whole plotter must be
+        sent.
+        """
+        if not self.plot_data_attributes:
+            return None
+        data = {}
+        for name in self.plot_data_attributes:
+            value = getattr(self, name)
+            if isinstance(value, Array):
+                value = value.mem
+            data[name] = copy.copy(value)
+        return data
+
+    def apply_plot_data(self, data):
+        """
+        Updates the plotter received by the graphics client with the result
+        of get_plot_data().
+        """
+        for name, value in data.items():
+            setattr(self, name, value)
+
     def generate_data_for_master(self):
         return True
 
@@ -85,6 +85,8 @@ class AccumulatingPlotter(Plotter):
         fit_poly_power: the approximation polynomial's power. If set to 0,
         do no approximation.
     """
+    plot_data_attributes = ("values",)
+
     def __init__(self, workflow, **kwargs):
         kwargs["name"] = kwargs.get("name", "AccumulatingPlotter")
         super(AccumulatingPlotter, self).__init__(workflow, **kwargs)
@@ -393,25 +395,30 @@ class ImagePlotter(Plotter):
     def __getstate__(self):
         state = super(ImagePlotter, self).__getstate__()
         if self.stripped_pickle:
-            pics_to_draw = []
-            for i, input_field in enumerate(self.input_fields):
-                value = None
-                if isinstance(input_field, int):
-                    if 0 <= input_field < len(self.inputs[i]):
-                        value = self.inputs[i][input_field]
-                else:
-                    value = self.inputs[i].__dict__[input_field]
-                    if isinstance(self.inputs[i], Array):
-                        value = value[0]
-                pics_to_draw.append(self._prepare_image(value)
-                                    if isinstance(value, numpy.ndarray)
-                                    else str(value))
-
             state["inputs"] = None
             state["input_fields"] = None
-            state["_pics_to_draw"] = pics_to_draw
+            state["_pics_to_draw"] = self._collect_pics()
         return state
 
+    def get_plot_data(self):
+        return {"_pics_to_draw": self._collect_pics()}
+
+    def _collect_pics(self):
+        pics_to_draw = []
+        for i, input_field in enumerate(self.input_fields):
+            value = None
+            if isinstance(input_field, int):
+                if 0 <= input_field < len(self.inputs[i]):
+                    value = self.inputs[i][input_field]
+            else:
+                value = self.inputs[i].__dict__[input_field]
+                if isinstance(self.inputs[i], Array):
+                    value = value[0]
+            pics_to_draw.append(self._prepare_image(value)
+                                if isinstance(value, numpy.ndarray)
+                                else str(value))
+        return pics_to_draw
+
     def _prepare_image(self, value):
         l = len(value.shape)
         if l == 2:
@@ -685,6 +692,8 @@ class MultiHistogram(Plotter):
         input
         input_field
     """
+    plot_data_attributes = ("value",)
+
     def __init__(self, workflow, **kwargs):
         super(MultiHistogram, self).__init__(workflow, **kwargs)
         self.limit = kwargs.get("limit", 64)
@@ -770,6 +779,8 @@ class TableMaxMin(Plotter):
     """
     Plotter for drawing histogram.
     """
+    plot_data_attributes = ("values",)
+
     def __init__(self, workflow, **kwargs):
         name = kwargs.get("name", "Table")
         kwargs["name"] = name
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 19, 2015
+
+Opt-in profiler of the units. When it is enabled, every run(),
+generate_data_for_*() and apply_data_from_*() call and every thread pool
+dispatch is recorded with its start and end timestamps, thread and unit.
+The events are appended to a ring buffer (collections.deque with maxlen, its
+append() is atomic, so no locks are taken) and can be exported as Chrome
+trace events (chrome://tracing) or in speedscope format
+(https://www.speedscope.app).
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from collections import defaultdict, deque, namedtuple
+import json
+import os
+import threading
+
+import numpy
+
+from veles.config import root
+from veles.logger import Logger
+from veles.timeit2 import perf_counter
+
+
+#: A single profiled call. start and end are perf_counter() values.
+ProfileEvent = namedtuple("ProfileEvent", (
+    "name", "category", "unit_id", "unit_name", "thread_id", "thread_name",
+    "start", "end"))
+
+#: The quantiles which are reported by Profiler.percentiles()
+PERCENTILES = (50, 95, 99)
+
+
+class Profiler(Logger):
+    """
+    Records the profiling events into the ring buffer of the specified
+    capacity, so that the oldest events are overwritten in long runs.
+    """
+    clock = staticmethod(perf_counter)
+
+    def __init__(self, capacity=None):
+        super(Profiler, self).__init__()
+        self.enabled = False
+        self._origin = self.clock()
+        self._events = deque(maxlen=capacity or
+                             root.common.profiling.capacity)
+
+    @property
+    def capacity(self):
+        return self._events.maxlen
+
+    @property
+    def events(self):
+        """
+        :return: The copy of the recorded events, the oldest first.
+        """
+        while True:
+            try:
+                return list(self._events)
+            except RuntimeError:
+                # deque mutated during iteration
+                continue
+
+    def __len__(self):
+        return len(self._events)
+
+    def enable(self, capacity=None):
+        if capacity is not None and capacity != self.capacity:
+            self._events = deque(self._events, maxlen=capacity)
+        self.enabled = True
+        self.debug("Enabled (capacity %d events)", self.capacity)
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._events.clear()
+        self._origin = self.clock()
+
+    def record(self, name, category, start, end, unit=None):
+        """
+        Adds the event to the ring buffer. Thread safe.
+        :param name: The name of the profiled call, e.g. "run".
+        :param category: The kind of the call, "unit" or "dispatch".
+        :param start: The clock() value at the start of the call.
+        :param end: The clock() value at the end of the call.
+        :param unit: The unit which the call belongs to or None.
+        """
+        thread = threading.current_thread()
+        if unit is not None:
+            unit_id, unit_name = unit.id, unit.name
+        else:
+            unit_id = unit_name = None
+        self._events.append(ProfileEvent(
+            name, category, unit_id, unit_name, thread.ident, thread.name,
+            start, end))
+
+    def dispatched(self, func):
+        """
+        Wraps the function which is queued to the thread pool so that the
+        time it waits for a free thread is recorded.
+        """
+        queued = self.clock()
+        owner = getattr(func, "__self__", None)
+        if not hasattr(owner, "id"):
+            owner = None
+        name = getattr(func, "__name__", type(func).__name__)
+
+        def profiled_dispatch(*args, **kwargs):
+            self.record(name, "dispatch", queued, self.clock(), owner)
+            return func(*args, **kwargs)
+
+        profiled_dispatch.__name__ = name + "_profiled_dispatch"
+        return profiled_dispatch
+
+    def durations(self, name="run", category="unit"):
+        """
+        :return: The dictionary from unit ids to the numpy arrays of
+                 durations of the matching events, in seconds.
+        """
+        durations = defaultdict(list)
+        for event in self.events:
+            if event.name == name and event.category == category:
+                durations[event.unit_id].append(event.end - event.start)
+        return {key: numpy.array(val) for key, val in durations.items()}
+
+    @staticmethod
+    def percentiles(durations):
+        """
+        :param durations: The durations of the calls.
+        :return: The tuple with the values of PERCENTILES, in seconds.
+        """
+        return tuple(numpy.percentile(durations, PERCENTILES))
+
+    def export_chrome_trace(self, file):
+        """
+        Writes the events as Chrome trace event JSON. Unit calls are complete
+        ("X") events of the threads they happened in, dispatches are async
+        events since the waits of several jobs overlap.
+        :param file: The file object or the path to write to.
+        """
+        pid = os.getpid()
+        trace = []
+        threads = {}
+        for index, event in enumerate(self.events):
+            threads[event.thread_id] = event.thread_name
+            args = {"unit": event.unit_name, "id": event.unit_id}
+            ts = self._microseconds(event.start)
+            if event.category == "dispatch":
+                for phase, time in ("b", ts), ("e", self._microseconds(
+                        event.end)):
+                    trace.append({
+                        "name": event.name, "cat": event.category,
+                        "ph": phase, "ts": time, "pid": pid,
+                        "tid": event.thread_id, "id": index, "args": args})
+                continue
+            trace.append({
+                "name": self._frame_name(event), "cat": event.category,
+                "ph": "X", "ts": ts,
+                "dur": self._microseconds(event.end) - ts,
+                "pid": pid, "tid": event.thread_id, "args": args})
+        for tid, name in threads.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": pid,
+                          "tid": tid, "args": {"name": name}})
+        self._dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+    def export_speedscope(self, file, name="veles"):
+        """
+        Writes the unit calls as speedscope evented profiles, one per
+        thread. Dispatches are skipped since they are not nested.
+        :param file: The file object or the path to write to.
+        """
+        frames = {}
+        threads = defaultdict(list)
+        for event in self.events:
+            if event.category == "dispatch":
+                continue
+            threads[(event.thread_id, event.thread_name)].append(event)
+        profiles = []
+        for (_, thread_name), events in sorted(threads.items()):
+            events.sort(key=lambda e: (e.start, -e.end))
+            records = []
+            stack = []
+            for event in events:
+                while stack and stack[-1][1] <= event.start:
+                    frame, end = stack.pop()
+                    records.append({"type": "C", "frame": frame, "at": end})
+                # Clip the partially overlapping events to keep them nested
+                end = min(event.end, stack[-1][1]) if stack else event.end
+                frame = frames.setdefault(
+                    self._frame_name(event), len(frames))
+                records.append({"type": "O", "frame": frame,
+                                "at": event.start - self._origin})
+                stack.append((frame, end - self._origin))
+            while stack:
+                frame, end = stack.pop()
+                records.append({"type": "C", "frame": frame, "at": end})
+            profiles.append({
+                "type": "evented", "name": thread_name, "unit": "seconds",
+                "startValue": records[0]["at"], "endValue": records[-1]["at"],
+                "events": records})
+        self._dump({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "shared": {"frames": [{"name": n} for n, _ in sorted(
+                frames.items(), key=lambda p: p[1])]},
+            "profiles": profiles}, file)
+
+    def export(self, path):
+        """
+        Writes the events in speedscope format if path ends with
+        ".speedscope.json" or as Chrome trace events otherwise.
+        """
+        if path.endswith(".speedscope.json"):
+            self.export_speedscope(path)
+        else:
+            self.export_chrome_trace(path)
+        self.info("Wrote %d profiling events to %s", len(self), path)
+
+    def _microseconds(self, clock):
+        return int((clock - self._origin) * 1000000)
+
+    @staticmethod
+    def _frame_name(event):
+        if event.unit_name is None:
+            return event.name
+        return "%s.%s" % (event.unit_name, event.name)
+
+    @staticmethod
+    def _dump(obj, file):
+        if isinstance(file, str):
+            with open(file, "w") as fout:
+                json.dump(obj, fout)
+        else:
+            json.dump(obj, file)
+
+
+profiler = Profiler()
@@ -36,11 +36,18 @@ under the License.
 
 
 import base64
+from collections import deque
+import hashlib
 import json
 from itertools import islice
+import threading
+import time
 from time import strftime, localtime
 import numpy
-from twisted.internet import reactor
+from numpy.lib import format as npy_format
+from six import BytesIO
+from twisted.internet import reactor, threads
+from twisted.python.threadable import isInIOThread
 from twisted.web.server import Site, NOT_DONE_YET
 from twisted.web.resource import Resource, NoResource
 from zope.interface import implementer
@@ -48,44 +55,211 @@ from zope.interface import implementer
 from veles.config import root
 from veles.distributable import TriviallyDistributable, IDistributable
 from veles.json_encoders import NumpyJSONEncoder
+from veles.loader.restful import NotFeededError
+from veles.lru_cache import LRUCache
+from veles.thread_pool import ThreadPool, errback
 from veles.units import IUnit, Unit
 
 
+JSON_TYPE = b"application/json"
+#: The raw array buffer, its shape and dtype are in X-Veles-Shape and
+#: X-Veles-Type headers
+RAW_TYPE = b"application/octet-stream"
+#: The array in .npy format (see numpy.save())
+NPY_TYPE = b"application/x-npy"
+CONTENT_TYPES = (JSON_TYPE, RAW_TYPE, NPY_TYPE)
+
+
+def get_content_type(request):
+    """
+    :return: The Content-Type of the request without the parameters.
+    """
+    return (request.getHeader(b"Content-Type") or b"").split(b";")[0].strip()
+
+
+def parse_dtype(dtype_name):
+    """
+    :param dtype_name: numpy.dtype name with the optional byte order suffix\
+    ("<", "=" or ">").
+    :return: numpy.dtype instance.
+    """
+    if dtype_name[-1] in "<=>":
+        byte_order = dtype_name[-1]
+        dtype_name = dtype_name[:-1]
+    else:
+        byte_order = None
+    dtype = numpy.dtype(dtype_name)
+    if byte_order is not None:
+        dtype = dtype.newbyteorder(byte_order)
+    return dtype
+
+
+class BatchRequest(object):
+    """
+    The request with several samples (see X-Veles-Batch header). The samples
+    are fed separately and their results are sent back together.
+    """
+
+    def __init__(self, request, size):
+        self.request = request
+        self.results = [None] * size
+        self.pending = size
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def set_result(self, index, result):
+        """
+        :return: True if all the results are ready; otherwise, False.
+        """
+        self.results[index] = numpy.array(result)
+        with self._lock:
+            self.pending -= 1
+            return self.pending == 0
+
+
+class BatchPart(object):
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+
+class LatencyStats(object):
+    """
+    Keeps the latencies of the last window responses and the numbers of the
+    served and failed requests.
+    """
+    PERCENTILES = (50, 90, 95, 99)
+
+    def __init__(self, window=1000):
+        self._latencies = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.errors = 0
+
+    def add(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self.responses += 1
+
+    def add_batch(self, size):
+        with self._lock:
+            self._batch_sizes.append(size)
+
+    def add_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def describe(self):
+        """
+        :return: dict with the numbers of the responses and the errors, the
+                 latency percentiles, mean and max and the mean minibatch
+                 size.
+        """
+        with self._lock:
+            latencies = numpy.array(self._latencies)
+            batch_sizes = numpy.array(self._batch_sizes)
+            result = {"responses": self.responses, "errors": self.errors}
+        if len(latencies) > 0:
+            latency = {"p%d" % p: v for p, v in zip(
+                LatencyStats.PERCENTILES,
+                numpy.percentile(latencies, LatencyStats.PERCENTILES))}
+            latency["mean"] = latencies.mean()
+            latency["max"] = latencies.max()
+            result["latency"] = latency
+        if len(batch_sizes) > 0:
+            result["batch_size"] = batch_sizes.mean()
+        return result
+
+
 class APIResource(Resource):
     isLeaf = True
 
-    def __init__(self, path, callback):
+    def __init__(self, path, callback, stats=None):
         Resource.__init__(self)
         self._path = path.encode('charmap')
         self._callback = callback
+        self._stats = stats
+
+    def render_GET(self, request):
+        if self._stats is None or request.path != self._path + b"/stats":
+            page = NoResource(
+                message="API path %s is not supported" % request.URLPath())
+            return page.render(request)
+        request.setHeader(b"Content-Type", b"application/json")
+        return json.dumps(self._stats(), cls=NumpyJSONEncoder).encode("utf-8")
 
     def render_POST(self, request):
         if request.path != self._path:
             page = NoResource(
                 message="API path %s is not supported" % request.URLPath())
             return page.render(request)
-        if request.getHeader(b"Content-Type") != b"application/json":
+        content_type = get_content_type(request)
+        if content_type not in CONTENT_TYPES:
             page = NoResource(
-                message="Unsupported Content-Type (must be \"application/json"
-                        "\")" % request.URLPath())
+                message="Unsupported Content-Type (must be one of %s)" %
+                ", ".join(t.decode("charmap") for t in CONTENT_TYPES))
             return page.render(request)
-        request.setHeader(b"Content-Type", b"application/json")
+        request.setHeader(b"Content-Type", content_type)
         self._callback(request)
         return NOT_DONE_YET
 
 
 @implementer(IUnit, IDistributable)
 class RESTfulAPI(Unit, TriviallyDistributable):
+    """
+    Serves the HTTP POST requests to path: the input is decoded and fed to
+    the loader, the results are sent back after the workflow processes the
+    minibatch. The requests are decoded and the responses are encoded in
+    the thread pool, so that the reactor thread only does the networking.
+    GET path/stats returns the latency percentiles of the responses.
+
+    The input is either JSON ({"input": ..., "codec": "list" | "base64"})
+    or the binary array: the raw buffer (RAW_TYPE) with X-Veles-Shape
+    ("224,224,3") and X-Veles-Type ("float32", see numpy.dtype) headers or
+    the .npy file (NPY_TYPE). The binary arrays are wrapped into numpy
+    without copying and the results are sent back in the same format. If
+    X-Veles-Batch header is "1", the first axis of the binary array
+    enumerates the samples which are fed separately; the response contains
+    their stacked results.
+
+    If cache_size is not 0, the results are cached by the hash of the input
+    array, so that the repeated inputs are answered at once without feeding
+    them to the loader. The cache is invalidated in initialize(), e.g.
+    after the workflow is restored from a snapshot; invalidate_cache() must
+    be called if the weights are changed while serving.
+
+    Attributes:
+        port: the TCP port to listen on.
+        path: the API path.
+        decode_workers: the number of threads which decode the requests;
+                        if it is 0, they are decoded on the reactor thread.
+        cache_size: the maximal total size of the cached results in bytes;
+                    0 disables the cache.
+        cache_ttl: the number of seconds after which a cached result
+                   expires or None if the results never expire.
+        stats: LatencyStats instance.
+    """
     def __init__(self, workflow, **kwargs):
         kwargs["view_group"] = "SERVICE"
         super(RESTfulAPI, self).__init__(workflow, **kwargs)
         self.port = kwargs.get("port", root.common.api.port)
         self.path = kwargs.get("path", root.common.api.path)
+        self.decode_workers = kwargs.get("decode_workers", 2)
+        self.stats_window = kwargs.get("stats_window", 1000)
+        self.cache_size = kwargs.get("cache_size", 0)
+        self.cache_ttl = kwargs.get("cache_ttl")
         self.demand("feed", "requests", "results", "minibatch_size")
 
     def init_unpickled(self):
         super(RESTfulAPI, self).init_unpickled()
         self._listener_ = None
+        self._decode_pool_ = None
+        self._received_ = {}
+        self._stats_ = None
+        self._cache_ = None
+        self._cache_keys_ = {}
+        self._cache_generation_ = 0
 
     @property
     def port(self):
@@ -99,6 +273,54 @@ class RESTfulAPI(Unit, TriviallyDistributable):
             raise ValueError("port is out of range (%d)" % value)
         self._port = value
 
+    @property
+    def decode_workers(self):
+        return self._decode_workers
+
+    @decode_workers.setter
+    def decode_workers(self, value):
+        if not isinstance(value, int):
+            raise TypeError("decode_workers must be an integer (got %s)" %
+                            type(value))
+        if value < 0:
+            raise ValueError("decode_workers must be >= 0 (got %d)" % value)
+        self._decode_workers = value
+
+    @property
+    def decode_pool(self):
+        """
+        :return: The thread pool which decodes the requests or None if
+                 decode_workers is 0.
+        """
+        if self.decode_workers == 0:
+            return None
+        if self._decode_pool_ is None:
+            self._decode_pool_ = ThreadPool(
+                minthreads=1, maxthreads=self.decode_workers,
+                name="%s decode" % self.name)
+            self._decode_pool_.start()
+        return self._decode_pool_
+
+    @property
+    def stats(self):
+        if self._stats_ is None:
+            self._stats_ = LatencyStats(self.stats_window)
+        return self._stats_
+
+    @property
+    def cache(self):
+        """
+        :return: veles.lru_cache.LRUCache with the results or None if
+                 cache_size is 0.
+        """
+        if self.cache_size == 0:
+            return None
+        if self._cache_ is None:
+            self._cache_ = LRUCache(self.cache_size,
+                                    size_of=lambda arr: arr.nbytes,
+                                    ttl=self.cache_ttl)
+        return self._cache_
+
     @property
     def path(self):
         return self._path
@@ -110,32 +332,109 @@ class RESTfulAPI(Unit, TriviallyDistributable):
         self._path = value
 
     def initialize(self, **kwargs):
+        self.invalidate_cache()
         self._listener_ = reactor.listenTCP(
-            self.port, Site(APIResource(self.path, self.serve)))
+            self.port, Site(APIResource(self.path, self.serve,
+                                        self.describe_stats)))
         self.info("Listening on 0.0.0.0:%d%s", self.port, self.path)
 
     def run(self):
-        reactor.callFromThread(self.respond)
+        responses = []
+        samples = 0
+        for request, result in islice(zip(self.requests, self.results),
+                                      0, self.minibatch_size):
+            if request is None:
+                continue
+            samples += 1
+            self._cache_result(request, result)
+            if isinstance(request, BatchPart):
+                batch = request.batch
+                if batch.failed or \
+                        not batch.set_result(request.index, result):
+                    continue
+                request, result = batch.request, numpy.array(batch.results)
+            responses.append((request, self._encode(request, result)))
+        self.stats.add_batch(samples)
+        reactor.callFromThread(self.respond, responses)
 
     def stop(self):
         if self._listener_ is not None:
             self._listener_.stopListening()
+        if self._decode_pool_ is not None:
+            self._decode_pool_.shutdown(execute_remaining=False)
+            self._decode_pool_ = None
 
-    def respond(self):
-        for request, result in islice(zip(self.requests, self.results),
-                                      0, self.minibatch_size):
-            if request is None:
-                continue
-            request.write(json.dumps({"result": result},
-                                     cls=NumpyJSONEncoder).encode("utf-8"))
+    def respond(self, responses):
+        now = time.time()
+        for request, (headers, body) in responses:
+            for key, value in headers.items():
+                request.setHeader(key, value)
+            request.write(body)
             request.finish()
+            received = self._received_.pop(request, None)
+            if received is not None:
+                self.stats.add(now - received[0])
 
-    def fail(self, request, message):
+    def fail(self, request, message, code=400):
         self.warning(message)
-        request.setResponseCode(400)
-        request.write(json.dumps({"error": message}).encode('utf-8'))
+        self._received_.pop(request, None)
+        self._cache_keys_.pop(request, None)
+        self.stats.add_error()
+        data = json.dumps({"error": message}).encode('utf-8')
+        if isInIOThread():
+            self._write_error(request, code, data)
+        else:
+            reactor.callFromThread(self._write_error, request, code, data)
+
+    def describe_stats(self):
+        """
+        :return: LatencyStats.describe() and the number of the requests which
+                 are being processed.
+        """
+        stats = self.stats.describe()
+        stats["in_flight"] = len(self._received_)
+        cache = self._cache_
+        if cache is not None:
+            stats["cache"] = {
+                "hits": cache.hits, "misses": cache.misses,
+                "hit_rate": cache.hit_rate, "expired": cache.expired,
+                "items": len(cache), "size": cache.size}
+        return stats
+
+    def invalidate_cache(self):
+        """
+        Drops the cached results. The results of the requests which are
+        being processed are not cached either.
+        """
+        self._cache_generation_ += 1
+        if self._cache_ is not None:
+            self._cache_.clear()
+
+    def _write_error(self, request, code, data):
+        request.setResponseCode(code)
+        request.setHeader(b"Content-Type", JSON_TYPE)
+        request.write(data)
         request.finish()
 
+    def _encode(self, request, result):
+        """
+        :return: The response headers and body in the format of the request.
+        """
+        content_type = self._received_.get(request, (None, JSON_TYPE))[1]
+        if content_type == JSON_TYPE:
+            return {}, json.dumps({"result": result},
+                                  cls=NumpyJSONEncoder).encode("utf-8")
+        result = numpy.ascontiguousarray(result)
+        if content_type == NPY_TYPE:
+            fio = BytesIO()
+            numpy.save(fio, result, allow_pickle=False)
+            return {}, fio.getvalue()
+        headers = {
+            b"X-Veles-Shape": ",".join(
+                str(d) for d in result.shape).encode("charmap"),
+            b"X-Veles-Type": result.dtype.str.encode("charmap")}
+        return headers, result.tobytes()
+
     def _decode_base64(self, request, response, input_obj):
         # base64 codec
         if "shape" not in response:
@@ -157,19 +456,12 @@ class RESTfulAPI(Unit, TriviallyDistributable):
             # this will result in numpy.float64
             self.fail(request, "\"type\" must not be null")
             return None
-        if dtype_name[-1] in "<=>":
-            byte_order = dtype_name[-1]
-            dtype_name = dtype_name[:-1]
-        else:
-            byte_order = None
         try:
-            dtype = numpy.dtype(dtype_name)
+            dtype = parse_dtype(dtype_name)
         except TypeError:
             self.fail(request, "Invalid \"type\" value. For the list of "
                                "supported values, see numpy.dtype.")
             return None
-        if byte_order is not None:
-            dtype = dtype.newbyteorder(byte_order)
         try:
             buffer = base64.b64decode(input_obj)
         except base64.binascii.Error as e:
@@ -181,36 +473,161 @@ class RESTfulAPI(Unit, TriviallyDistributable):
             self.fail(request, "Failed to create the numpy array: %s." % e)
             return None
 
-    def serve(self, request):
-        raw_response = request.content.read()
+    def _decode_raw(self, request, raw):
+        shape = request.getHeader(b"X-Veles-Shape")
+        if shape is None:
+            self.fail(request, "There is no X-Veles-Shape header which "
+                               "defines the input array shape")
+            return None
+        try:
+            shape = [int(d) for d in shape.split(b",")]
+        except ValueError:
+            self.fail(request, "X-Veles-Shape must be the comma separated "
+                               "list of integers")
+            return None
+        dtype_name = request.getHeader(b"X-Veles-Type")
+        if not dtype_name:
+            self.fail(request, "There is no X-Veles-Type header which "
+                               "defines the array data type (e.g., "
+                               "\"float32\" or \"uint8\", see numpy.dtype)"
+                               ".")
+            return None
+        try:
+            dtype = parse_dtype(dtype_name.decode("charmap"))
+        except TypeError:
+            self.fail(request, "Invalid X-Veles-Type value. For the list of "
+                               "supported values, see numpy.dtype.")
+            return None
+        try:
+            return numpy.frombuffer(raw, dtype).reshape(shape)
+        except Exception as e:
+            self.fail(request, "Failed to create the numpy array: %s." % e)
+            return None
+
+    def _decode_npy(self, request, raw):
+        fio = BytesIO(raw)
+        try:
+            version = npy_format.read_magic(fio)
+            if version == (1, 0):
+                shape, fortran_order, dtype = \
+                    npy_format.read_array_header_1_0(fio)
+            else:
+                shape, fortran_order, dtype = \
+                    npy_format.read_array_header_2_0(fio)
+            if dtype.hasobject:
+                raise ValueError("object arrays are not supported")
+            data = numpy.frombuffer(raw, dtype, int(numpy.prod(shape)),
+                                    fio.tell())
+            return data.reshape(shape, order="F" if fortran_order else "C")
+        except Exception as e:
+            self.fail(request, "Failed to decode .npy: %s." % e)
+            return None
+
+    def _decode_json(self, request, raw_response):
         try:
             response = json.loads(raw_response.decode('utf-8'))
         except ValueError:
             self.fail(request, "Failed to parse JSON")
-            return
+            return None
         if not isinstance(response, dict) or "input" not in response \
                 or "codec" not in response:
             self.fail(request, "Invalid input format: there must be \"input\" "
                                "and \"codec\" attributes")
-            return
+            return None
         input_obj = response["input"]
         codec = response["codec"]
         if codec not in ("list", "base64"):
             self.fail(request, "Invalid codec value: must be either \"list\" "
                                "or \"base64\"")
-            return
+            return None
         if codec == "list":
             try:
-                data = numpy.array(input_obj, numpy.float32)
+                return numpy.array(input_obj, numpy.float32)
             except ValueError:
                 self.fail(request, "Invalid input array format")
-                return
+                return None
+        return self._decode_base64(request, response, input_obj)
+
+    @staticmethod
+    def _cache_key(sample):
+        sample = numpy.ascontiguousarray(sample)
+        return (sample.dtype.str, sample.shape,
+                hashlib.sha1(sample).hexdigest())
+
+    def _cache_result(self, request, result):
+        generation, key = self._cache_keys_.pop(request, (None, None))
+        if generation == self._cache_generation_:
+            self.cache.put(key, numpy.array(result))
+
+    def _feed_sample(self, sample, request):
+        """
+        Feeds the sample to the loader unless its result is cached.
+        :return: The cached result or None.
+        """
+        cache = self.cache
+        if cache is not None:
+            key = self._cache_key(sample)
+            result = cache.find(key)
+            if result is not None:
+                return result
+            self._cache_keys_[request] = (self._cache_generation_, key)
+        try:
+            self.feed(sample, request)
+        except Exception:
+            self._cache_keys_.pop(request, None)
+            raise
+        return None
+
+    def _respond_cached(self, request, result):
+        reactor.callFromThread(
+            self.respond, [(request, self._encode(request, result))])
+
+    def _feed_batch(self, request, data):
+        if len(data.shape) == 0 or data.shape[0] == 0:
+            raise ValueError("the batch is empty")
+        batch = BatchRequest(request, data.shape[0])
+        try:
+            for index, sample in enumerate(data):
+                result = self._feed_sample(sample, BatchPart(batch, index))
+                if result is not None and batch.set_result(index, result):
+                    self._respond_cached(request, numpy.array(batch.results))
+        except Exception:
+            batch.failed = True
+            raise
+
+    def serve(self, request):
+        self._received_[request] = (time.time(), get_content_type(request))
+        raw_response = request.content.read()
+        pool = self.decode_pool
+        if pool is None:
+            self._serve(request, raw_response)
         else:
-            data = self._decode_base64(request, response, input_obj)
-            if data is None:
-                return
+            threads.deferToThreadPool(
+                reactor, pool, self._serve, request, raw_response) \
+                .addErrback(errback)
+
+    def _serve(self, request, raw_response):
+        content_type = self._received_.get(request, (None, JSON_TYPE))[1]
+        batched = False
+        if content_type == JSON_TYPE:
+            data = self._decode_json(request, raw_response)
+        else:
+            batched = request.getHeader(b"X-Veles-Batch") in (b"1", b"true")
+            if content_type == NPY_TYPE:
+                data = self._decode_npy(request, raw_response)
+            else:
+                data = self._decode_raw(request, raw_response)
+        if data is None:
+            return
         try:
-            self.feed(data, request)
+            if batched:
+                self._feed_batch(request, data)
+            else:
+                result = self._feed_sample(data, request)
+                if result is not None:
+                    self._respond_cached(request, result)
+        except NotFeededError as e:
+            self.fail(request, "Service is overloaded: %s" % e, 503)
         except Exception as e:
             self.fail(request, "Invalid input value: %s" % e)
         self.debug("%s: received %d bytes", strftime("%X", localtime()),
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+
+Created on Jul 14, 2015
+
+Measures the throughput of the slaves and decides which of them get the jobs
+first and how big the jobs should be.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import time
+
+import numpy
+import six
+
+from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
+from veles.mapped_object_registry import MappedObjectsRegistry
+
+
+class SchedulingPolicyRegistry(MappedObjectsRegistry):
+    """Metaclass to record the scheduling policies. Used by
+    :class:`Scheduler`.
+    """
+    mapping = "policies"
+
+
+class SlaveStats(object):
+    """
+    Exponentially weighted moving averages of the slave's job durations and
+    data transfer times.
+    """
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.jobs = 0
+        self.job_time = None
+        self.transfer_time = None
+        self.reported_power = 0
+        self.requested = 0
+
+    def average(self, name, value):
+        old = getattr(self, name)
+        setattr(self, name, value if old is None else
+                self.alpha * value + (1 - self.alpha) * old)
+
+    @property
+    def measured(self):
+        return self.job_time is not None and self.job_time > 0
+
+    @property
+    def throughput(self):
+        """
+        :return: Jobs per second or None if no jobs have been done yet.
+        """
+        return 1.0 / self.job_time if self.measured else None
+
+    @property
+    def expected_time(self):
+        """
+        :return: The expected time to do the next job including the data
+        transfer (seconds) or None if unknown.
+        """
+        if not self.measured:
+            return None
+        return self.job_time + (self.transfer_time or 0)
+
+
+@six.add_metaclass(SchedulingPolicyRegistry)
+class SchedulingPolicy(object):
+    """
+    Base class of the scheduling policies. order() decides which of the
+    slaves waiting for a job are served first and power() estimates the
+    slave's relative computing power which the units may use to size the
+    jobs (see SlaveDescription.power).
+    """
+
+    def order(self, stats):
+        """
+        :param stats: slave ID -> :class:`SlaveStats` of the waiting slaves.
+        :return: The list of slave IDs in the order of serving.
+        """
+        raise NotImplementedError()
+
+    def power(self, slave_stats, stats):
+        """
+        :param slave_stats: :class:`SlaveStats` of the slave.
+        :param stats: slave ID -> :class:`SlaveStats` of all the slaves.
+        """
+        raise NotImplementedError()
+
+
+class RoundRobinPolicy(SchedulingPolicy):
+    """
+    Serves the slaves in the order of their job requests and trusts the
+    computing power they report.
+    """
+    MAPPING = "round_robin"
+
+    def order(self, stats):
+        return sorted(stats, key=lambda sid: stats[sid].requested)
+
+    def power(self, slave_stats, stats):
+        return slave_stats.reported_power
+
+
+class WeightedPolicy(SchedulingPolicy):
+    """
+    Serves the slaves with the highest measured throughput first. The power
+    is the throughput relative to the average one, so it is 1 for an average
+    slave and for the slaves which have not done any jobs yet.
+    """
+    MAPPING = "weighted"
+
+    def order(self, stats):
+        # The unmeasured slaves go first to get measured
+        return sorted(stats, key=lambda sid: (
+            stats[sid].measured, -(stats[sid].throughput or 0),
+            stats[sid].requested))
+
+    def power(self, slave_stats, stats):
+        if not slave_stats.measured:
+            return 1.0
+        return slave_stats.throughput / numpy.mean(
+            [s.throughput for s in stats.values() if s.measured])
+
+
+class WorkStealingPolicy(WeightedPolicy):
+    """
+    Serves the slaves which are expected to finish the job earliest first,
+    so that the fast idle slaves take the jobs which would otherwise wait for
+    the stragglers. A slave which is straggler_factor times slower than the
+    median one is served only after all the rest.
+    """
+    MAPPING = "work_stealing"
+
+    def __init__(self, straggler_factor=2.0):
+        self.straggler_factor = straggler_factor
+
+    def order(self, stats):
+        times = [s.expected_time for s in stats.values() if s.measured]
+        threshold = numpy.median(times) * self.straggler_factor \
+            if len(times) > 0 else None
+
+        def key(sid):
+            expected = stats[sid].expected_time
+            if expected is None:
+                return False, 0, stats[sid].requested
+            return expected > threshold, expected, stats[sid].requested
+
+        return sorted(stats, key=key)
+
+
+class Scheduler(Logger):
+    """
+    Keeps :class:`SlaveStats` of every slave and applies the chosen
+    :class:`SchedulingPolicy`.
+    """
+    DEFAULT_ALPHA = 0.3
+
+    def __init__(self, policy="round_robin", **kwargs):
+        super(Scheduler, self).__init__(**kwargs)
+        try:
+            self.policy = SchedulingPolicyRegistry.policies[policy]()
+        except KeyError:
+            raise ValueError("Unknown scheduling policy \"%s\" (choose one "
+                             "of %s)" % (policy, ", ".join(
+                                 sorted(SchedulingPolicyRegistry.policies))))
+        self.alpha = kwargs.get("alpha", Scheduler.DEFAULT_ALPHA)
+        self.stats = {}
+
+    def __getitem__(self, slave_id):
+        stats = self.stats.get(slave_id)
+        if stats is None:
+            stats = self.stats[slave_id] = SlaveStats(self.alpha)
+        return stats
+
+    def remove(self, slave_id):
+        self.stats.pop(slave_id, None)
+
+    def job_requested(self, slave_id):
+        self[slave_id].requested = time.time()
+
+    def job_finished(self, slave_id, duration):
+        stats = self[slave_id]
+        stats.jobs += 1
+        stats.average("job_time", duration)
+
+    def report(self, slave_id, power, transfer_time=None):
+        """
+        Records the values which the slave has measured itself.
+        """
+        stats = self[slave_id]
+        stats.reported_power = power
+        if transfer_time is not None:
+            stats.average("transfer_time", transfer_time)
+
+    def power(self, slave_id):
+        return self.policy.power(self[slave_id], self.stats)
+
+    def order(self, slave_ids):
+        """
+        :return: The list of the waiting slave IDs in the order of serving.
+        """
+        return self.policy.order({sid: self[sid] for sid in slave_ids})
+
+    def describe(self, slave_id):
+        """
+        :return: The dictionary with the slave's statistics (for web status).
+        """
+        stats = self[slave_id]
+        return {"job_time": stats.job_time,
+                "transfer_time": stats.transfer_time,
+                "throughput": stats.throughput,
+                "power": self.power(slave_id)}
+
+    def print_stats(self, nodes=None):
+        if len(self.stats) == 0:
+            return
+        table = PrettyTable("id", "host", "jobs", "job time", "transfer",
+                            "jobs/s", "power")
+        table.align["id"] = "l"
+        for sid, stats in sorted(self.stats.items()):
+            host = (nodes or {}).get(sid, {}).get("host")
+            table.add_row(
+                sid, host, stats.jobs, "%.3f" % (stats.job_time or 0),
+                "%.3f" % (stats.transfer_time or 0),
+                "%.2f" % (stats.throughput or 0), "%.2f" % self.power(sid))
+        self.info("Slaves (%s scheduling):\n%s",
+                  self.policy.MAPPING, table)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 12, 2015
+
+This script compares the throughput and the compression ratio of the snapshot
+codecs, including the block-parallel ones (see :mod:`veles.block_codec`), on
+a pickled workflow.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy
+from veles.dummy import DummyWorkflow
+from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
+from veles.memory import Array
+from veles.pickle2 import pickle, best_protocol
+import veles.prng as prng
+from veles.snapshotter import SnapshotterToFile
+from veles.timeit2 import timeit
+from veles.units import TrivialUnit
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the snapshot compression codecs",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("-s", "--size", type=int, default=64,
+                        help="The size of the generated workflow's arrays in "
+                             "megabytes.")
+    parser.add_argument("-l", "--level", type=int, default=6,
+                        help="The compression level.")
+    parser.add_argument("-c", "--codecs", nargs="+",
+                        default=["gz", "pgz", "bz2", "pbz2", "xz", "pxz"],
+                        choices=sorted(
+                            c for c in SnapshotterToFile.WRITE_CODECS if c),
+                        help="The codecs to benchmark.")
+    parser.add_argument("--snapshot",
+                        help="Benchmark on the workflow from this snapshot "
+                             "instead of the generated one.")
+    return parser.parse_args()
+
+
+def generate_workflow(size):
+    """
+    Creates the workflow with the arrays which resemble trained weights:
+    the float32 values are quantized, so they are compressible but not
+    trivially.
+    """
+    workflow = DummyWorkflow()
+    count = size * 1024 * 1024 // 4 // 4
+    for i in range(4):
+        unit = TrivialUnit(workflow, name="layer%d" % i)
+        weights = prng.get().normal(0, 0.1, count).astype(numpy.float32)
+        unit.weights = Array(numpy.round(weights, 3))
+    return workflow
+
+
+def benchmark(data, codec, level, path):
+    def write():
+        with SnapshotterToFile.WRITE_CODECS[codec](path, level) as fout:
+            fout.write(data)
+
+    def read():
+        with SnapshotterToFile.READ_CODECS[codec](path) as fin:
+            return fin.read()
+
+    write_time = timeit(write)[1]
+    result, read_time = timeit(read)
+    assert result == data
+    return write_time, read_time, os.path.getsize(path)
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+    if args.snapshot is not None:
+        workflow = SnapshotterToFile.import_(args.snapshot)
+    else:
+        workflow = generate_workflow(args.size)
+    data = pickle.dumps(workflow, protocol=best_protocol)
+    logger.info("The pickled workflow takes %d bytes", len(data))
+    table = PrettyTable("Codec", "Write, MB/s", "Read, MB/s", "Ratio")
+    table.align["Codec"] = "l"
+    megabytes = len(data) / (1024.0 * 1024)
+    tmpdir = tempfile.mkdtemp(prefix="veles-codecs-")
+    try:
+        for codec in args.codecs:
+            logger.info("Benchmarking %s...", codec)
+            write_time, read_time, size = benchmark(
+                data, codec, args.level, os.path.join(tmpdir, codec))
+            table.add_row(codec, megabytes / write_time,
+                          megabytes / read_time, len(data) / float(size))
+    finally:
+        shutil.rmtree(tmpdir)
+    print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 18, 2015
+
+This script compares the vectorized fill_minibatch() of
+:class:`veles.loader.fullbatch.FullBatchLoader` on NumpyDevice with the
+per-sample fill_minibatch_by_samples() across minibatch and sample sizes.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import gc
+import logging
+import os
+
+from zope.interface import implementer
+
+from veles.dot_pip import install_dot_pip
+install_dot_pip()
+import numpy
+from veles.backends import NumpyDevice
+from veles.dummy import DummyWorkflow
+from veles.external.prettytable import PrettyTable
+from veles.loader import FullBatchLoader, IFullBatchLoader
+from veles.logger import Logger
+import veles.prng as prng
+from veles.timeit2 import timeit
+
+
+@implementer(IFullBatchLoader)
+class RandomLoader(FullBatchLoader):
+    def __init__(self, workflow, **kwargs):
+        super(RandomLoader, self).__init__(workflow, **kwargs)
+        self.samples = kwargs["samples"]
+        self.sample_size = kwargs["sample_size"]
+
+    def load_data(self):
+        self.class_lengths[:] = 0, 0, self.samples
+        self.create_originals((self.sample_size,))
+        prng.get().fill(self.original_data.mem)
+        self.original_labels[:] = prng.get().randint(
+            0, 10, self.samples).tolist()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark FullBatchLoader's fill_minibatch()",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("-m", "--minibatch-sizes", default="32,256,1024,4096",
+                        help="Comma separated minibatch sizes.")
+    parser.add_argument("-s", "--sample-sizes", default="1,16,256,1024",
+                        help="Comma separated sample sizes in KiB.")
+    parser.add_argument("-d", "--dataset-size", type=int, default=256,
+                        help="The maximal size of the dataset in MiB. The "
+                             "combinations whose minibatch is larger than "
+                             "the half of it are skipped.")
+    parser.add_argument("-r", "--repeats", type=int, default=20,
+                        help="The number of random minibatches to fill.")
+    return parser.parse_args()
+
+
+def benchmark(loader, size, repeats):
+    total = loader.total_samples
+    batches = [prng.get().permutation(total)[:size].astype(numpy.int32)
+               for _ in range(repeats)]
+    loader.minibatch_size = size
+
+    def execute(method):
+        for indices in batches:
+            loader.minibatch_indices.mem[:size] = indices
+            method()
+
+    return (timeit(execute, loader.fill_minibatch)[1] / repeats,
+            timeit(execute, loader.fill_minibatch_by_samples)[1] / repeats)
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+    workflow = DummyWorkflow()
+    table = PrettyTable("Minibatch", "Sample, KiB", "Vectorized, ms",
+                        "By samples, ms", "Speedup")
+    limit = args.dataset_size << 20
+    minibatch_sizes = sorted(int(m) for m in args.minibatch_sizes.split(","))
+    for sample_kib in (int(s) for s in args.sample_sizes.split(",")):
+        fit = [m for m in minibatch_sizes
+               if m * sample_kib << 10 <= limit // 2]
+        if len(fit) > 0:
+            samples = max(2 * fit[-1], limit // (sample_kib << 10))
+            logger.info("Generating %d samples of %d KiB...", samples,
+                        sample_kib)
+            loader = RandomLoader(
+                workflow, samples=samples, minibatch_size=fit[-1],
+                sample_size=(sample_kib << 10) // numpy.dtype(
+                    numpy.float32).itemsize, force_numpy=True)
+            loader.initialize(device=NumpyDevice())
+            # Touch the pages of the minibatch before measuring
+            loader.minibatch_data.mem[:] = 0
+        for minibatch_size in minibatch_sizes:
+            if minibatch_size not in fit:
+                table.add_row(minibatch_size, sample_kib, "-", "-", "-")
+                continue
+            logger.info("Benchmarking minibatch %d...", minibatch_size)
+            vectorized, by_samples = benchmark(
+                loader, minibatch_size, args.repeats)
+            table.add_row(minibatch_size, sample_kib, vectorized * 1000,
+                          by_samples * 1000, by_samples / vectorized)
+        if len(fit) > 0:
+            workflow.del_ref(loader)
+            loader.original_data.reset()
+            loader.minibatch_data.reset()
+            del loader
+            gc.collect()
+    print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 21, 2015
+
+This script compares the dynamic dispatch of Unit.run_dependent() with the
+compiled inline plans (root.common.engine.inline_run) on a synthetic
+workflow of trivial units: the head fans out to several long chains which
+join in the last unit.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import logging
+import os
+import sys
+import threading
+
+from veles.dot_pip import install_dot_pip
+install_dot_pip()
+from veles.config import root
+from veles.dummy import DummyWorkflow
+from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
+from veles.timeit2 import timeit
+from veles.units import TrivialUnit
+
+
+class FinishUnit(TrivialUnit):
+    """
+    Signals the end of the pass in run_dependent(), which is called after
+    the run lock is released, so that the next pass is never discarded.
+    """
+    def __init__(self, workflow, **kwargs):
+        super(FinishUnit, self).__init__(workflow, **kwargs)
+        self.finished = threading.Event()
+
+    def run_dependent(self):
+        self.finished.set()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the inline execution of Unit.run_dependent()",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("-u", "--units", type=int, default=500,
+                        help="The number of units in the workflow.")
+    parser.add_argument("-b", "--branches", default="1,4,16",
+                        help="Comma separated numbers of parallel chains.")
+    parser.add_argument("-r", "--repeats", type=int, default=100,
+                        help="The number of passes through the workflow.")
+    return parser.parse_args()
+
+
+def create_units(workflow, units, branches):
+    head = TrivialUnit(workflow, name="head")
+    join = TrivialUnit(workflow, name="join")
+    finish = FinishUnit(workflow, name="finish")
+    finish.link_from(join)
+    length = max(1, (units - 3) // branches)
+    for branch in range(branches):
+        prev = head
+        for index in range(length):
+            unit = TrivialUnit(workflow, name="%d_%d" % (branch, index))
+            unit.link_from(prev)
+            prev = unit
+        join.link_from(prev)
+    for unit in workflow:
+        unit.initialize()
+    return head, finish
+
+
+def benchmark(workflow, head, finish, repeats):
+    def execute():
+        for _ in range(repeats):
+            finish.finished.clear()
+            head.run_dependent()
+            finish.finished.wait()
+
+    execute()  # warm up the thread pool
+    dynamic = timeit(execute)[1] / repeats
+    inline = workflow.compile_plans()
+    compiled = timeit(execute)[1] / repeats
+    return dynamic, compiled, inline
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+    # Dynamic dispatch recurses through two frames per unit in a chain
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), args.units * 4 + 1000))
+    root.common.disable.spinning_run_progress = True
+    table = PrettyTable("Branches", "Units", "Inline", "Dynamic, ms",
+                        "Compiled, ms", "Speedup")
+    for branches in (int(b) for b in args.branches.split(",")):
+        logger.info("Benchmarking %d branches...", branches)
+        workflow = DummyWorkflow()
+        head, finish = create_units(workflow, args.units, branches)
+        dynamic, compiled, inline = benchmark(
+            workflow, head, finish, args.repeats)
+        table.add_row(branches, len(workflow), inline, dynamic * 1000,
+                      compiled * 1000, dynamic / compiled)
+    head.thread_pool.shutdown()
+    print(table)
+
+if __name__ == "__main__":
+    main()
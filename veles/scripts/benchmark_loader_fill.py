@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 7, 2015
+
+This script compares the vectorized fill_minibatch() of
+:class:`veles.loader.loader_hdf5.HDF5Loader` and
+:class:`veles.loader.saver.MinibatchesLoader` with the per-sample
+fill_minibatch_by_samples() on random minibatches.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+
+from veles.dot_pip import install_dot_pip
+install_dot_pip()
+import h5py
+import numpy
+from veles.dummy import DummyWorkflow
+from veles.external.prettytable import PrettyTable
+from veles.loader.loader_hdf5 import HDF5Loader
+from veles.loader.saver import MinibatchesLoader
+from veles.logger import Logger
+import veles.prng as prng
+from veles.timeit2 import timeit
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark loaders' fill_minibatch()",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("-n", "--samples", type=int, default=100000,
+                        help="The number of samples in the generated HDF5 "
+                             "file.")
+    parser.add_argument("-s", "--sample-size", type=int, default=256,
+                        help="The number of float32 values in each sample.")
+    parser.add_argument("-m", "--minibatch-size", type=int, default=128,
+                        help="The minibatch size.")
+    parser.add_argument("-r", "--repeats", type=int, default=50,
+                        help="The number of random minibatches to fill.")
+    parser.add_argument("--minibatches",
+                        help="Also benchmark MinibatchesLoader on this file "
+                             "written by MinibatchesSaver.")
+    return parser.parse_args()
+
+
+def generate_hdf5(path, samples, sample_size):
+    with h5py.File(path, "w") as h5f:
+        h5f["data"] = prng.get().rand(samples, sample_size).astype(
+            numpy.float32)
+        h5f["label"] = prng.get().randint(0, 10, samples).astype(
+            numpy.int32)
+
+
+def benchmark(loader, repeats):
+    total = loader.total_samples
+    size = min(loader.max_minibatch_size, total)
+    batches = [prng.get().permutation(total)[:size].astype(numpy.int32)
+               for _ in range(repeats)]
+    loader.minibatch_size = size
+
+    def execute(method):
+        for indices in batches:
+            loader.minibatch_indices.mem[:size] = indices
+            method()
+
+    return (timeit(execute, loader.fill_minibatch)[1] / repeats,
+            timeit(execute, loader.fill_minibatch_by_samples)[1] / repeats)
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+    workflow = DummyWorkflow()
+    table = PrettyTable("Loader", "Vectorized, ms", "By samples, ms",
+                        "Speedup")
+    table.align["Loader"] = "l"
+    tmpdir = tempfile.mkdtemp(prefix="veles-fill-")
+    try:
+        path = os.path.join(tmpdir, "train.h5")
+        logger.info("Generating %s...", path)
+        generate_hdf5(path, args.samples, args.sample_size)
+        loaders = [HDF5Loader(workflow, train_path=path,
+                              minibatch_size=args.minibatch_size)]
+        if args.minibatches is not None:
+            loaders.append(MinibatchesLoader(
+                workflow, file_name=args.minibatches,
+                minibatch_size=args.minibatch_size))
+        for loader in loaders:
+            loader.initialize()
+            logger.info("Benchmarking %s...", loader)
+            vectorized, by_samples = benchmark(loader, args.repeats)
+            table.add_row(type(loader).__name__, vectorized * 1000,
+                          by_samples * 1000, by_samples / vectorized)
+    finally:
+        shutil.rmtree(tmpdir)
+    print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 16, 2015
+
+This script compares the transports of the jobs to the slave on the same
+host: the pickles over the tcp and ipc ZeroMQ endpoints, the zero copy frames
+over ipc and the shared memory ring
+(:class:`veles.txzmq.sharedring.SharedRing`), when only the descriptors of
+the arrays cross the ipc socket.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import logging
+import os
+import tempfile
+
+from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
+from veles.scripts.benchmark_zmq_transport import PairConnection, \
+    generate_job
+from veles.timeit2 import timeit
+from veles.txzmq.connection import ZmqEndpoint
+from veles.txzmq.sharedring import SharedRing
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the same host job transports",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+",
+                        default=[10, 100, 500],
+                        help="The sizes of the jobs' parameters in megabytes.")
+    parser.add_argument("-r", "--repeats", type=int, default=5,
+                        help="The number of jobs of each size to send.")
+    parser.add_argument("-p", "--port", type=int, default=5078,
+                        help="The TCP port to bind to.")
+    return parser.parse_args()
+
+
+def benchmark(master, slave, job, repeats, **kwargs):
+    def send_jobs():
+        for _ in range(repeats):
+            master.send(b"job", job, **kwargs)
+            slave.receive()
+            master.wait_buffers_sent()
+
+    return timeit(send_jobs)[1] / repeats
+
+
+def connect(address):
+    master = PairConnection((ZmqEndpoint("bind", address),))
+    slave = PairConnection((ZmqEndpoint("connect", address),))
+    return master, slave
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    ipc_file = tempfile.mktemp(prefix="veles-benchmark-")
+    tcp = connect("tcp://127.0.0.1:%d" % args.port)
+    ipc = connect("ipc://" + ipc_file)
+    ring = SharedRing("veles-benchmark-%d" % os.getpid())
+    table = PrettyTable("Size, MB", "tcp, MB/s", "ipc, MB/s",
+                        "ipc zero copy, MB/s", "Shared memory, MB/s",
+                        "Speedup")
+    try:
+        for size in args.sizes:
+            job = generate_job(size)
+            megabytes = sum(l["weights"].nbytes for l in job) / \
+                (1024.0 * 1024)
+            times = (
+                benchmark(tcp[0], tcp[1], job, args.repeats,
+                          pickles_compression=None),
+                benchmark(ipc[0], ipc[1], job, args.repeats,
+                          pickles_compression=None),
+                benchmark(ipc[0], ipc[1], job, args.repeats, zero_copy=True),
+                benchmark(ipc[0], ipc[1], job, args.repeats, ring=ring))
+            table.add_row(size, *([megabytes / t for t in times] +
+                                  [min(times[:-1]) / times[-1]]))
+    finally:
+        ring.close()
+        for connection in tcp + ipc:
+            connection.shutdown()
+        if os.path.exists(ipc_file):
+            os.remove(ipc_file)
+    print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 13, 2015
+
+This script measures the throughput of master-slave job round trips through
+:class:`veles.txzmq.connection.ZmqConnection`: the job with the given amount
+of parameters is sent to the slave, which sends it back as the update. The
+pickled transport is compared with the zero copy one.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import logging
+
+import numpy
+import zmq
+from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
+from veles.memory import Array
+import veles.prng as prng
+from veles.timeit2 import timeit
+from veles.txzmq.connection import ZmqConnection, ZmqEndpoint
+
+
+class PairConnection(ZmqConnection):
+    socketType = zmq.PAIR
+
+    def messageReceived(self, message):
+        self.received = message
+
+    def receive(self):
+        self.received = None
+        while self.received is None:
+            self.doRead()
+        return self.received
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ZeroMQ job round trips",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+",
+                        default=[10, 100, 500],
+                        help="The sizes of the jobs' parameters in megabytes.")
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="The number of round trips of each job.")
+    parser.add_argument("-a", "--address", default="tcp://127.0.0.1:5077",
+                        help="The ZeroMQ address to bind to.")
+    parser.add_argument("-c", "--compression", default=None,
+                        choices=sorted(c for c in ZmqConnection.CODECS if c),
+                        help="The compression of the pickled transport.")
+    return parser.parse_args()
+
+
+def generate_job(size):
+    """
+    Generates the job which resembles the parameters of a neural network:
+    several layers with the weights and the bias.
+    """
+    job = []
+    layer = size * 1024 * 1024 // 4 // 4
+    for _ in range(4):
+        job.append({
+            "weights": Array(prng.get().rand(layer).astype(numpy.float32)),
+            "bias": Array(numpy.zeros(100, numpy.float32))})
+    return job
+
+
+def benchmark(master, slave, job, repeats, **kwargs):
+    def round_trip():
+        for _ in range(repeats):
+            master.send(b"job", job, **kwargs)
+            _, data = slave.receive()
+            slave.send(b"update", data, **kwargs)
+            master.receive()
+            master.wait_buffers_sent()
+            slave.wait_buffers_sent()
+
+    return timeit(round_trip)[1] / repeats
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    master = PairConnection((ZmqEndpoint("bind", args.address),))
+    slave = PairConnection((ZmqEndpoint("connect", args.address),))
+    table = PrettyTable("Size, MB", "Pickled, MB/s", "Zero copy, MB/s",
+                        "Speedup")
+    try:
+        for size in args.sizes:
+            job = generate_job(size)
+            megabytes = 2.0 * sum(l["weights"].nbytes for l in job) / \
+                (1024 * 1024)
+            pickled = benchmark(master, slave, job, args.repeats,
+                                pickles_compression=args.compression)
+            zero_copy = benchmark(master, slave, job, args.repeats,
+                                  zero_copy=True)
+            table.add_row(size, megabytes / pickled, megabytes / zero_copy,
+                          pickled / zero_copy)
+    finally:
+        master.shutdown()
+        slave.shutdown()
+    print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 8, 2015
+
+This script converts the files written by
+:class:`veles.loader.saver.MinibatchesSaver` in the pickled chunks format to
+the random access format which :class:`veles.loader.saver.MinibatchesLoader`
+memory maps (see :mod:`veles.loader.minibatches_file`).
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import logging
+import os
+
+from veles.dot_pip import install_dot_pip
+install_dot_pip()
+from veles.loader.minibatches_file import CODECS
+from veles.loader.saver import convert_chunks_file
+from veles.logger import Logger
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Convert minibatches to the random access format",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not print logs.")
+    parser.add_argument("-c", "--compression", choices=sorted(CODECS),
+                        default="raw",
+                        help="Compress the blocks of samples with this codec "
+                             "(\"raw\" files are memory mapped).")
+    parser.add_argument("-l", "--compression-level", type=int, default=9,
+                        help="Compression level.")
+    parser.add_argument("-b", "--block-size", type=int, default=1024,
+                        help="The number of samples in each compressed "
+                             "block.")
+    parser.add_argument("input", help="Path to the existing file.")
+    parser.add_argument("output", help="Path to the converted file.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    Logger.setup_logging(logging.INFO if not args.quiet else logging.WARNING)
+    logger = logging.getLogger(os.path.splitext(os.path.basename(__file__))[0])
+    count = convert_chunks_file(
+        args.input, args.output, args.compression, args.compression_level,
+        args.block_size)
+    logger.info("Converted %d samples: %s -> %s", count, args.input,
+                args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*-coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 17, 2015
+
+This script load tests the running RESTful API service
+(:class:`veles.restful_api.RESTfulAPI`): it sends the same random sample in
+each of the supported formats with the given concurrency and reports the
+requests and the samples per second and the latency percentiles. The JSON
+codecs ("list" and "base64") are compared with the binary ones ("raw" and
+"npy", optionally with several samples per request).
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import argparse
+import base64
+import json
+import time
+
+import numpy
+from six import BytesIO
+from twisted.internet import defer
+from twisted.internet.task import react
+from twisted.web.client import Agent, FileBodyProducer, HTTPConnectionPool, \
+    readBody
+from twisted.web.http_headers import Headers
+
+from veles.external.prettytable import PrettyTable
+import veles.prng as prng
+from veles.restful_api import JSON_TYPE, RAW_TYPE, NPY_TYPE
+
+
+CODECS = ("list", "base64", "raw", "npy")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Load test the RESTful API service",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", help="The API URL, e.g., "
+                                    "http://localhost:8180/api")
+    parser.add_argument("-s", "--shape", type=int, nargs="+",
+                        default=[224, 224, 3], help="The shape of a sample.")
+    parser.add_argument("-t", "--type", default="float32",
+                        help="The data type of a sample (see numpy.dtype).")
+    parser.add_argument("-n", "--requests", type=int, default=1000,
+                        help="The number of requests in each format.")
+    parser.add_argument("-c", "--concurrency", type=int, default=16,
+                        help="The number of simultaneous requests.")
+    parser.add_argument("-b", "--batch", type=int, default=1,
+                        help="Also send this number of samples per request "
+                             "in the binary formats.")
+    parser.add_argument("--codecs", nargs="+", default=list(CODECS),
+                        choices=CODECS, help="The formats to test.")
+    return parser.parse_args()
+
+
+def encode(codec, samples, batch=False):
+    """
+    :return: The headers and the body of the request.
+    """
+    if codec == "list":
+        return {b"Content-Type": [JSON_TYPE]}, json.dumps(
+            {"input": samples.tolist(), "codec": "list"}).encode("utf-8")
+    if codec == "base64":
+        return {b"Content-Type": [JSON_TYPE]}, json.dumps(
+            {"input": base64.b64encode(samples.tobytes()).decode("charmap"),
+             "codec": "base64", "shape": list(samples.shape),
+             "type": samples.dtype.name}).encode("utf-8")
+    headers = {b"X-Veles-Batch": [b"1" if batch else b"0"]}
+    if codec == "npy":
+        headers[b"Content-Type"] = [NPY_TYPE]
+        fio = BytesIO()
+        numpy.save(fio, samples)
+        return headers, fio.getvalue()
+    headers.update({
+        b"Content-Type": [RAW_TYPE],
+        b"X-Veles-Shape": [",".join(
+            str(d) for d in samples.shape).encode("charmap")],
+        b"X-Veles-Type": [samples.dtype.str.encode("charmap")]})
+    return headers, samples.tobytes()
+
+
+def load(agent, url, headers, body, requests, concurrency):
+    """
+    Sends the requests, keeping concurrency of them in flight.
+    :return: Deferred which fires with the latencies of the successful
+    requests, the number of the failed ones and the total time.
+    """
+    finished = defer.Deferred()
+    latencies = []
+    state = {"sent": 0, "done": 0, "errors": 0, "start": time.time()}
+
+    def check(response, start):
+        if response.code != 200:
+            state["errors"] += 1
+        else:
+            latencies.append(time.time() - start)
+
+    def failed(failure):
+        state["errors"] += 1
+
+    def done(_):
+        state["done"] += 1
+        if state["done"] == requests:
+            finished.callback((latencies, state["errors"],
+                               time.time() - state["start"]))
+        else:
+            send()
+
+    def send():
+        if state["sent"] == requests:
+            return
+        state["sent"] += 1
+        d = agent.request(b"POST", url, Headers(headers),
+                          FileBodyProducer(BytesIO(body)))
+        d.addCallback(lambda response, start: readBody(response).addCallback(
+            lambda _: check(response, start)), time.time())
+        d.addErrback(failed)
+        d.addBoth(done)
+
+    for _ in range(min(concurrency, requests)):
+        send()
+    return finished
+
+
+@defer.inlineCallbacks
+def run(reactor, args):
+    url = args.url.encode("charmap")
+    pool = HTTPConnectionPool(reactor)
+    pool.maxPersistentPerHost = args.concurrency
+    agent = Agent(reactor, pool=pool)
+    sample = prng.get().rand(*args.shape).astype(args.type)
+    variants = [(codec, 1) for codec in args.codecs]
+    if args.batch > 1:
+        variants.extend((codec, args.batch) for codec in args.codecs
+                        if codec in ("raw", "npy"))
+    table = PrettyTable("Format", "Request, KB", "Requests/s", "Samples/s",
+                        "p50, ms", "p99, ms", "Errors")
+    for codec, batch in variants:
+        samples = numpy.repeat(sample[numpy.newaxis], batch, 0) \
+            if batch > 1 else sample
+        headers, body = encode(codec, samples, batch > 1)
+        latencies, errors, elapsed = yield load(
+            agent, url, headers, body, args.requests, args.concurrency)
+        p50, p99 = numpy.percentile(latencies, (50, 99)) * 1000 \
+            if latencies else (float("nan"),) * 2
+        table.add_row("%s x %d" % (codec, batch) if batch > 1 else codec,
+                      len(body) // 1024, args.requests / elapsed,
+                      args.requests * batch / elapsed, p50, p99, errors)
+    print(table)
+
+
+def main():
+    args = parse_args()
+    react(run, (args,))
+
+if __name__ == "__main__":
+    main()
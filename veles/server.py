@@ -53,10 +53,12 @@ import zmq
 from veles.cmdline import CommandLineArgumentsRegistry
 from veles.config import root
 import veles.external.fysom as fysom
-from veles.txzmq import ZmqConnection, ZmqEndpoint, SharedIO
+from veles.txzmq import ZmqConnection, ZmqEndpoint, SharedRing
 from veles.logger import Logger
 from veles.network_common import NetworkAgent, StringLineReceiver, IDLogger
+from veles.scheduler import Scheduler, SchedulingPolicyRegistry
 from veles.thread_pool import errback
+from veles.update_batcher import UpdateBatcher
 
 
 class ZmqRouter(ZmqConnection, Logger):
@@ -68,19 +70,21 @@ class ZmqRouter(ZmqConnection, Logger):
         'update':
         lambda protocol, payload: protocol.updateReceived(payload)
     }
-    RESERVE_SHMEM_SIZE = 0.05
-
     def __init__(self, host, *endpoints, **kwargs):
         super(ZmqRouter, self).__init__(endpoints, logger=kwargs.get("logger"))
         ignore_unknown_commands = kwargs.get("ignore_unknown_commands", False)
         self.host = host
         self.routing = {b'job': {}, b'update': {}}
-        self.shmem = {}
+        self.rings = {}
         self.use_shmem = kwargs.get('use_shared_memory', True)
         self._command = None
         self._command_str = None
         self.ignore_unknown_commands = ignore_unknown_commands
         self.pickles_compression = root.common.engine.network_compression
+        self.zero_copy = root.common.engine.network_zero_copy
+        # The nodes which are sent jobs without zero copy, see
+        # VelesServer._apply_updates()
+        self.copying_nodes = set()
 
     def change_log_message(self, msg):
         return "zmq: " + msg
@@ -141,33 +145,62 @@ class ZmqRouter(ZmqConnection, Logger):
     def reply(self, node_id, channel, message):
         self.event("ZeroMQ", "begin", dir="send", id=node_id,
                    command=channel.decode('charmap'), height=0.5)
-        if self.use_shmem:
-            is_ipc = self.host.nodes[node_id]['endpoint'].startswith("ipc://")
-            io_overflow = False
-            shmem = self.shmem.get(node_id)
-            if shmem is not None and channel == b"job":
-                self.shmem[node_id].seek(0)
+        node = self.host.nodes.get(node_id, {})
+        is_ipc = node.get('endpoint', "").startswith("ipc://")
+        ring = self.get_ring(node_id) if channel == b"job" else None
         try:
-            pickles_size = self.send(
+            self.send(
                 self.routing[channel].pop(node_id), channel, message,
-                io=shmem, pickles_compression=self.pickles_compression
-                if not is_ipc else None)
-        except ZmqConnection.IOOverflow:
-            pickles_size = shmem.size
-            self.shmem[node_id] = None
-            io_overflow = True
+                ring=ring, pickles_compression=self.pickles_compression
+                if not is_ipc else None, buffers_key=node_id,
+                zero_copy=self.zero_copy and
+                node_id not in self.copying_nodes)
         except KeyError:
             self.warning("Could not find node %s on channel %s",
                          node_id, channel)
             return
-        if self.use_shmem and is_ipc and channel == b"job":
-            if io_overflow or self.shmem.get(node_id) is None:
-                self.shmem[node_id] = SharedIO(
-                    "veles-job-" + node_id,
-                    int(pickles_size * (1.0 + ZmqRouter.RESERVE_SHMEM_SIZE)))
         self.event("ZeroMQ", "end", dir="send", id=node_id,
                    command=channel.decode('charmap'), height=0.5)
 
+    def get_ring(self, node_id):
+        """
+        Returns the shared memory ring for the jobs of the slave or None if
+        the slave is not on the same host or does not support it. If the ring
+        cannot be created, the slave falls back to the regular transport.
+        """
+        if not self.use_shmem:
+            return None
+        ring = self.rings.get(node_id)
+        if ring is not None or node_id in self.rings:
+            return ring
+        node = self.host.nodes.get(node_id, {})
+        if not node.get("shared_memory") or \
+                not node.get('endpoint', "").startswith("ipc://"):
+            return None
+        try:
+            ring = SharedRing("veles-job-" + node_id)
+            self.debug("Allocated the shared memory ring for %s", node_id)
+        except Exception as e:
+            self.warning("Failed to allocate the shared memory ring for %s, "
+                         "falling back to ZeroMQ: %s", node_id, e)
+            ring = None
+        self.rings[node_id] = ring
+        return ring
+
+    def shutdown(self):
+        for node_id in list(self.rings):
+            self.release_ring(node_id)
+        super(ZmqRouter, self).shutdown()
+
+    def release_ring(self, node_id):
+        ring = self.rings.pop(node_id, None)
+        if ring is not None:
+            self.debug("Releasing the shared memory ring of %s (%d jobs, "
+                       "%d fallbacks, grew %d times up to %d bytes)",
+                       node_id, ring.writes, ring.overflows, ring.grows,
+                       ring.capacity)
+            ring.close()
+
 
 class SlaveDescription(namedtuple(
         "SlaveDescriptionTuple",
@@ -269,6 +302,8 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self._id = None
         self._not_a_slave = False
         self._balance = 0
+        self._jobs_window = 1
+        self._generating = False
         self._endpoint = None
         self.state = fysom.Fysom(VelesProtocol.FSM_DESCRIPTION, self)
         self._responders = {"handshake": self._handshake,
@@ -322,13 +357,18 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             self.host.job_requests.remove(self)
         except KeyError:
             pass
+        connection = self.host.zmq_connection
+        connection.release_ring(self.id)
+        connection.copying_nodes.discard(self.id)
+        connection.forget_buffers((self.id,))
         if not self.host.workflow.is_running:
             self._erase_self(True)
             if len(self.host.protocols) == 0:
                 self.host.launcher.stop()
         elif self.id in self.nodes:
-            d = threads.deferToThreadPool(
-                reactor, self.host.workflow.thread_pool,
+            self.host.scheduler.remove(self.id)
+            # Drop after the updates of this slave which are still queued
+            d = self.host.update_batcher.call(
                 self.host.workflow.drop_slave,
                 SlaveDescription.make(self.nodes[self.id])) \
                 .addErrback(errback)
@@ -364,9 +404,11 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             self.warning("found in the blacklist, refusing the job")
             self._refuseJob()
         else:
+            self.host.scheduler.job_requested(self.id)
             self._requestJob()
 
     def jobRequestFinished(self, data):
+        self._generating = False
         if self.state.current != "GETTING_JOB":
             return
         if data is not None:
@@ -400,18 +442,18 @@ class VelesProtocol(StringLineReceiver, IDLogger):
 
     def updateReceived(self, data):
         self.debug("update was received")
-        if self._balance == 1:
+        if self._balance == 1 and self.state.current == 'WORK':
             self.state.idle()
-        upd = threads.deferToThreadPool(
-            reactor, self.host.workflow.thread_pool,
-            self.host.workflow.apply_data_from_slave, data,
-            SlaveDescription.make(self.nodes[self.id]))
+        upd = self.host.update_batcher.submit(
+            data, SlaveDescription.make(self.nodes[self.id]))
         upd.addCallback(self.updateFinished)
         upd.addErrback(errback)
         now = time.time()
         self.jobs_processed.append(now - self._last_job_submit_time)
         self.nodes[self.id]['jobs'] = len(self.jobs_processed)
         self._last_job_submit_time = now
+        self.host.scheduler.job_finished(self.id, self.jobs_processed[-1])
+        self._updateSchedulerStats()
 
     def updateFinished(self, result):
         if self.state.current not in ('WORK', 'GETTING_JOB', 'IDLE'):
@@ -425,7 +467,10 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self._balance -= 1
         self.debug("update was finished, balance is %d now", self._balance)
         if self.state.current == 'GETTING_JOB':
-            self._requestJob()
+            # The slave may have requested the next job before sending this
+            # update, do not generate it twice
+            if not self._generating:
+                self._requestJob()
             return
         self._retryJobRequests()
 
@@ -443,9 +488,13 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 del self.nodes[self.id]
 
     def _retryJobRequests(self, _=None):
-        while len(self.host.job_requests) > 0:
-            requester = self.host.job_requests.pop()
-            requester._requestJob()
+        requesters = {r.id: r for r in self.host.job_requests}
+        self.host.job_requests.clear()
+        for sid in self.host.scheduler.order(requesters):
+            requesters[sid]._requestJob()
+
+    def _updateSchedulerStats(self):
+        self.nodes[self.id].update(self.host.scheduler.describe(self.id))
 
     def _checkQuery(self, msg):
         """Respond to possible informational requests.
@@ -491,6 +540,8 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             self._sendError("Workflow checksum mismatch: "
                             "expected %s, got %s" % (mysha, your_sha))
             return
+        encodings = self.host.workflow.negotiate_update_encodings(
+            msg.get("update_encodings", ()))
         must_reply = False
         msgid = msg.get("id")
         if msgid is None:
@@ -502,7 +553,9 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 self.warning("Did not recognize the received ID %s")
                 must_reply = True
             else:
-                self.sendLine({'reconnect': "ok"})
+                self.host.scheduler.report(self.id, msg.get("power", 0))
+                self.sendLine({'reconnect': "ok",
+                               'update_encodings': encodings})
         if must_reply:
             try:
                 _, mid, pid = self._extractClientInformation(msg)
@@ -513,7 +566,8 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 SlaveDescription.make(self.nodes[self.id]))
             endpoint = self.host.choose_endpoint(self.id, mid, pid, self.hip)
             self.nodes[self.id]['endpoint'] = self._endpoint = endpoint
-            retmsg = {'endpoint': endpoint, 'data': data}
+            retmsg = {'endpoint': endpoint, 'data': data,
+                      'update_encodings': encodings}
             if not msgid:
                 retmsg['id'] = self.id
             retmsg['log_id'] = self.host.launcher.log_id
@@ -526,16 +580,18 @@ class VelesProtocol(StringLineReceiver, IDLogger):
                 data, SlaveDescription.make(self.nodes[self.id])) \
                 .addErrback(errback)
             self.nodes[self.id]['data'] = [d for d in data if d is not None]
+        self._jobs_window = max(1, int(msg.get("prefetch_jobs", 1)))
         self.state.identify()
 
     def _changePower(self, msg, line):
         try:
             power = msg['power']
-            self.nodes[self.id]['power'] = power
-            self.info("power changed to %.2f", power)
         except KeyError:
             self.error("no 'power' key in the message")
-        return
+            return
+        self.host.scheduler.report(self.id, power, msg.get('transfer_time'))
+        self._updateSchedulerStats()
+        self.info("power changed to %.2f", self.nodes[self.id]['power'])
 
     def _extractClientInformation(self, msg):
         power = msg.get("power")
@@ -560,7 +616,10 @@ class VelesProtocol(StringLineReceiver, IDLogger):
             "power": power, "mid": mid, "pid": pid, "id": self.id, "jobs": 0,
             "backend": msg.get("backend"), "device": msg.get("device"),
             "argv": msg.get("argv"), "executable": msg.get("executable"),
-            "PYTHONPATH": msg.get("PYTHONPATH"), "cwd": msg.get("cwd")}
+            "PYTHONPATH": msg.get("PYTHONPATH"), "cwd": msg.get("cwd"),
+            "shared_memory": msg.get("shared_memory", False)}
+        self.host.scheduler.report(self.id, power)
+        self._updateSchedulerStats()
         dns.lookupPointer(
             ".".join(reversed(self.addr.host.split("."))) + ".in-addr.arpa") \
             .addCallback(self._resolveAddr).addErrback(self._failToResolveAddr)
@@ -594,11 +653,14 @@ class VelesProtocol(StringLineReceiver, IDLogger):
         self.sendLine({"error": err})
 
     def _requestJob(self):
-        if self._balance > 1:
+        # The slave holds up to _jobs_window jobs; one more is allowed to
+        # overlap sending the update in async mode
+        if self._balance > self._jobs_window:
             self.debug("job balance %d, will give the job after applying "
                        "the update", self._balance)
             return
         self._balance += 1
+        self._generating = True
         self.debug("generating the job, balance is %d", self._balance)
         if self._last_job_submit_time == 0:
             self._last_job_submit_time = time.time()
@@ -673,6 +735,11 @@ class Server(NetworkAgent, ServerFactory):
         self.job_requests = set()
         self.blacklist = set()
         self.paused_nodes = {}
+        self.scheduler = Scheduler(self.args.scheduler, logger=self.logger)
+        self.update_batcher = UpdateBatcher(
+            self._apply_updates, max_batch=self.args.update_batch,
+            max_queue=self.args.update_queue, logger=self.logger)
+        self.update_batcher.start()
         fqdn = socket.getfqdn()
         host = socket.gethostname()
         self.domain_name = fqdn[len(host) + 1:] if fqdn != host else ""
@@ -716,6 +783,23 @@ class Server(NetworkAgent, ServerFactory):
         parser.add_argument("--respawn", default=False,
                             help="Relaunch dropped slaves via SSH.",
                             action='store_true').mode = ("master",)
+        parser.add_argument(
+            "--scheduler", default=kwargs.get("scheduler", "round_robin"),
+            choices=sorted(SchedulingPolicyRegistry.policies),
+            help="The policy of distributing the jobs between the slaves: "
+                 "round_robin serves them in the order of requests, "
+                 "weighted serves the fastest first and sets their power "
+                 "to the measured throughput, work_stealing serves the "
+                 "ones which are expected to finish first.") \
+            .mode = ("master",)
+        parser.add_argument("--update-batch", type=int,
+                            default=kwargs.get("update_batch", 8),
+                            help="Apply up to this number of pending updates "
+                            "from slaves in one pass.").mode = ("master",)
+        parser.add_argument("--update-queue", type=int,
+                            default=kwargs.get("update_queue", 64),
+                            help="The maximal number of updates from slaves "
+                            "waiting to be applied.").mode = ("master",)
         return parser
 
     def choose_endpoint(self, sid, mid, pid, hip):
@@ -745,11 +829,27 @@ class Server(NetworkAgent, ServerFactory):
             self.warning("Slave %s was not paused, so not resumed", slave_id)
 
     def print_stats(self):
-        pass
+        self.scheduler.print_stats(self.nodes)
+        self.update_batcher.print_stats()
 
     def buildProtocol(self, addr):
         return VelesProtocol(addr, self)
 
+    def _apply_updates(self, updates):
+        # Jobs sent with zero copy may still refer to the arrays which the
+        # updates are going to change
+        connection = self.zmq_connection
+        timeout = root.common.engine.network_zero_copy_timeout
+        stalled = connection.wait_buffers_sent(timeout)
+        if len(stalled) > 0:
+            self.warning(
+                "Slaves %s did not receive their jobs in %.1f sec, sending "
+                "them copies from now on", ", ".join(sorted(stalled)),
+                timeout)
+            connection.copying_nodes.update(stalled)
+            connection.forget_buffers(stalled)
+        return self.workflow.apply_data_from_slaves(updates)
+
     @property
     def active_nodes(self):
         nodes = {}
@@ -760,3 +860,4 @@ class Server(NetworkAgent, ServerFactory):
     def close(self):
         if self._listener_ is not None:
             self._listener_.stopListening()
+        self.update_batcher.stop()
@@ -38,18 +38,25 @@ under the License.
 import bz2
 from datetime import datetime
 import gzip
+import hashlib
 import logging
+import numpy
 import os
 import pyodbc
 from six import BytesIO, add_metaclass
 import snappy
+import threading
 import time
+import zlib
 from zope.interface import implementer, Interface
 
+from veles import block_codec
+from veles.block_codec import BlockFile
 from veles.compat import lzma, from_none, FileNotFoundError
 from veles.config import root
 from veles.distributable import IDistributable
 from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
 from veles.mapped_object_registry import MappedObjectsRegistry
 from veles.mutable import Bool
 from veles.pickle2 import pickle, best_protocol
@@ -61,8 +68,25 @@ from veles.units import Unit, IUnit
 class ISnapshotter(Interface):
     def export():
         """
-        Performs the actual snapshot generation.
-        :return: None
+        Takes the snapshot on the calling thread, streaming the workflow
+        directly to the destination.
+        :return: The size of the snapshot in bytes.
+        """
+
+    def capture():
+        """
+        Takes the consistent state of the workflow to be written by write().
+        Executed on the workflow's thread; the returned object must not share
+        memory with the workflow since write() is called in parallel with the
+        workflow's execution.
+        :return: SnapshotCapture instance.
+        """
+
+    def write(capture):
+        """
+        Writes the snapshot from the captured state. Executed on a background
+        thread.
+        :return: The size of the snapshot in bytes.
         """
 
 
@@ -79,6 +103,21 @@ class SnapshotterRegistry(UnitRegistry, MappedObjectsRegistry):
     mapping = "snapshotters"
 
 
+class SnapshotCapture(object):
+    """The state of the workflow taken by ISnapshotter.capture().
+
+    Attributes:
+        destination - where the snapshot is going to be written
+        data - the pickled workflow without the big arrays (bytes)
+        arrays - the copies of the big arrays which data refers to by index
+    """
+
+    def __init__(self, destination, data, arrays):
+        self.destination = destination
+        self.data = data
+        self.arrays = arrays
+
+
 @implementer(IUnit, IDistributable, IResultProvider)
 @add_metaclass(SnapshotterRegistry)
 class SnapshotterBase(Unit):
@@ -93,15 +132,24 @@ class SnapshotterBase(Unit):
 
     Attributes:
         compression - the compression applied to pickles: None or '', snappy,
-                      gz, bz2, xz
+                      gz, bz2, xz or their block-parallel variants pgz, pbz2,
+                      pxz (see veles.block_codec)
         compression_level - the compression level in [0..9]
         interval - take only one snapshot within this run() invocations number
         time_interval - take no more than one snapshot within this time window
         skip - If True, run() is skipped but _skipped_counter is incremented.
+        asynchronous - If True, the snapshot is written in a background thread
+                       while the workflow continues to run.
+        async_policy - what to do if the previous asynchronous snapshot is
+                       still being written: "skip" the new one or "wait" for
+                       the previous to finish.
     """
 
     hide_from_registry = True
     SIZE_WARNING_THRESHOLD = 200 * 1000 * 1000
+    ASYNC_POLICIES = "skip", "wait"
+    HEADER_KEY = "veles_snapshot"
+    HEADER_VERSION = 1
 
     def __init__(self, workflow, **kwargs):
         kwargs["view_group"] = kwargs.get("view_group", "SERVICE")
@@ -120,11 +168,19 @@ class SnapshotterBase(Unit):
         self._skipped_counter = 0
         self.skip = Bool(False)
         self._warn_about_size = kwargs.get("warn_about_size", True)
+        self.asynchronous = kwargs.get("asynchronous", False)
+        self.async_policy = kwargs.get("async_policy", "skip")
         self.demand("suffix")
 
     def init_unpickled(self):
         super(SnapshotterBase, self).init_unpickled()
         self._slaves = {}
+        self._export_thread_ = None
+        self._export_failed_ = False
+        self._capture_time_ = 0
+        self._write_time_ = 0
+        self._last_size_ = 0
+        self._skipped_snapshots_ = 0
 
     def __getstate__(self):
         state = super(SnapshotterBase, self).__getstate__()
@@ -150,6 +206,37 @@ class SnapshotterBase(Unit):
                 "warn_about_size must be boolean (got %s)" % type(value))
         self._warn_about_size = value
 
+    @property
+    def asynchronous(self):
+        return self._asynchronous
+
+    @asynchronous.setter
+    def asynchronous(self, value):
+        if not isinstance(value, bool):
+            raise TypeError(
+                "asynchronous must be boolean (got %s)" % type(value))
+        self._asynchronous = value
+
+    @property
+    def async_policy(self):
+        return self._async_policy
+
+    @async_policy.setter
+    def async_policy(self, value):
+        if value not in SnapshotterBase.ASYNC_POLICIES:
+            raise ValueError(
+                "async_policy must be one of %s (got %s)" %
+                (", ".join(SnapshotterBase.ASYNC_POLICIES), value))
+        self._async_policy = value
+
+    @property
+    def is_writing(self):
+        """
+        True if an asynchronous snapshot is being written at the moment.
+        """
+        return self._export_thread_ is not None and \
+            self._export_thread_.is_alive()
+
     def initialize(self, **kwargs):
         self.time = time.time()
         self.debug("Compression is set to %s", self.compression)
@@ -169,17 +256,124 @@ class SnapshotterBase(Unit):
         if delta < self.time_interval:
             self.debug("%f < %f, dropped", delta, self.time_interval)
             return
-        self.export()
+        if self.asynchronous:
+            if not self.export_async():
+                return
+        else:
+            self._export()
         self.time = time.time()
         return True
 
     def stop(self):
+        self.wait()
         if self._skipped_counter > 0 and not self.skip:
             self._skipped_counter = 0
-            self.export()
+            self._export()
+
+    def export_async(self):
+        """
+        Captures the workflow's state and writes the snapshot in a background
+        thread.
+        :return: False if the snapshot was skipped because the previous one
+        is still being written; otherwise, True.
+        """
+        if self.is_writing:
+            if self.async_policy == "skip":
+                self._skipped_snapshots_ += 1
+                self.warning("The previous snapshot is still being written, "
+                             "skipped this one")
+                return False
+            self.debug("Waiting for the previous snapshot to be written...")
+        self.wait()
+        start = time.time()
+        capture = self.capture()
+        self._capture_time_ = time.time() - start
+        self.debug("Captured the state in %.3f sec", self._capture_time_)
+        self._export_thread_ = threading.Thread(
+            target=self._write_async, args=(capture,),
+            name="%s export" % self.name)
+        self._export_thread_.start()
+        return True
+
+    def wait(self):
+        """
+        Waits for the asynchronous snapshot to be written.
+        """
+        thread = self._export_thread_
+        if thread is None:
+            return
+        thread.join()
+        self._export_thread_ = None
+        if not self._export_failed_:
+            self.check_snapshot_size(self._last_size_)
+        self._export_failed_ = False
+
+    def _export(self):
+        self.wait()
+        start = time.time()
+        self._last_size_ = self.export()
+        self._capture_time_ = 0
+        self._write_time_ = time.time() - start
+        self.check_snapshot_size(self._last_size_)
+
+    def _write_async(self, capture):
+        start = time.time()
+        try:
+            self._last_size_ = self.write(capture)
+        except:
+            self._export_failed_ = True
+            self.exception("Failed to write the snapshot to %s",
+                           capture.destination)
+            return
+        self._write_time_ = time.time() - start
+        self.debug("Wrote %d bytes in %.3f sec", self._last_size_,
+                   self._write_time_)
+
+    def _capture(self, destination, threshold=64 * 1024):
+        """
+        Pickles the workflow, copying the arrays which are at least threshold
+        bytes big aside instead of pickling them. Thus the memory overhead is
+        roughly the size of the copied arrays and not the size of the whole
+        pickle plus the copies.
+        """
+        arrays = []
+
+        def persistent_id(obj):
+            if not isinstance(obj, numpy.ndarray) or obj.dtype.hasobject or \
+                    obj.nbytes < threshold:
+                return None
+            arrays.append(numpy.array(obj, order="C"))
+            return len(arrays) - 1
+
+        fio = BytesIO()
+        pickler = pickle.Pickler(fio, best_protocol)
+        pickler.persistent_id = persistent_id
+        pickler.dump(self.workflow)
+        return SnapshotCapture(destination, fio.getvalue(), arrays)
+
+    @staticmethod
+    def _dump_header(fout, **kwargs):
+        """
+        Writes the header which precedes the workflow in the snapshots which
+        are not plain pickles.
+        """
+        header = {SnapshotterBase.HEADER_KEY: SnapshotterBase.HEADER_VERSION,
+                  "arrays": 0, "blobs": []}
+        header.update(kwargs)
+        pickle.dump(header, fout, protocol=best_protocol)
+
+    @staticmethod
+    def _dump_capture(fout, capture):
+        """
+        Writes the captured state with the arrays inlined after the header.
+        """
+        SnapshotterBase._dump_header(fout, arrays=len(capture.arrays))
+        for arr in capture.arrays:
+            pickle.dump(arr, fout, protocol=best_protocol)
+        fout.write(capture.data)
 
     def generate_data_for_slave(self, slave):
-        self.slaves[slave.id] = 1
+        self.slaves[slave.id] = self.slaves.get(slave.id, 0) + 1
 
     def generate_data_for_master(self):
         return True
@@ -192,13 +386,18 @@ class SnapshotterBase(Unit):
 
     def drop_slave(self, slave):
         if slave.id in self.slaves:
-            self._slave_ended(slave)
+            self._slave_ended(slave, True)
 
     def get_metric_names(self):
-        return {"Snapshot"}
+        return {"Snapshot", "Snapshot capture time", "Snapshot write time",
+                "Snapshot size", "Snapshots skipped"}
 
     def get_metric_values(self):
-        return {"Snapshot": self.destination}
+        return {"Snapshot": self.destination,
+                "Snapshot capture time": self._capture_time_,
+                "Snapshot write time": self._write_time_,
+                "Snapshot size": self._last_size_,
+                "Snapshots skipped": self._skipped_snapshots_}
 
     def check_snapshot_size(self, size):
         if size > self.SIZE_WARNING_THRESHOLD and self._warn_about_size:
@@ -224,24 +423,53 @@ class SnapshotterBase(Unit):
                 "The snapshot size looks too big: %d bytes. Here are top 5 "
                 "big units:\n%s", size, pstable)
 
-    def _slave_ended(self, slave):
+    def _slave_ended(self, slave, dropped=False):
         if slave is None:
             return
         if slave.id not in self.slaves:
             return
+        self.slaves[slave.id] -= 1
+        if self.slaves[slave.id] > 0 and not dropped:
+            return
         del self.slaves[slave.id]
         if not (len(self.slaves) or self.gate_skip or self.gate_block):
             self.run()
 
     @staticmethod
-    def _import_fobj(fobj):
+    def _unpickle(fobj, persistent_load=None):
         try:
-            obj = pickle.load(fobj)
+            if persistent_load is None:
+                return pickle.load(fobj)
+            unpickler = pickle.Unpickler(fobj)
+            unpickler.persistent_load = persistent_load
+            return unpickler.load()
         except ImportError as e:
             logging.getLogger("Snapshotter").error(
                 "Are you trying to import snapshot belonging to a different "
                 "workflow?")
             raise from_none(e)
+
+    @staticmethod
+    def _import_fobj(fobj, blob_store=None):
+        """
+        Reads either a plain pickle or the header followed by the inlined
+        arrays and the workflow which refers to them (or to the blobs in
+        blob_store) by index.
+        """
+        refs = []
+
+        def persistent_load(pid):
+            ref = refs[pid] if isinstance(pid, int) else pid
+            if isinstance(ref, tuple):
+                return blob_store.persistent_load(ref)
+            return ref
+
+        obj = SnapshotterBase._unpickle(fobj, persistent_load)
+        if isinstance(obj, dict) and SnapshotterBase.HEADER_KEY in obj:
+            refs.extend(obj["blobs"])
+            refs.extend(SnapshotterBase._unpickle(fobj)
+                        for _ in range(obj["arrays"]))
+            obj = SnapshotterBase._unpickle(fobj, persistent_load)
         obj._restored_from_snapshot_ = True
         return obj
 
@@ -356,11 +584,195 @@ class SnappyFile(object):
         self.close()
 
 
+class BlobStore(Logger):
+    """Content addressed storage of numpy arrays for chunked snapshots.
+    Arrays bigger than threshold bytes are written to separate files named
+    after the SHA1 of their contents, so the arrays which did not change since
+    the previous snapshot are not written again. Uncompressed blobs are
+    loaded lazily as copy-on-write memory maps.
+
+    Use persistent_id() with pickle.Pickler and persistent_load() with
+    pickle.Unpickler. store() writes the arrays copied aside by an
+    asynchronous capture.
+
+    The blobs referenced by each snapshot are listed in refs/<snapshot name>
+    by save_references(). collect_garbage() removes the blobs which are not
+    listed for any existing snapshot.
+    """
+
+    REFS_DIR = "refs"
+    #: Blobs which were written or reused less than this number of seconds
+    #: ago are never removed since a concurrent snapshot may refer to them
+    GC_GRACE_PERIOD = 3600
+
+    #: name -> (compress(buffer, level), decompress(buffer))
+    CODECS = {
+        None: (None, None),
+        "snappy": (lambda b, _: snappy.compress(b), snappy.decompress),
+        "gz": (zlib.compress, zlib.decompress),
+        "bz2": (bz2.compress, bz2.decompress),
+        "xz": (lambda b, l: lzma.compress(b, preset=l), lzma.decompress),
+        "pgz": (lambda b, l: block_codec.compress(b, "gz", l),
+                block_codec.decompress),
+        "pbz2": (lambda b, l: block_codec.compress(b, "bz2", l),
+                 block_codec.decompress),
+        "pxz": (lambda b, l: block_codec.compress(b, "xz", l),
+                block_codec.decompress),
+    }
+
+    def __init__(self, directory, compression=None, compression_level=6,
+                 threshold=64 * 1024):
+        super(BlobStore, self).__init__()
+        if compression == "":
+            compression = None
+        if compression not in BlobStore.CODECS:
+            raise ValueError("Unsupported blob compression \"%s\"" %
+                             compression)
+        self.directory = directory
+        self.compression = compression
+        self.compression_level = compression_level
+        self.threshold = threshold
+        self.written = 0
+        self.written_bytes = 0
+        self.reused = 0
+        self.referenced = set()
+
+    def path(self, digest, compression):
+        return os.path.join(
+            self.directory, "%s.%s" % (digest, compression or "raw"))
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, numpy.ndarray) or obj.dtype.hasobject or \
+                obj.nbytes < self.threshold:
+            return None
+        return self.put(obj)
+
+    def persistent_load(self, pid):
+        kind, digest, compression, dtype, shape = pid
+        if kind != "blob":
+            raise pickle.UnpicklingError(
+                "Unsupported persistent id \"%s\"" % kind)
+        path = self.path(digest, compression)
+        if compression is None:
+            return numpy.memmap(path, dtype=dtype, mode="c", shape=shape)
+        with open(path, "rb") as fin:
+            data = BlobStore.CODECS[compression][1](fin.read())
+        return numpy.frombuffer(data, dtype=dtype).reshape(shape).copy()
+
+    def put(self, arr):
+        """
+        Writes the array if it does not exist in the storage yet.
+        :return: The reference to the blob.
+        """
+        arr = numpy.ascontiguousarray(arr)
+        digest = hashlib.sha1(arr.data).hexdigest()
+        path = self.path(digest, self.compression)
+        if os.path.exists(path):
+            self.reused += 1
+            # Refresh the modification time for collect_garbage()
+            os.utime(path, None)
+        else:
+            self._write(arr, path)
+        self.referenced.add(os.path.basename(path))
+        return "blob", digest, self.compression, arr.dtype.str, arr.shape
+
+    def store(self, arrays):
+        """
+        Writes the arrays which do not exist in the storage yet.
+        :return: The list of references to the blobs.
+        """
+        return [self.put(arr) for arr in arrays]
+
+    def save_references(self, name):
+        """
+        Records the blobs which were put so far as referenced by the snapshot
+        with the specified file name.
+        """
+        refs_dir = os.path.join(self.directory, BlobStore.REFS_DIR)
+        if not os.path.exists(refs_dir):
+            os.makedirs(refs_dir)
+        path = os.path.join(refs_dir, name)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as fout:
+            fout.write("\n".join(sorted(self.referenced)))
+        os.rename(tmp_path, path)
+
+    def collect_garbage(self, snapshots_directory):
+        """
+        Removes the blobs which are not referenced by any of the snapshots in
+        snapshots_directory. Does nothing if there are chunked snapshots
+        without the list of references, e.g. taken by an older version.
+        :return: The number of removed blobs and their total size in bytes.
+        """
+        refs_dir = os.path.join(self.directory, BlobStore.REFS_DIR)
+        names = set(os.listdir(refs_dir)) if os.path.isdir(refs_dir) \
+            else set()
+        for name in os.listdir(snapshots_directory):
+            if ".chunked.pickle" in name and name not in names and \
+                    not os.path.islink(os.path.join(snapshots_directory,
+                                                    name)):
+                self.warning("Blobs are not collected since %s does not "
+                             "list its references", name)
+                return 0, 0
+        alive = set()
+        for name in names:
+            path = os.path.join(refs_dir, name)
+            if name.endswith(".tmp"):
+                continue
+            if not os.path.exists(os.path.join(snapshots_directory, name)):
+                os.remove(path)
+                continue
+            with open(path, "r") as fin:
+                alive.update(fin.read().split())
+        removed = removed_bytes = 0
+        deadline = time.time() - BlobStore.GC_GRACE_PERIOD
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name in alive or name.endswith(".tmp") or \
+                    not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            if stat.st_mtime > deadline:
+                continue
+            os.remove(path)
+            removed += 1
+            removed_bytes += stat.st_size
+        return removed, removed_bytes
+
+    def _write(self, arr, path):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        if self.compression is None:
+            arr.tofile(tmp_path)
+        else:
+            with open(tmp_path, "wb") as fout:
+                fout.write(BlobStore.CODECS[self.compression][0](
+                    arr.tobytes(), self.compression_level))
+        self.written_bytes += os.path.getsize(tmp_path)
+        os.rename(tmp_path, path)
+        self.written += 1
+
+
 @implementer(ISnapshotter)
 class SnapshotterToFile(SnapshotterBase):
     """Takes workflow snapshots to the file system.
+
+    Attributes:
+        file_format - "pickle" to write the whole workflow into a single
+                      pickle or "chunked" to write the big arrays separately
+                      into the content addressed "blobs" subdirectory (see
+                      BlobStore)
+        blob_compression - the compression of the blobs in "chunked" format:
+                           None (memory mappable), snappy, gz, bz2, xz
+        blob_threshold - the minimal size of an array in bytes to become a
+                         blob
+        blob_gc - remove the blobs which are no longer referenced by any
+                  snapshot in the directory after each chunked snapshot
     """
     MAPPING = "file"
+    FILE_FORMATS = "pickle", "chunked"
+    BLOBS_DIR = "blobs"
 
     WRITE_CODECS = {
         None: lambda n, l: open(n, "wb"),
@@ -368,7 +780,10 @@ class SnapshotterToFile(SnapshotterBase):
         "snappy": lambda n, _: SnappyFile(n, "wb"),
         "gz": lambda n, l: gzip.GzipFile(n, "wb", compresslevel=l),
         "bz2": lambda n, l: bz2.BZ2File(n, "wb", compresslevel=l),
-        "xz": lambda n, l: lzma.LZMAFile(n, "wb", preset=l)
+        "xz": lambda n, l: lzma.LZMAFile(n, "wb", preset=l),
+        "pgz": lambda n, l: BlockFile(n, "wb", "gz", l),
+        "pbz2": lambda n, l: BlockFile(n, "wb", "bz2", l),
+        "pxz": lambda n, l: BlockFile(n, "wb", "xz", l)
     }
 
     READ_CODECS = {
@@ -376,27 +791,112 @@ class SnapshotterToFile(SnapshotterBase):
         "snappy": lambda n: SnappyFile(n, "rb"),
         "gz": lambda name: gzip.GzipFile(name, "rb"),
         "bz2": lambda name: bz2.BZ2File(name, "rb"),
-        "xz": lambda name: lzma.LZMAFile(name, "rb")
+        "xz": lambda name: lzma.LZMAFile(name, "rb"),
+        "pgz": lambda n: BlockFile(n, "rb"),
+        "pbz2": lambda n: BlockFile(n, "rb"),
+        "pxz": lambda n: BlockFile(n, "rb")
     }
 
     def __init__(self, workflow, **kwargs):
         kwargs["view_group"] = kwargs.get("view_group", "SERVICE")
         super(SnapshotterToFile, self).__init__(workflow, **kwargs)
         self.directory = kwargs.get("directory", root.common.dirs.snapshots)
+        self.file_format = kwargs.get("file_format", "pickle")
+        self.blob_compression = kwargs.get("blob_compression")
+        self.blob_threshold = kwargs.get("blob_threshold", 64 * 1024)
+        self.blob_gc = kwargs.get("blob_gc", True)
+
+    @property
+    def file_format(self):
+        return self._file_format
+
+    @file_format.setter
+    def file_format(self, value):
+        if value not in SnapshotterToFile.FILE_FORMATS:
+            raise ValueError(
+                "file_format must be one of %s (got %s)" %
+                (", ".join(SnapshotterToFile.FILE_FORMATS), value))
+        self._file_format = value
+
+    @property
+    def blob_compression(self):
+        return self._blob_compression
+
+    @blob_compression.setter
+    def blob_compression(self, value):
+        if value not in BlobStore.CODECS and value != "":
+            raise ValueError("Unsupported blob compression \"%s\"" % value)
+        self._blob_compression = value or None
+
+    @property
+    def blob_gc(self):
+        return self._blob_gc
+
+    @blob_gc.setter
+    def blob_gc(self, value):
+        if not isinstance(value, bool):
+            raise TypeError("blob_gc must be boolean (got %s)" % type(value))
+        self._blob_gc = value
 
     def export(self):
-        ext = ("." + self.compression) if self.compression else ""
-        rel_file_name = "%s_%s.%d.pickle%s" % (
-            self.prefix, self.suffix, best_protocol, ext)
-        self._destination = os.path.abspath(os.path.join(
-            self.directory, rel_file_name))
+        self._destination = self._get_destination()
         self.info("Snapshotting to %s..." % self.destination)
-        with self._open_file() as fout:
-            pickle.dump(self.workflow, fout, protocol=best_protocol)
-        self.check_snapshot_size(os.path.getsize(self.destination))
+        store = None
+        with self._open_file(self.destination) as fout:
+            if self.file_format == "chunked":
+                store = self._blob_store()
+                self._dump_header(fout, format="chunked")
+                pickler = pickle.Pickler(fout, best_protocol)
+                pickler.persistent_id = store.persistent_id
+                pickler.dump(self.workflow)
+            else:
+                pickle.dump(self.workflow, fout, protocol=best_protocol)
+        return self._finish(self.destination, store)
+
+    def capture(self):
+        self._destination = self._get_destination()
+        self.info("Snapshotting to %s in the background..." %
+                  self.destination)
+        return self._capture(self.destination, self.blob_threshold)
+
+    def write(self, capture):
+        store = None
+        with self._open_file(capture.destination) as fout:
+            if self.file_format == "chunked":
+                store = self._blob_store()
+                self._dump_header(fout, format="chunked",
+                                  blobs=store.store(capture.arrays))
+                fout.write(capture.data)
+            else:
+                self._dump_capture(fout, capture)
+        return self._finish(capture.destination, store)
+
+    @staticmethod
+    def import_(file_name):
+        file_name = file_name.strip()
+        if not os.path.exists(file_name):
+            raise FileNotFoundError(file_name)
+        _, ext = os.path.splitext(file_name)
+        codec = SnapshotterToFile.READ_CODECS[ext[1:]]
+        store = BlobStore(os.path.join(
+            os.path.dirname(os.path.abspath(file_name)),
+            SnapshotterToFile.BLOBS_DIR))
+        with codec(file_name) as fin:
+            return SnapshotterToFile._import_fobj(fin, store)
+
+    def _get_destination(self):
+        ext = ("." + self.compression) if self.compression else ""
+        kind = "chunked.pickle" if self.file_format == "chunked" else "pickle"
+        rel_file_name = "%s_%s.%d.%s%s" % (
+            self.prefix, self.suffix, best_protocol, kind, ext)
+        return os.path.abspath(os.path.join(self.directory, rel_file_name))
+
+    def _link(self, file_name):
+        rel_file_name = os.path.basename(file_name)
         file_name_link = os.path.join(
-            self.directory, "%s_current.%d.pickle%s" % (
-                self.prefix, best_protocol, ext))
+            self.directory, rel_file_name.replace(
+                "%s_%s." % (self.prefix, self.suffix),
+                "%s_current." % self.prefix, 1))
         # Link creation may fail when several processes do this all at once,
         # so try-except here:
         try:
@@ -408,19 +908,35 @@ class SnapshotterToFile(SnapshotterBase):
         except OSError:
             pass
 
-    @staticmethod
-    def import_(file_name):
-        file_name = file_name.strip()
-        if not os.path.exists(file_name):
-            raise FileNotFoundError(file_name)
-        _, ext = os.path.splitext(file_name)
-        codec = SnapshotterToFile.READ_CODECS[ext[1:]]
-        with codec(file_name) as fin:
-            return SnapshotterToFile._import_fobj(fin)
-
-    def _open_file(self):
+    def _finish(self, file_name, store):
+        """
+        Links the written snapshot as the current one and records the blobs
+        it refers to.
+        :return: The size of the snapshot in bytes.
+        """
+        self._link(file_name)
+        size = os.path.getsize(file_name)
+        if store is None:
+            return size
+        self.info("Wrote %d new blobs (%d bytes), reused %d",
+                  store.written, store.written_bytes, store.reused)
+        store.save_references(os.path.basename(file_name))
+        if self.blob_gc:
+            removed, removed_bytes = store.collect_garbage(self.directory)
+            if removed > 0:
+                self.info("Removed %d unreferenced blobs (%d bytes)",
+                          removed, removed_bytes)
+        return size + store.written_bytes
+
+    def _open_file(self, file_name):
         return SnapshotterToFile.WRITE_CODECS[self.compression](
-            self.destination, self.compression_level)
+            file_name, self.compression_level)
+
+    def _blob_store(self):
+        return BlobStore(
+            os.path.join(self.directory, SnapshotterToFile.BLOBS_DIR),
+            self.blob_compression, self.compression_level,
+            self.blob_threshold)
 
 
 @implementer(ISnapshotter)
@@ -436,7 +952,10 @@ class SnapshotterToDB(SnapshotterBase):
         "gz": lambda n, l: gzip.GzipFile(
             fileobj=n, mode="wb", compresslevel=l),
         "bz2": lambda n, l: bz2.BZ2File(n, "wb", compresslevel=l),
-        "xz": lambda n, l: lzma.LZMAFile(n, "wb", preset=l)
+        "xz": lambda n, l: lzma.LZMAFile(n, "wb", preset=l),
+        "pgz": lambda n, l: BlockFile(n, "wb", "gz", l),
+        "pbz2": lambda n, l: BlockFile(n, "wb", "bz2", l),
+        "pxz": lambda n, l: BlockFile(n, "wb", "xz", l)
     }
 
     READ_CODECS = {
@@ -444,7 +963,10 @@ class SnapshotterToDB(SnapshotterBase):
         "snappy": lambda n: SnappyFile(n, "rb"),
         "gz": lambda name: gzip.GzipFile(fileobj=name, mode="rb"),
         "bz2": lambda name: bz2.BZ2File(name, "rb"),
-        "xz": lambda name: lzma.LZMAFile(name, "rb")
+        "xz": lambda name: lzma.LZMAFile(name, "rb"),
+        "pgz": lambda n: BlockFile(n, "rb"),
+        "pbz2": lambda n: BlockFile(n, "rb"),
+        "pxz": lambda n: BlockFile(n, "rb")
     }
 
     def __init__(self, workflow, **kwargs):
@@ -466,29 +988,28 @@ class SnapshotterToDB(SnapshotterBase):
         self._cursor_ = self._db_.cursor()
 
     def stop(self):
+        super(SnapshotterToDB, self).stop()
         if self.odbc is not None:
             self._db_.close()
 
     def export(self):
-        self._destination = ".".join(
-            (self.prefix, self.suffix, str(best_protocol)))
+        self._destination = self._get_destination()
         fio = BytesIO()
         self.info("Preparing the snapshot...")
         with self._open_fobj(fio) as fout:
             pickle.dump(self.workflow, fout, protocol=best_protocol)
-        self.check_snapshot_size(len(fio.getvalue()))
-        binary = pyodbc.Binary(fio.getvalue())
-        self.info("Executing SQL insert into \"%s\"...", self.table)
-        now = datetime.now()
-        self._cursor_.execute(
-            "insert into %s(timestamp, id, log_id, workflow, name, codec, data"
-            ") values (?, ?, ?, ?, ?, ?, ?);" % self.table, now,
-            self.launcher.id, self.launcher.log_id,
-            self.launcher.workflow.name, self.destination, self.compression,
-            binary)
-        self._db_.commit()
-        self.info("Successfully wrote %d bytes as %s @ %s",
-                  len(binary), self.destination, now)
+        return self._insert(self.destination, fio.getvalue())
+
+    def capture(self):
+        self._destination = self._get_destination()
+        self.info("Preparing the snapshot in the background...")
+        return self._capture(self.destination)
+
+    def write(self, capture):
+        fio = BytesIO()
+        with self._open_fobj(fio) as fout:
+            self._dump_capture(fout, capture)
+        return self._insert(capture.destination, fio.getvalue())
 
     @staticmethod
     def import_(odbc, table, id_, log_id, name=None):
@@ -507,9 +1028,28 @@ class SnapshotterToDB(SnapshotterBase):
             return SnapshotterToDB._import_fobj(fin)
 
     def get_metric_values(self):
-        return {"Snapshot": {"odbc": self.odbc,
-                             "table": self.table,
-                             "name": self.destination}}
+        values = super(SnapshotterToDB, self).get_metric_values()
+        values["Snapshot"] = {"odbc": self.odbc,
+                              "table": self.table,
+                              "name": self.destination}
+        return values
+
+    def _get_destination(self):
+        return ".".join((self.prefix, self.suffix, str(best_protocol)))
+
+    def _insert(self, name, data):
+        binary = pyodbc.Binary(data)
+        self.info("Executing SQL insert into \"%s\"...", self.table)
+        now = datetime.now()
+        self._cursor_.execute(
+            "insert into %s(timestamp, id, log_id, workflow, name, codec, data"
+            ") values (?, ?, ?, ?, ?, ?, ?);" % self.table, now,
+            self.launcher.id, self.launcher.log_id,
+            self.launcher.workflow.name, name, self.compression, binary)
+        self._db_.commit()
+        self.info("Successfully wrote %d bytes as %s @ %s",
+                  len(binary), name, now)
+        return len(binary)
 
     def _open_fobj(self, fobj):
         return SnapshotterToDB.WRITE_CODECS[self.compression](
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 12, 2015
+
+Will test correctness of the block-parallel codecs.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from io import BytesIO
+import unittest
+
+from veles import block_codec
+from veles.block_codec import BlockCompressor, BlockDecompressor, BlockFile
+from veles.prng import get as get_prng
+
+
+class TestBlockCodec(unittest.TestCase):
+    def setUp(self):
+        prng = get_prng()
+        # Compressible but not trivial data which spans several blocks
+        self.data = b"".join(
+            bytes(bytearray(prng.randint(0, 10, 100).tolist())) * 10 + b"\n"
+            for _ in range(100))
+
+    def test_round_trip(self):
+        for codec in block_codec.CODECS:
+            packed = block_codec.compress(self.data, codec, block_size=7000)
+            self.assertLess(len(packed), len(self.data), codec)
+            self.assertEqual(block_codec.decompress(packed), self.data, codec)
+
+    def test_incremental(self):
+        compressor = BlockCompressor("xz", 1, block_size=5000)
+        parts = [compressor.compress(self.data[i:i + 333])
+                 for i in range(0, len(self.data), 333)]
+        parts.append(compressor.flush())
+        packed = b"".join(parts)
+        decompressor = BlockDecompressor()
+        result = b"".join(decompressor.decompress(packed[i:i + 1000])
+                          for i in range(0, len(packed), 1000))
+        self.assertEqual(result + decompressor.flush(), self.data)
+        self.assertEqual(decompressor.codec, "xz")
+
+    def test_truncated(self):
+        packed = block_codec.compress(self.data, block_size=7000)
+        decompressor = BlockDecompressor()
+        decompressor.decompress(packed[:-10])
+        self.assertRaises(ValueError, decompressor.flush)
+        self.assertRaises(ValueError, block_codec.decompress, b"garbage!")
+        self.assertRaises(ValueError, BlockCompressor, "zip")
+
+    def test_file(self):
+        fobj = BytesIO()
+        with BlockFile(fobj, "wb", "bz2", block_size=10000) as fout:
+            fout.write(self.data[:500])
+            fout.flush()
+            fout.write(self.data[500:])
+        self.assertFalse(fobj.closed)
+        fobj.seek(0)
+        codec, index = block_codec.block_index(fobj)
+        self.assertEqual(codec, "bz2")
+        self.assertEqual(sum(raw for _, _, raw in index), len(self.data))
+        self.assertEqual(index[0][2], 500)
+        fobj.seek(0)
+        fin = BlockFile(fobj, "rb", read_ahead=1000)
+        self.assertEqual(fin.readline(), self.data[:1001])
+        self.assertEqual(fin.read(10), self.data[1001:1011])
+        self.assertEqual(fin.read(), self.data[1011:])
+        self.assertEqual(fin.read(), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
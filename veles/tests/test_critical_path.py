@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 20, 2015
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import unittest
+
+from veles.critical_path import ParallelismAnalysis
+from veles.dummy import DummyWorkflow
+from veles.profiler import ProfileEvent
+from veles.units import TrivialUnit
+
+
+class TestParallelismAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.workflow = DummyWorkflow()
+        self.a = TrivialUnit(self.workflow, name="a")
+        self.b = TrivialUnit(self.workflow, name="b")
+        self.c = TrivialUnit(self.workflow, name="c")
+        for unit in self.a, self.b:
+            unit.link_from(self.workflow.start_point)
+            self.c.link_from(unit)
+        # The loop is broken
+        self.a.link_from(self.c)
+        self.workflow.end_point.link_from(self.c)
+
+    def _event(self, unit, start, end, thread="T1", category="unit"):
+        return ProfileEvent("run", category, unit.id, unit.name, 0, thread,
+                            start, end)
+
+    def test_analysis(self):
+        events = []
+        for i in range(3):
+            offset = i * 10
+            events.extend((
+                self._event(self.a, offset, offset + 3),
+                self._event(self.b, offset, offset + 1, "T2"),
+                self._event(self.b, offset - 2, offset, "T2", "dispatch"),
+                self._event(self.a, offset - 0.1, offset, "T1", "dispatch"),
+                self._event(self.c, offset + 3, offset + 3.5)))
+        analysis = ParallelismAnalysis(self.workflow, events)
+        self.assertEqual(analysis.critical_path, [
+            self.workflow.start_point, self.a, self.c,
+            self.workflow.end_point])
+        self.assertAlmostEqual(analysis.span, 3.5)
+        self.assertAlmostEqual(analysis.work, 4.5)
+        self.assertAlmostEqual(analysis.speedup_bound, 4.5 / 3.5)
+        busy, idle = analysis.threads["T1"]
+        self.assertAlmostEqual(busy, 10.5)
+        self.assertAlmostEqual(idle, 23.5 - 10.5)
+        self.assertAlmostEqual(analysis.threads["T2"][0], 3)
+        self.assertEqual(len(analysis.costly_dispatches), 1)
+        src, dst, dispatch, run = analysis.costly_dispatches[0]
+        self.assertEqual((src, dst), (self.workflow.start_point, self.b))
+        self.assertAlmostEqual(dispatch, 2)
+        self.assertAlmostEqual(run, 1)
+        analysis.print_report()
+
+    def test_no_events(self):
+        analysis = self.workflow.analyze_parallelism()
+        self.assertIsInstance(analysis, ParallelismAnalysis)
+        self.assertEqual(analysis.span, 0)
+        self.assertEqual(analysis.speedup_bound, 1.0)
+        self.assertEqual(analysis.threads, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
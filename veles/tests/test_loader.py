@@ -35,10 +35,13 @@ under the License.
 """
 
 
+from collections import defaultdict
 from itertools import product
 import unittest
 import numpy
 import os
+import shutil
+import tempfile
 from zope.interface import implementer
 from veles.backends import NumpyDevice
 
@@ -49,8 +52,18 @@ try:
 except ImportError:
     HDF5Loader = FullBatchHDF5Loader = object
     skip_hdf5 = True
+try:
+    import cv2  # pylint: disable=W0611
+    skip_cv2 = False
+except ImportError:
+    skip_cv2 = True
+from veles.config import root
+from veles.dummy import DummyWorkflow
 import veles.prng as rnd
-from veles.loader import IFullBatchLoader, FullBatchLoaderMSE
+from veles.loader import IFullBatchLoader, FullBatchLoaderMSE, ILoader, \
+    Loader as LoaderBase
+from veles.loader.base import TRAIN
+from veles.loader.image import IImageLoader, ImageLoader
 
 
 @implementer(IFullBatchLoader)
@@ -111,6 +124,101 @@ class TestFullBatchLoader(AcceleratedTest):
         return res_data, res_labels, res_target
 
 
+class TestFullBatchLoaderFill(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+
+    def test_fill_by_samples(self):
+        rnd.get().seed(123)
+        unit = Loader(self.parent, force_numpy=True, prng=rnd.get())
+        unit.initialize(NumpyDevice())
+        arrays = unit.minibatch_data, unit.minibatch_labels, \
+            unit.minibatch_targets
+        for _ in range(20):
+            unit.run()
+            filled = [arr.mem.copy() for arr in arrays]
+            for arr in arrays:
+                arr.mem[:] = 0
+            unit.fill_minibatch_by_samples()
+            size = unit.minibatch_size
+            for arr, mem in zip(arrays, filled):
+                self.assertTrue((arr.mem[:size] == mem[:size]).all())
+
+
+@implementer(IFullBatchLoader)
+class MemmapLoader(FullBatchLoaderMSE):
+    """Loads the random data and counts load_data() calls.
+    """
+    def __init__(self, workflow, **kwargs):
+        super(MemmapLoader, self).__init__(workflow, **kwargs)
+        self.path = kwargs["path"]
+        self.loads = 0
+
+    @property
+    def dataset_files(self):
+        return self.path,
+
+    def load_data(self):
+        self.loads += 1
+        self.class_lengths[:] = 0, 20, 80
+        self.create_originals((4, 3))
+        self.original_data.mem[:] = numpy.arange(
+            self.original_data.size).reshape(self.original_data.shape)
+        self.original_labels[:] = [i % 5 for i in range(100)]
+        self.original_targets.mem = numpy.arange(
+            200, dtype=numpy.float32).reshape(100, 2)
+
+
+class TestFullBatchLoaderMemmap(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+        self.directory = tempfile.mkdtemp(prefix="veles-memmap-")
+        self.path = os.path.join(self.directory, "dataset")
+        with open(self.path, "w") as fout:
+            fout.write("dataset")
+        self.originals = set()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        for path in self.originals:
+            shutil.rmtree(path)
+
+    def _load(self):
+        loader = MemmapLoader(
+            self.parent, path=self.path, memmap_originals=True,
+            normalization_type="mean_disp",
+            target_normalization_type="range_linear",
+            target_normalization_parameters={},
+            minibatch_size=10, prng=rnd.get())
+        loader.initialize(NumpyDevice())
+        self.originals.add(loader.originals_dir)
+        return loader
+
+    def test_reuse(self):
+        first = self._load()
+        self.assertEqual(first.loads, 1)
+        self.assertIsInstance(first.original_data.mem, numpy.memmap)
+        self.assertIsInstance(first.original_targets.mem, numpy.memmap)
+        self.assertTrue(os.path.isdir(first.originals_dir))
+        data = first.original_data.mem.copy()
+        targets = first.original_targets.mem.copy()
+        second = self._load()
+        self.assertEqual(second.loads, 0)
+        self.assertEqual(second.originals_dir, first.originals_dir)
+        self.assertEqual(second.class_lengths, first.class_lengths)
+        self.assertEqual(second.original_labels, first.original_labels)
+        self.assertTrue((second.original_data.mem == data).all())
+        self.assertTrue((second.original_targets.mem == targets).all())
+        self.assertTrue(second.normalizer.is_initialized)
+        self.assertTrue(second.target_normalizer.is_initialized)
+        second.run()
+        self.assertTrue((second.minibatch_data.mem == first.original_data[
+            second.minibatch_indices.mem]).all())
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(self._load().loads, 1)
+
+
 @unittest.skipIf(skip_hdf5, "h5py is unavailable")
 @assign_backend("ocl")
 class TestHDF5Loader(AcceleratedTest):
@@ -133,5 +241,252 @@ class TestHDF5Loader(AcceleratedTest):
     def test_hdf5_fullbatch(self):
         self.do(FullBatchHDF5Loader, device=self.device)
 
+
+@unittest.skipIf(skip_hdf5, "h5py is unavailable")
+class TestHDF5LoaderFill(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+
+    def test_hdf5_fill_by_samples(self):
+        csd = os.path.dirname(os.path.abspath(__file__))
+        loader = HDF5Loader(
+            self.parent, validation_path=os.path.join(csd, "res", "test.h5"),
+            train_path=os.path.join(csd, "res", "train.h5"))
+        loader.initialize()
+        while not loader.train_ended:
+            loader.run()
+            loader.fill_minibatch()
+            data = loader.minibatch_data.mem.copy()
+            labels = list(loader.raw_minibatch_labels)
+            loader.fill_minibatch_by_samples()
+            self.assertTrue((data == loader.minibatch_data.mem).all())
+            self.assertEqual(labels, loader.raw_minibatch_labels)
+
+
+@implementer(ILoader)
+class IndexLoader(LoaderBase):
+    """Serves the sample indices as the data.
+    """
+    def load_data(self):
+        self.class_lengths[:] = 20, 30, 150
+        self._has_labels = True
+        self.labels_mapping.update({i: i for i in range(5)})
+        self.reversed_labels_mapping[:] = range(5)
+
+    def create_minibatch_data(self):
+        self.minibatch_data.reset(numpy.zeros(
+            (self.max_minibatch_size, 2), dtype=numpy.float32))
+
+    def fill_minibatch(self):
+        for i, index in enumerate(
+                self.minibatch_indices.mem[:self.minibatch_size]):
+            self.minibatch_data[i] = index, index * 2
+            self.raw_minibatch_labels[i] = index % 5
+
+
+class TestLoaderPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+
+    def _serve(self, **kwargs):
+        rnd.get().seed(123)
+        loader = IndexLoader(self.parent, minibatch_size=16, prng=rnd.get(),
+                             **kwargs)
+        loader.initialize()
+        served = []
+        for _ in range(50):
+            loader.run()
+            served.append((
+                loader.minibatch_data.mem.copy(),
+                loader.minibatch_labels.mem.copy(),
+                loader.minibatch_indices.mem.copy(),
+                loader.minibatch_class, loader.minibatch_size,
+                loader.minibatch_offset, loader.epoch_number,
+                bool(loader.last_minibatch), bool(loader.epoch_ended),
+                bool(loader.train_ended), bool(loader.test_ended)))
+        return loader, served
+
+    def test_same_sequence(self):
+        _, reference = self._serve()
+        loader, prefetched = self._serve(prefetch=3, prefetch_workers=2)
+        self.assertIsNotNone(loader.prefetcher)
+        self.assertEqual(len(reference), len(prefetched))
+        for ref, pre in zip(reference, prefetched):
+            for i in range(3):
+                self.assertTrue((ref[i] == pre[i]).all())
+            self.assertEqual(ref[3:], pre[3:])
+        metrics = loader.get_metric_values()
+        self.assertIn("Prefetch queue depth", metrics)
+        self.assertGreaterEqual(metrics["Prefetch stall time"], 0)
+        loader.stop()
+        self.assertIsNone(loader.prefetcher)
+
+    def test_pickle_keeps_prefetched(self):
+        loader, _ = self._serve(prefetch=2)
+        pending = loader.prefetcher.pending_minibatches
+        self.assertEqual(len(pending), 2)
+        state = loader.__getstate__()
+        self.assertEqual(state["failed_minibatches"][-len(pending):],
+                         list(reversed(pending)))
+        loader.stop()
+
+    def test_random_fill_is_not_prefetched(self):
+        class RandomIndexLoader(IndexLoader):
+            fills_randomly = True
+
+        loader = RandomIndexLoader(self.parent, minibatch_size=16, prefetch=2)
+        loader.initialize()
+        loader.run()
+        self.assertIsNone(loader.prefetcher)
+        self.assertEqual(loader.prefetch, 0)
+
+
+class InterruptedIndexLoader(IndexLoader):
+    interrupt_at = None
+
+    def fill_minibatch(self):
+        if self.minibatch_indices[0] == self.interrupt_at:
+            raise KeyboardInterrupt()
+        super(InterruptedIndexLoader, self).fill_minibatch()
+
+
+class TestLoaderAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+        self.checkpoint = os.path.join(
+            root.common.dirs.cache, "test_loader_analysis.pickle")
+
+    def tearDown(self):
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def _analyze(self, klass=IndexLoader, **kwargs):
+        loader = klass(self.parent, minibatch_size=16,
+                       normalization_type="mean_disp", **kwargs)
+        loader.initialize()
+        return loader
+
+    def _assertSameState(self, first, second):
+        self.assertEqual(first["_count"], second["_count"])
+        for key in "_mean", "_min", "_max":
+            self.assertLess(numpy.max(numpy.abs(first[key] - second[key])),
+                            1e-8)
+
+    def test_parallel(self):
+        reference = self._analyze().normalizer.state
+        loader = self._analyze(analysis_workers=3)
+        self._assertSameState(reference, loader.normalizer.state)
+        self.assertEqual(loader._analysis_checkpoint_key(),
+                         ("mean_disp", (20, 30, 150), 16))
+        loader.normalizer.reset()
+        # Labels are counted only if the mapping is unknown
+        loader.labels_mapping.clear()
+        labels = defaultdict(int)
+        for shard in range(3):
+            state, shard_labels = loader.analyze_shard(shard, 3)
+            loader.normalizer.merge(state)
+            for key, val in shard_labels.items():
+                labels[key] += val
+        self._assertSameState(reference, loader.normalizer.state)
+        self.assertEqual(labels, {i: 30 for i in range(5)})
+
+    def test_resume(self):
+        reference = self._analyze().normalizer.state
+        InterruptedIndexLoader.interrupt_at = 50 + 16 * 7
+        try:
+            self.assertRaises(
+                KeyboardInterrupt, self._analyze, InterruptedIndexLoader,
+                analysis_checkpoint=self.checkpoint,
+                analysis_checkpoint_interval=3)
+        finally:
+            InterruptedIndexLoader.interrupt_at = None
+        self.assertTrue(os.path.exists(self.checkpoint))
+        loader = self._analyze(InterruptedIndexLoader,
+                               analysis_checkpoint=self.checkpoint)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self._assertSameState(reference, loader.normalizer.state)
+
+
+@implementer(IImageLoader)
+class GeneratedImageLoader(ImageLoader):
+    """Serves synthetic RGB images.
+    """
+    def get_keys(self, index):
+        self.original_shape = (24, 32, 3)
+        return list(range(12)) if index == TRAIN else []
+
+    def get_image_label(self, key):
+        return key % 3
+
+    def get_image_info(self, key):
+        return (24, 32), "RGB"
+
+    def get_image_data(self, key):
+        data = numpy.zeros((24, 32, 3), dtype=numpy.float32)
+        data[:, :, key % 3] = numpy.arange(24 * 32).reshape(24, 32) + key
+        return data
+
+
+@unittest.skipIf(skip_cv2, "OpenCV is unavailable")
+class TestImageLoaderDecodeWorkers(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+
+    def _serve(self, **kwargs):
+        rnd.get().seed(123)
+        loader = GeneratedImageLoader(
+            self.parent, minibatch_size=5, crop=(16, 16), scale=(20, 28),
+            scale_maintain_aspect_ratio=False,
+            rotations=(0.0, 0.3), mirror="random", prng=rnd.get(), **kwargs)
+        loader.initialize()
+        data = []
+        for _ in range(10):
+            loader.run()
+            data.append(loader.minibatch_data.mem.copy())
+        loader.stop()
+        return data, loader.stage_times
+
+    def test_same_output(self):
+        serial, _ = self._serve()
+        parallel, stage_times = self._serve(decode_workers=3)
+        for a, b in zip(serial, parallel):
+            self.assertTrue((a == b).all())
+        self.assertEqual(set(stage_times),
+                         {"decode", "scale", "crop", "distort"})
+
+
+@unittest.skipIf(skip_cv2, "OpenCV is unavailable")
+class TestImageLoaderFingerprint(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+        self.directory = tempfile.mkdtemp(prefix="veles-fingerprint-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_file_image_loader(self):
+        from PIL import Image
+        from veles.loader.file_image import AutoLabelFileImageLoader
+
+        files = []
+        for i in range(2):
+            files.append(os.path.join(self.directory, "%d.png" % i))
+            Image.fromarray(numpy.zeros((4, 4, 3), numpy.uint8)).save(
+                files[-1])
+        loader = AutoLabelFileImageLoader(
+            self.parent, train_paths=[self.directory])
+        loader.class_keys[TRAIN].extend(files)
+        self.assertEqual(set(loader.dataset_files), set(files))
+        fingerprint = loader.dataset_fingerprint
+        self.assertIsNotNone(fingerprint)
+        self.assertEqual(fingerprint, loader.dataset_fingerprint)
+        loader.scale = 0.5
+        self.assertNotEqual(fingerprint, loader.dataset_fingerprint)
+        fingerprint = loader.dataset_fingerprint
+        stat = os.stat(files[0])
+        os.utime(files[0], (stat.st_atime, stat.st_mtime + 10))
+        self.assertNotEqual(fingerprint, loader.dataset_fingerprint)
+
+
 if __name__ == "__main__":
     AcceleratedTest.main()
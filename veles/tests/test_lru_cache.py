@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 9, 2015
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import time
+import unittest
+
+from veles.lru_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def testEviction(self):
+        cache = LRUCache(10)
+        self.assertEqual(cache.get("a", lambda: "aaaa"), "aaaa")
+        self.assertEqual(cache.get("b", lambda: "bbbb"), "bbbb")
+        self.assertEqual(cache.get("a", lambda: "xxxx"), "aaaa")
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        cache.put("c", "cccc")
+        self.assertEqual(cache.size, 8)
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        cache.put("d", "d" * 11)
+        self.assertNotIn("d", cache)
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def testExpiration(self):
+        cache = LRUCache(10, ttl=0.05)
+        self.assertIsNone(cache.find("a"))
+        cache.put("a", "aaaa")
+        self.assertEqual(cache.find("a"), "aaaa")
+        self.assertEqual(cache.hit_rate, 0.5)
+        time.sleep(0.1)
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.find("a", "x"), "x")
+        self.assertEqual((cache.hits, cache.misses, cache.expired), (1, 2, 1))
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+if __name__ == "__main__":
+    unittest.main()
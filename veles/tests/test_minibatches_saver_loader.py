@@ -35,13 +35,16 @@ under the License.
 """
 
 
+import os
 import unittest
 import numpy
 from zope.interface import implementer
 
 from veles.dummy import DummyWorkflow
 from veles.loader import MinibatchesSaver, MinibatchesLoader, Loader, ILoader
+from veles.loader.saver import convert_chunks_file
 from veles.logger import Logger, logging
+import veles.prng as prng
 
 
 @implementer(ILoader)
@@ -61,15 +64,105 @@ class MyLoader(Loader):
             self.counter += 1
 
 
+@implementer(ILoader)
+class MyTrainLoader(MyLoader):
+    def load_data(self):
+        super(MyTrainLoader, self).load_data()
+        self.class_lengths[0], self.class_lengths[2] = 0, 100 * 10
+
+
 class TestMinibatchesSaverLoader(unittest.TestCase, Logger):
     def setUp(self):
         self.parent = DummyWorkflow()
-        self.saver = MinibatchesSaver(self.parent)
-        self.loader = MinibatchesLoader(
-            self.parent, shuffle_limit=0, file_name=self.saver.file_name)
 
     def testToTheMoonAndBack(self):
-        myloader = MyLoader(self.parent, shuffle_limit=0, minibatch_size=100)
+        self._save()
+        self._check_sequential()
+
+    def testChunks(self):
+        self._save(file_format="chunks")
+        self._check_sequential()
+
+    def testSmallChunks(self):
+        self._save(file_format="chunks", class_chunk_sizes=(25, 0, 1))
+        self._check_random()
+
+    def testCompressedBlocks(self):
+        self._save(compression="snappy", block_size=64)
+        self._check_random()
+        self.assertEqual(self.loader.reader.compression, "snappy")
+
+    def testBlockParallel(self):
+        self._save(compression="pgz", block_size=64)
+        self._check_random()
+        self._save(file_format="chunks", compression="pbz2")
+        self._check_sequential()
+
+    def testCache(self):
+        self._save(file_format="chunks", class_chunk_sizes=(25, 0, 1))
+        self._check_random()
+        cache = self.loader.cache
+        self.assertEqual(cache.misses, len(cache))
+        self.assertGreater(cache.hits, 0)
+        misses = cache.misses
+        self.loader.fill_minibatch()
+        self.assertEqual(cache.misses, misses)
+        metrics = self.loader.get_metric_values()
+        self.assertEqual(metrics["Chunks cache misses"], misses)
+        self.loader.cache_size = 0
+        self.loader.initialize()
+        self.assertIsNone(self.loader.cache)
+
+    def testConvert(self):
+        self._save(file_format="chunks")
+        file_name = self.saver.file_name + ".mmap"
+        try:
+            self.assertEqual(convert_chunks_file(
+                self.saver.file_name, file_name, "gz", block_size=100), 1000)
+            self.loader = MinibatchesLoader(
+                self.parent, shuffle_limit=0, file_name=file_name)
+            self._check_random()
+        finally:
+            os.remove(file_name)
+
+    def testAnalysisCache(self):
+        self._save(MyTrainLoader)
+
+        def initialize_loader():
+            loader = MinibatchesLoader(
+                self.parent, shuffle_limit=0, file_name=self.saver.file_name,
+                normalization_type="mean_disp")
+            loader.initialize()
+            return loader
+
+        loader = initialize_loader()
+        path = loader.analysis_cache_path
+        self.assertTrue(os.path.exists(path))
+        try:
+            state = loader.normalizer.state
+            self.assertEqual(state["_count"], 1000)
+            original = MinibatchesLoader._analyze_dataset
+            MinibatchesLoader._analyze_dataset = None
+            try:
+                loader = initialize_loader()
+            finally:
+                MinibatchesLoader._analyze_dataset = original
+            for key, val in state.items():
+                self.assertTrue(
+                    numpy.all(val == loader.normalizer.state[key]), key)
+            stat = os.stat(self.saver.file_name)
+            os.utime(self.saver.file_name, (stat.st_atime,
+                                            stat.st_mtime + 10))
+            self.assertNotEqual(loader.analysis_cache_path, path)
+        finally:
+            os.remove(path)
+
+    def _save(self, loader_class=MyLoader, **kwargs):
+        self.saver = MinibatchesSaver(self.parent, **kwargs)
+        self.loader = MinibatchesLoader(
+            self.parent, shuffle_limit=0, file_name=self.saver.file_name)
+        myloader = loader_class(self.parent, shuffle_limit=0,
+                                minibatch_size=100)
         myloader.initialize()
         self.saver.link_attrs(myloader, *Loader.exports)
         self.saver.initialize()
@@ -77,6 +170,8 @@ class TestMinibatchesSaverLoader(unittest.TestCase, Logger):
             myloader.run()
             self.saver.run()
         self.saver.stop()
+
+    def _check_sequential(self):
         self.loader.initialize()
         counter = 0
         while not self.loader.epoch_ended:
@@ -85,6 +180,19 @@ class TestMinibatchesSaverLoader(unittest.TestCase, Logger):
                 self.assertEqual(self.loader.minibatch_data[i], counter)
                 counter += 1
 
+    def _check_random(self):
+        self.loader.initialize()
+        indices = numpy.arange(1000, dtype=numpy.int32)
+        prng.get().shuffle(indices)
+        self.loader.minibatch_indices.mem[:] = indices[:100]
+        self.loader.minibatch_size = 100
+        self.loader.fill_minibatch()
+        self.assertTrue((self.loader.minibatch_data.mem.ravel() ==
+                         indices[:100]).all())
+        self.loader.minibatch_data.mem[:] = 0
+        self.loader.fill_minibatch_by_samples()
+        self.assertTrue((self.loader.minibatch_data.mem.ravel() ==
+                         indices[:100]).all())
 
 if __name__ == "__main__":
     Logger.setup_logging(logging.DEBUG)
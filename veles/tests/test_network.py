@@ -37,12 +37,18 @@ import logging
 import threading
 import unittest
 
+import numpy
 from six import BytesIO, PY3
 from twisted.internet import reactor
+import zmq
 from veles.backends import NumpyDevice
 
 import veles.client as client
-from veles.txzmq.connection import ZmqConnection
+import veles.external.fysom as fysom
+from veles.logger import Logger
+from veles.memory import Array
+from veles.txzmq.connection import ZmqConnection, ZmqEndpoint
+from veles.txzmq.sharedring import SharedRing
 from veles.prng import get as get_rg
 import veles.server as server
 from veles.tests import DummyLauncher
@@ -152,7 +158,7 @@ class TestZmqConnection(unittest.TestCase):
 
         idata = get_rg().bytes(128000)
         bufsize = 4096
-        for codec in range(4):
+        for codec in range(7):
             socket = FakeSocket(BytesIO())
             pickler = ZmqConnection.Pickler(socket,
                                             codec if PY3 else chr(codec))
@@ -174,6 +180,148 @@ class TestZmqConnection(unittest.TestCase):
             self.assertEqual(len(idata), len(merged))
             self.assertEqual(idata, merged)
 
+    def testZeroCopy(self):
+        class PairConnection(ZmqConnection):
+            socketType = zmq.PAIR
+
+            def messageReceived(self, message):
+                self.received = message
+
+        address = "inproc://veles-test-zero-copy"
+        receiver = PairConnection((ZmqEndpoint("bind", address),))
+        sender = PairConnection((ZmqEndpoint("connect", address),))
+        sender.zero_copy = True
+        try:
+            weights = Array(get_rg().rand(300, 200).astype(numpy.float32))
+            bias = numpy.arange(10)
+            job = {"weights": weights, "bias": bias,
+                   "transposed": weights.mem.T, "same": weights.mem}
+            receiver.received = None
+            size = sender.send(b"job", job, buffers_key="slave")
+            self.assertGreater(size, weights.nbytes * 2)
+            # inproc releases the buffers only after they are received
+            self.assertEqual(sender.wait_buffers_sent(0.01), {"slave"})
+            while receiver.received is None:
+                receiver.doRead()
+            self.assertEqual(sender.wait_buffers_sent(), set())
+            header, result = receiver.received
+            self.assertEqual(header, b"job")
+            self.assertTrue((result["weights"].mem == weights.mem).all())
+            self.assertTrue((result["bias"] == bias).all())
+            self.assertTrue((result["transposed"] == weights.mem.T).all())
+            self.assertIs(result["same"], result["weights"].mem)
+            result["same"][0, 0] = -1
+        finally:
+            sender.shutdown()
+            receiver.shutdown()
+
+    def testSharedMemory(self):
+        class PairConnection(ZmqConnection):
+            socketType = zmq.PAIR
+
+            def messageReceived(self, message):
+                self.received = message
+
+        address = "inproc://veles-test-shared-memory"
+        receiver = PairConnection((ZmqEndpoint("bind", address),))
+        sender = PairConnection((ZmqEndpoint("connect", address),))
+        ring = SharedRing("veles-test-job", 4096, max_capacity=1 << 20)
+        try:
+            weights = Array(get_rg().rand(300, 200).astype(numpy.float32))
+            job = {"weights": weights, "transposed": weights.mem.T}
+            for _ in range(2):
+                receiver.received = None
+                size = sender.send(b"job", job, ring=ring)
+                self.assertGreater(size, weights.nbytes * 2)
+                while receiver.received is None:
+                    receiver.doRead()
+                header, result = receiver.received
+                self.assertEqual(header, b"job")
+                self.assertTrue((result["weights"].mem == weights.mem).all())
+                self.assertTrue(
+                    (result["transposed"] == weights.mem.T).all())
+            self.assertEqual(ring.grows, 1)
+            self.assertEqual(ring.writes, 2)
+            self.assertEqual(ring.used, 0)
+            # Does not fit: falls back to the regular transport
+            zeros = numpy.zeros(1 << 18)
+            for compression in None, "gzip":
+                receiver.received = None
+                size = sender.send(b"job", zeros, ring=ring,
+                                   pickles_compression=compression)
+                if compression is None:
+                    self.assertGreaterEqual(size, zeros.nbytes)
+                else:
+                    self.assertLess(size, zeros.nbytes // 10)
+                while receiver.received is None:
+                    receiver.doRead()
+                self.assertTrue((receiver.received[1] == zeros).all())
+            self.assertEqual(ring.overflows, 2)
+        finally:
+            ring.close()
+            sender.shutdown()
+            receiver.shutdown()
+
+
+class PrefetchingProtocol(client.VelesProtocol):
+    def _set_deferred(self, f, job, update, callback):
+        self.host.jobs.append(job)
+
+
+class PrefetchingHost(Logger):
+    def __init__(self):
+        super(PrefetchingHost, self).__init__()
+        setattr(self, "async", False)
+        self.prefetch_jobs = 2
+        self.death_probability = 0
+        self.jobs = []
+        self.requests = []
+        self.zmq_connection = self
+        self.workflow = self
+        self.state = fysom.Fysom(client.VelesProtocol.FSM_DESCRIPTION, self)
+
+    def request(self, command, message=b''):
+        self.requests.append(command)
+
+    def acknowledge_update(self):
+        pass
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.host = PrefetchingHost()
+        self.protocol = PrefetchingProtocol(None, self.host)
+        self.protocol.zmq_connection = self.host
+        self.protocol._power_upload_threshold = float("inf")
+        self.host.state.owner = self.protocol
+        self.host.state.request_id()
+
+    def testPrefetch(self):
+        proto, host = self.protocol, self.host
+        proto.request_job()
+        proto.job_received({"job": 1})
+        # The second job is requested while the first one is being done
+        self.assertEqual(host.requests, ["job", "job"])
+        proto.job_received({"job": 2})
+        proto.job_finished({"update": 1})
+        proto.update_result_received(b'1')
+        self.assertEqual(host.jobs, [{"job": 1}, {"job": 2}])
+        self.assertEqual(host.requests, ["job", "job", "update", "job"])
+        proto.job_received(b"NEED_UPDATE")
+        proto.job_finished({"update": 2})
+        proto.update_result_received(b'1')
+        self.assertEqual(host.requests[4:], ["update", "job"])
+        proto.job_received({"job": 3})
+        self.assertEqual(len(host.jobs), 3)
+        self.assertEqual(host.requests[6:], ["job"])
+        # The prefetch reply arrives after the update is confirmed
+        proto.job_finished({"update": 3})
+        proto.update_result_received(b'1')
+        self.assertEqual(host.requests[7:], ["update"])
+        proto.job_received({"job": 4})
+        self.assertEqual(host.jobs[-1], {"job": 4})
+        self.assertEqual(proto.state.current, "BUSY")
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
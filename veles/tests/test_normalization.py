@@ -38,7 +38,7 @@ under the License.
 import numpy
 import unittest
 
-from veles.normalization import NormalizerRegistry
+from veles.normalization import NormalizerRegistry, ParallelAnalyzer
 from veles.pickle2 import pickle
 from veles.prng import get as get_prng
 prng = get_prng()
@@ -223,5 +223,50 @@ class TestNormalizers(unittest.TestCase):
         self.assertIsInstance(back, numpy.ndarray)
         self.assertTrue((orig == back).all())
 
+    def test_merge(self):
+        arr = prng.normal(1e4, 1, (100, 6)).astype(numpy.float32)
+        for name in "mean_disp", "pointwise", "internal_mean", "none":
+            nclass = NormalizerRegistry.normalizers[name]
+            whole = nclass()
+            whole.analyze(arr)
+            merged = nclass()
+            for shard in range(4):
+                partial = merged.partial()
+                partial.analyze(arr[shard::4])
+                merged.merge(pickle.loads(pickle.dumps(partial)).state)
+            self.assertEqual(merged.is_initialized, whole.is_initialized)
+            coeffs = whole.coefficients, merged.coefficients
+            if coeffs[0] is None:
+                self.assertIsNone(coeffs[1])
+                continue
+            if isinstance(coeffs[0], numpy.ndarray):
+                coeffs = [(c,) for c in coeffs]
+            for wc, mc in zip(*coeffs):
+                self.assertLess(numpy.max(numpy.abs(wc - mc)), 1e-8, name)
+        self.assertRaises(TypeError, merged.merge,
+                          NormalizerRegistry.normalizers["pointwise"]())
+
+    def test_mean_legacy_state(self):
+        nclass = NormalizerRegistry.normalizers["mean_disp"]
+        mdn = nclass(state={
+            "_sum": numpy.array([4.0, 8.0]), "_count": 4,
+            "_min": numpy.array([0.0, 0.0]), "_max": numpy.array([2.0, 4.0])})
+        mean, disp = mdn.coefficients
+        self.assertTrue((mean == (1, 2)).all())
+        self.assertTrue((disp == (2, 4)).all())
+
+    def test_parallel_analyzer(self):
+        arr = prng.normal(0, 1, (1000, 8)).astype(numpy.float32)
+        nclass = NormalizerRegistry.normalizers["mean_disp"]
+        serial = nclass()
+        parallel = nclass()
+        with ParallelAnalyzer(parallel, 3) as analyzer:
+            for i in range(0, len(arr), 64):
+                serial.analyze(arr[i:i + 64])
+                analyzer.analyze(arr[i:i + 64])
+        for sc, pc in zip(serial.coefficients, parallel.coefficients):
+            self.assertLess(numpy.max(numpy.abs(sc - pc)), 1e-8)
+        self.assertEqual(serial.state["_count"], parallel.state["_count"])
+
 if __name__ == '__main__':
     unittest.main()
@@ -164,6 +164,30 @@ class Test(unittest.TestCase):
             h.y[int(numpy.round((i + 1) / 0.2))] = i * i
         self.compare_images(*self.run_plotter(h), tolerance=300)
 
+    def testPlotData(self):
+        ap = AccumulatingPlotter(self, name="Lines")
+        ap.input = numpy.arange(1, 20, 0.1)
+        ap.input_field = 0
+        ap.fill()
+        ap.stripped_pickle = True
+        received = pickle.loads(pickle.dumps(ap))
+        ap.stripped_pickle = False
+        for i in range(3):
+            ap.input_field = i + 1
+            ap.fill()
+        data = ap.get_plot_data()
+        self.assertEqual(list(data), ["values"])
+        ap.fill()
+        received.apply_plot_data(data)
+        self.assertEqual(received.values, ap.values[:-1])
+
+        img = ImagePlotter(self, name="Image")
+        img.inputs.append([numpy.arange(16.0)])
+        img.input_fields.append(0)
+        pics = img.get_plot_data()["_pics_to_draw"]
+        self.assertEqual(pics[0].shape, (4, 4))
+        self.assertEqual(pics[0].dtype, numpy.uint8)
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
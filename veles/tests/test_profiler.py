@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 19, 2015
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import json
+from six import StringIO
+import time
+import unittest
+
+from veles.dummy import DummyWorkflow
+from veles.profiler import Profiler, profiler
+from veles.thread_pool import ThreadPool
+from veles.units import TrivialUnit
+
+
+class SleepingUnit(TrivialUnit):
+    def run(self):
+        time.sleep(0.001)
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.parent = DummyWorkflow()
+        profiler.clear()
+        profiler.enable()
+
+    def tearDown(self):
+        profiler.disable()
+        profiler.clear()
+
+    def testRingBuffer(self):
+        prof = Profiler(capacity=4)
+        for i in range(6):
+            prof.record("run", "unit", i, i + 1)
+        self.assertEqual(len(prof), 4)
+        self.assertEqual([e.start for e in prof.events], [2, 3, 4, 5])
+        prof.enable(capacity=2)
+        self.assertEqual([e.start for e in prof.events], [4, 5])
+
+    def testUnitRun(self):
+        unit = SleepingUnit(self.parent)
+        unit.initialize()
+        for _ in range(10):
+            unit.run()
+        durations = profiler.durations("run")[unit.id]
+        self.assertEqual(len(durations), 10)
+        p50, p95, p99 = profiler.percentiles(durations)
+        self.assertGreaterEqual(p50, 0.001)
+        self.assertLessEqual(p50, p95)
+        self.assertLessEqual(p95, p99)
+        event = profiler.events[0]
+        self.assertEqual((event.name, event.category, event.unit_name),
+                         ("run", "unit", "SleepingUnit"))
+        stats = self.parent.get_unit_run_percentiles()
+        self.assertEqual(stats[0][:2], ("SleepingUnit", 10))
+
+    def testDispatch(self):
+        unit = SleepingUnit(self.parent)
+        unit.initialize()
+        pool = ThreadPool(minthreads=1, maxthreads=1, name="profiled")
+        try:
+            self.assertTrue(pool.apply_async(unit.open_gate).get())
+        finally:
+            pool.shutdown()
+        event = profiler.events[0]
+        self.assertEqual((event.name, event.category, event.unit_id),
+                         ("open_gate", "dispatch", unit.id))
+        self.assertGreaterEqual(event.end, event.start)
+
+    def testChromeTrace(self):
+        prof = Profiler()
+        unit = SleepingUnit(self.parent)
+        prof.record("run", "unit", 1.0, 2.0, unit)
+        prof.record("run", "dispatch", 0.5, 1.0, unit)
+        prof._origin = 0
+        out = StringIO()
+        prof.export_chrome_trace(out)
+        trace = json.loads(out.getvalue())["traceEvents"]
+        self.assertEqual(trace[0]["ph"], "X")
+        self.assertEqual(trace[0]["name"], "SleepingUnit.run")
+        self.assertEqual((trace[0]["ts"], trace[0]["dur"]), (1000000, 1000000))
+        self.assertEqual([e["ph"] for e in trace[1:]], ["b", "e", "M"])
+
+    def testSpeedscope(self):
+        prof = Profiler()
+        prof._origin = 0
+        prof.record("outer", "unit", 0.0, 3.0)
+        prof.record("inner", "unit", 1.0, 2.0)
+        # Partially overlaps "outer" and is clipped
+        prof.record("late", "unit", 2.5, 4.0)
+        prof.record("next", "unit", 5.0, 6.0)
+        prof.record("wait", "dispatch", 0.0, 6.0)
+        out = StringIO()
+        prof.export_speedscope(out)
+        result = json.loads(out.getvalue())
+        frames = [f["name"] for f in result["shared"]["frames"]]
+        self.assertEqual(frames, ["outer", "inner", "late", "next"])
+        events = [(e["type"], frames[e["frame"]], e["at"])
+                  for e in result["profiles"][0]["events"]]
+        self.assertEqual(events, [
+            ("O", "outer", 0.0), ("O", "inner", 1.0), ("C", "inner", 2.0),
+            ("O", "late", 2.5), ("C", "late", 3.0), ("C", "outer", 3.0),
+            ("O", "next", 5.0), ("C", "next", 6.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,6 +36,8 @@ import base64
 import json
 import logging
 from random import randint
+import threading
+import time
 import numpy
 from six import BytesIO
 from twisted.internet import reactor
@@ -46,15 +48,42 @@ from zope.interface import implementer
 
 from veles.dummy import DummyWorkflow
 from veles.loader import Loader, ILoader
-from veles.loader.restful import RestfulLoader
+from veles.loader.restful import RestfulLoader, NotFeededError
 from veles.logger import Logger
 from veles.memory import Array
 from veles.pickle2 import pickle
 from veles.plumbing import Repeater
-from veles.restful_api import RESTfulAPI, NumpyJSONEncoder
+from veles.restful_api import RESTfulAPI, NumpyJSONEncoder, LatencyStats
 from veles.tests import timeout
 
 
+class FakeRequest(object):
+    def __init__(self, content_type, body, **headers):
+        self.headers = {b"Content-Type": content_type}
+        self.headers.update(
+            (("X-Veles-" + k).encode("charmap"), v)
+            for k, v in headers.items())
+        self.content = BytesIO(body)
+        self.response_headers = {}
+        self.written = []
+        self.code = 200
+
+    def getHeader(self, key):
+        return self.headers.get(key)
+
+    def setHeader(self, key, value):
+        self.response_headers[key] = value
+
+    def setResponseCode(self, code):
+        self.code = code
+
+    def write(self, data):
+        self.written.append(data)
+
+    def finish(self):
+        pass
+
+
 @implementer(ILoader)
 class DummyLoader(Loader):
     def load_data(self):
@@ -137,6 +166,10 @@ class RESTAPITest(unittest.TestCase):
         self.assertEqual(
             response[0]._bodyBuffer[0],
             b'{"result": [[1.0, 1.0, 1.0], [1.0, 1.0, 1.0], [1.0, 1.0, 1.0]]}')
+        stats = api.describe_stats()
+        self.assertEqual(stats["responses"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertIn("p99", stats["latency"])
 
     def test_pickling(self):
         workflow = DummyWorkflow()
@@ -175,6 +208,156 @@ class RESTAPITest(unittest.TestCase):
         self.assertEqual(arr.shape, data.shape)
         self.assertEqual(arr.dtype, data.dtype)
 
+    def test_batching(self):
+        workflow = DummyWorkflow()
+        base_loader = DummyLoader(workflow)
+        base_loader.minibatch_data.reset(numpy.zeros((10, 3, 3)))
+        base_loader.normalizer.analyze(base_loader.minibatch_data.mem)
+        loader = RestfulLoader(workflow, minibatch_size=4, buffers=1,
+                               max_response_time=0.05)
+        loader.derive_from(base_loader)
+        workflow.del_ref(base_loader)
+        loader.initialize()
+        self.assertEqual(loader.minibatch_data.shape, (4, 3, 3))
+
+        def feed(count):
+            for i in range(count):
+                loader.feed(numpy.full((3, 3), i, numpy.float64), i)
+
+        # The full buffer is flushed at once
+        feeder = threading.Thread(target=feed, args=(4,))
+        feeder.start()
+        loader.run()
+        feeder.join()
+        self.assertEqual(loader.minibatch_size, 4)
+        self.assertEqual(loader.requests, [0, 1, 2, 3])
+        self.assertEqual(loader.minibatch_data.mem[:, 0, 0].tolist(),
+                         [0, 1, 2, 3])
+        # All the buffers are waiting for the workflow
+        feed(4)
+        self.assertRaises(NotFeededError, feed, 1)
+        loader.run()
+        # The incomplete buffer is flushed after the deadline
+        feed(2)
+        start = time.time()
+        loader.run()
+        self.assertGreaterEqual(time.time() - start, 0.04)
+        self.assertEqual(loader.minibatch_size, 2)
+        self.assertEqual(loader.requests, [0, 1, None, None])
+        self.assertEqual(loader.flushes,
+                         {"size": 2, "deadline": 1, "forced": 0})
+        loader.stop()
+
+    def test_binary_codecs(self):
+        workflow = DummyWorkflow()
+        api = RESTfulAPI(workflow, port=6565 + randint(-1000, 1000),
+                         decode_workers=0)
+        fed = []
+        api.feed = lambda data, request: fed.append((data, request))
+        arr = numpy.arange(24, dtype=numpy.float32).reshape(2, 3, 4)
+        fio = BytesIO()
+        numpy.save(fio, arr)
+        npy_request = FakeRequest(b"application/x-npy", fio.getvalue())
+        api.serve(npy_request)
+        raw_request = FakeRequest(b"application/octet-stream", arr.tobytes(),
+                                  Shape=b"2,3,4", Type=b"float32", Batch=b"1")
+        api.serve(raw_request)
+        self.assertEqual(len(fed), 3)
+        self.assertEqual(fed[0][0].dtype, numpy.float32)
+        self.assertTrue((fed[0][0] == arr).all())
+        self.assertIs(fed[0][1], npy_request)
+        for index in range(2):
+            data, part = fed[index + 1]
+            self.assertTrue((data == arr[index]).all())
+            self.assertIs(part.batch.request, raw_request)
+            self.assertEqual(part.index, index)
+        api.requests = [request for _, request in fed]
+        api.results = [data.sum(axis=0) for data, _ in fed]
+        api.minibatch_size = 3
+        api.initialize()
+        api.run()
+        reactor.runUntilCurrent()
+        result = numpy.load(BytesIO(npy_request.written[0]))
+        self.assertTrue((result == arr.sum(axis=0)).all())
+        self.assertEqual(raw_request.response_headers[b"X-Veles-Shape"],
+                         b"2,4")
+        result = numpy.frombuffer(
+            raw_request.written[0],
+            raw_request.response_headers[b"X-Veles-Type"]).reshape(2, 4)
+        self.assertTrue((result == arr.sum(axis=1)).all())
+        self.assertEqual(api.describe_stats()["responses"], 2)
+        bad_request = FakeRequest(b"application/octet-stream", b"12345",
+                                  Shape=b"2,3,4", Type=b"float32")
+        api.serve(bad_request)
+        reactor.runUntilCurrent()
+        self.assertEqual(bad_request.code, 400)
+        self.assertEqual(len(fed), 3)
+        api.stop()
+
+    def test_result_cache(self):
+        workflow = DummyWorkflow()
+        api = RESTfulAPI(workflow, port=6565 + randint(-1000, 1000),
+                         decode_workers=0, cache_size=1 << 20)
+        fed = []
+        api.feed = lambda data, request: fed.append((data, request))
+        api.requests = api.results = []
+        api.minibatch_size = 0
+        api.initialize()
+        arr = numpy.arange(12, dtype=numpy.float32).reshape(2, 6)
+
+        def post(data, **headers):
+            request = FakeRequest(b"application/octet-stream",
+                                  data.tobytes(), Type=b"float32",
+                                  Shape=",".join(
+                                      str(d) for d in data.shape).encode(),
+                                  **headers)
+            api.serve(request)
+            return request
+
+        def process():
+            api.requests = [request for _, request in fed]
+            api.results = [data * 2 for data, _ in fed]
+            api.minibatch_size = len(fed)
+            api.run()
+            reactor.runUntilCurrent()
+            del fed[:]
+
+        first = post(arr[0])
+        process()
+        self.assertEqual(len(first.written), 1)
+        second = post(arr[0])
+        self.assertEqual(len(fed), 0)
+        reactor.runUntilCurrent()
+        self.assertEqual(second.written, first.written)
+        batch = post(arr, Batch=b"1")
+        self.assertEqual(len(fed), 1)
+        self.assertTrue((fed[0][0] == arr[1]).all())
+        process()
+        result = numpy.frombuffer(batch.written[0], numpy.float32)
+        self.assertTrue((result == arr.ravel() * 2).all())
+        stats = api.describe_stats()["cache"]
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual(stats["items"], 2)
+        api.invalidate_cache()
+        post(arr[1])
+        self.assertEqual(len(fed), 1)
+        api.stop()
+
+    def test_latency_stats(self):
+        stats = LatencyStats(window=100)
+        for i in range(200):
+            stats.add(i / 1000.0)
+        stats.add_error()
+        stats.add_batch(2)
+        stats.add_batch(4)
+        desc = stats.describe()
+        self.assertEqual(desc["responses"], 200)
+        self.assertEqual(desc["errors"], 1)
+        self.assertEqual(desc["batch_size"], 3)
+        self.assertAlmostEqual(desc["latency"]["p50"], 0.1495)
+        self.assertAlmostEqual(desc["latency"]["max"], 0.199)
+        self.assertLess(desc["latency"]["p90"], desc["latency"]["p99"])
+
 if __name__ == "__main__":
     Logger.setup_logging(logging.DEBUG)
     unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 14, 2015
+
+Will test the scheduling policies of the slaves.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import unittest
+
+from veles.scheduler import Scheduler, SchedulingPolicyRegistry
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.schedulers = {name: Scheduler(name)
+                           for name in SchedulingPolicyRegistry.policies}
+        for scheduler in self.schedulers.values():
+            for i, sid in enumerate(("slow", "fast", "new", "average")):
+                scheduler.report(sid, 10, 0.01)
+                scheduler[sid].requested = i
+            for _ in range(5):
+                scheduler.job_finished("slow", 4.0)
+                scheduler.job_finished("fast", 0.5)
+                scheduler.job_finished("average", 1.0)
+
+    def test_order(self):
+        slaves = "slow", "fast", "new", "average"
+        self.assertEqual(self.schedulers["round_robin"].order(slaves),
+                         list(slaves))
+        self.assertEqual(self.schedulers["weighted"].order(slaves),
+                         ["new", "fast", "average", "slow"])
+        self.assertEqual(self.schedulers["work_stealing"].order(slaves),
+                         ["new", "fast", "average", "slow"])
+        self.assertEqual(self.schedulers["work_stealing"].order(
+            ("slow", "average")), ["average", "slow"])
+
+    def test_power(self):
+        self.assertEqual(self.schedulers["round_robin"].power("fast"), 10)
+        weighted = self.schedulers["weighted"]
+        self.assertEqual(weighted.power("new"), 1.0)
+        self.assertGreater(weighted.power("fast"), weighted.power("average"))
+        self.assertAlmostEqual(sum(weighted.power(sid) for sid in (
+            "slow", "fast", "average")), 3.0)
+        desc = weighted.describe("fast")
+        self.assertAlmostEqual(desc["throughput"], 2.0)
+        self.assertAlmostEqual(desc["transfer_time"], 0.01)
+
+    def test_ewma(self):
+        scheduler = Scheduler("round_robin", alpha=0.5)
+        scheduler.job_finished("slave", 2.0)
+        scheduler.job_finished("slave", 4.0)
+        self.assertEqual(scheduler["slave"].job_time, 3.0)
+        self.assertEqual(scheduler["slave"].jobs, 2)
+        scheduler.remove("slave")
+        self.assertEqual(scheduler["slave"].jobs, 0)
+        self.assertRaises(ValueError, Scheduler, "fifo")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 16, 2015
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from multiprocessing import Process
+import unittest
+
+import numpy
+
+from veles.txzmq import SharedRing
+
+
+class TestSharedRing(unittest.TestCase):
+    def otherRead(self, descriptor):
+        ring = SharedRing.attach(*descriptor[:3])
+        arrays = ring.read(*descriptor[3:])
+        assert (arrays[0] == numpy.arange(1000)).all()
+        assert (arrays[1] == numpy.ones((10, 10), numpy.float32)).all()
+
+    def testWriteRead(self):
+        ring = SharedRing("veles-test-ring", 16384)
+        descriptor = ring.write([numpy.arange(1000),
+                                 numpy.ones((10, 10), numpy.float32)])
+        self.assertEqual(ring.used, 8448)
+        other = Process(target=self.otherRead, args=(descriptor,))
+        other.start()
+        other.join()
+        self.assertEqual(other.exitcode, 0)
+        self.assertEqual(ring.used, 0)
+        ring.close()
+
+    def testWrapAround(self):
+        ring = SharedRing("veles-test-ring", 1024)
+        for i in range(10):
+            arr = numpy.arange(50 + i, dtype=numpy.float64)
+            name, segment, capacity, descriptors, end = ring.write([arr])
+            self.assertLessEqual(descriptors[0][0] + arr.nbytes, 1024)
+            reader = SharedRing.attach(name, segment, capacity)
+            self.assertTrue((reader.read(descriptors, end)[0] == arr).all())
+        self.assertEqual(ring.grows, 0)
+        self.assertEqual(ring.used, 0)
+        ring.close()
+
+    def testGrowOverflow(self):
+        ring = SharedRing("veles-test-ring", 1024, max_capacity=4096)
+        segment = ring.segment
+        arr = numpy.arange(300, dtype=numpy.float64)
+        descriptor = ring.write([arr])
+        self.assertEqual(ring.capacity, 4096)
+        self.assertEqual(ring.grows, 1)
+        self.assertNotEqual(ring.segment, segment)
+        self.assertEqual(descriptor[:3],
+                         ("veles-test-ring", ring.segment, 4096))
+        # The previous arrays were not read, so the ring can not grow
+        self.assertRaises(SharedRing.Overflow, ring.write, [arr, arr])
+        reader = SharedRing.attach(*descriptor[:3])
+        self.assertTrue((reader.read(*descriptor[3:])[0] == arr).all())
+        self.assertRaises(SharedRing.Overflow, ring.write,
+                          [numpy.zeros(1024)])
+        self.assertEqual(ring.overflows, 2)
+        ring.close()
+
+if __name__ == "__main__":
+    unittest.main()
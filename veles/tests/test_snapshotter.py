@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 10, 2015
+
+Will test correctness of SnapshotterToFile.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy
+
+from veles.memory import Array
+from veles.pickle2 import pickle, best_protocol
+from veles.snapshotter import BlobStore, SnapshotterToFile
+from veles.tests import DummyWorkflow
+from veles.units import TrivialUnit
+
+
+class TestSnapshotterToFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="veles-snapshotter-")
+        self.workflow = DummyWorkflow()
+        self.unit = TrivialUnit(self.workflow, name="weights")
+        self.unit.weights = Array(numpy.arange(
+            100000, dtype=numpy.float32).reshape(1000, 100))
+        self.unit.bias = Array(numpy.ones(10, dtype=numpy.float32))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _export(self, suffix="snap", **kwargs):
+        snapshotter = SnapshotterToFile(
+            self.workflow, prefix="test", directory=self.directory,
+            file_format="chunked", **kwargs)
+        snapshotter.suffix = suffix
+        snapshotter.export()
+        return snapshotter.destination
+
+    def _import(self, file_name):
+        workflow = SnapshotterToFile.import_(file_name)
+        unit = [u for u in workflow if u.name == "weights"][0]
+        self.assertTrue(workflow.restored_from_snapshot)
+        return unit
+
+    def _blobs(self):
+        blobs_dir = os.path.join(self.directory, SnapshotterToFile.BLOBS_DIR)
+        return sorted(f for f in os.listdir(blobs_dir)
+                      if os.path.isfile(os.path.join(blobs_dir, f)))
+
+    def test_chunked(self):
+        file_name = self._export()
+        self.assertTrue(file_name.endswith(".chunked.pickle.gz"))
+        self.assertLess(os.path.getsize(file_name), 10000)
+        blobs = self._blobs()
+        self.assertEqual(len(blobs), 1)
+        unit = self._import(file_name)
+        self.assertIsInstance(unit.weights.mem, numpy.memmap)
+        self.assertTrue((unit.weights.mem == self.unit.weights.mem).all())
+        self.assertTrue((unit.bias.mem == 1).all())
+        # Copy on write must not change the blob
+        unit.weights.mem[0] = 0
+        self.assertTrue(
+            (self._import(file_name).weights.mem[0] != 0).any())
+
+        self._export()
+        self.assertEqual(self._blobs(), blobs)
+        self.unit.weights.mem[0, 0] = -1
+        file_name = self._export()
+        self.assertEqual(len(self._blobs()), 2)
+        self.assertEqual(self._import(file_name).weights.mem[0, 0], -1)
+
+    def test_compressed_blobs(self):
+        file_name = self._export(compression="", blob_compression="snappy")
+        self.assertTrue(file_name.endswith(".chunked.pickle"))
+        self.assertTrue(self._blobs()[0].endswith(".snappy"))
+        unit = self._import(file_name)
+        self.assertNotIsInstance(unit.weights.mem, numpy.memmap)
+        self.assertTrue((unit.weights.mem == self.unit.weights.mem).all())
+
+    def test_block_parallel(self):
+        file_name = self._export(compression="pxz", blob_compression="pgz")
+        self.assertTrue(file_name.endswith(".chunked.pickle.pxz"))
+        self.assertTrue(self._blobs()[0].endswith(".pgz"))
+        unit = self._import(file_name)
+        self.assertTrue((unit.weights.mem == self.unit.weights.mem).all())
+
+    def test_blob_gc(self):
+        grace = BlobStore.GC_GRACE_PERIOD
+        BlobStore.GC_GRACE_PERIOD = -1
+        try:
+            self._export()
+            blobs = self._blobs()
+            other = self._export("other")
+            self.assertEqual(self._blobs(), blobs)
+            self.unit.weights.mem[0, 0] = -1
+            self._export()
+            # The old blob is still referenced by the "other" snapshot
+            self.assertEqual(len(self._blobs()), 2)
+            os.remove(other)
+            file_name = self._export()
+            self.assertEqual(len(self._blobs()), 1)
+            self.assertEqual(self._import(file_name).weights.mem[0, 0], -1)
+        finally:
+            BlobStore.GC_GRACE_PERIOD = grace
+
+    def test_format_does_not_depend_on_name(self):
+        file_name = self._export()
+        renamed = os.path.join(self.directory, "renamed.pickle.gz")
+        os.rename(file_name, renamed)
+        unit = self._import(renamed)
+        self.assertTrue((unit.weights.mem == self.unit.weights.mem).all())
+
+    def test_invalid_format(self):
+        self.assertRaises(ValueError, SnapshotterToFile, self.workflow,
+                          file_format="zip")
+        self.assertRaises(ValueError, SnapshotterToFile, self.workflow,
+                          async_policy="queue")
+
+    def test_async(self):
+        snapshotter = SnapshotterToFile(
+            self.workflow, prefix="test", directory=self.directory,
+            file_format="chunked", asynchronous=True, time_interval=0)
+        snapshotter.suffix = "async"
+        snapshotter.initialize()
+        release = threading.Event()
+        write = snapshotter.write
+
+        def slow_write(capture):
+            release.wait()
+            return write(capture)
+
+        snapshotter.write = slow_write
+        self.assertTrue(snapshotter.run())
+        self.assertTrue(snapshotter.is_writing)
+        # The captured state must not depend on the later changes
+        self.unit.weights.mem[0, 0] = -1
+        self.assertIsNone(snapshotter.run())
+        release.set()
+        snapshotter.wait()
+        self.assertFalse(snapshotter.is_writing)
+        metrics = snapshotter.get_metric_values()
+        self.assertEqual(metrics["Snapshots skipped"], 1)
+        self.assertGreater(metrics["Snapshot size"], 0)
+        self.assertGreaterEqual(metrics["Snapshot write time"], 0)
+        unit = self._import(snapshotter.destination)
+        self.assertEqual(unit.weights.mem[0, 0], 0)
+        snapshotter.async_policy = "wait"
+        self.assertTrue(snapshotter.run())
+        snapshotter.stop()
+        self.assertEqual(
+            self._import(snapshotter.destination).weights.mem[0, 0], -1)
+
+    def test_async_pickle(self):
+        snapshotter = SnapshotterToFile(
+            self.workflow, prefix="test", directory=self.directory,
+            asynchronous=True, time_interval=0)
+        snapshotter.suffix = "async"
+        snapshotter.initialize()
+        capture = snapshotter.capture()
+        self.assertEqual(len(capture.arrays), 1)
+        self.assertLess(len(capture.data), 10000)
+        self.assertFalse(numpy.may_share_memory(
+            capture.arrays[0], self.unit.weights.mem))
+        self.assertTrue(snapshotter.run())
+        snapshotter.wait()
+        self.assertFalse(os.path.exists(os.path.join(
+            self.directory, SnapshotterToFile.BLOBS_DIR)))
+        unit = self._import(snapshotter.destination)
+        self.assertTrue((unit.weights.mem == self.unit.weights.mem).all())
+        self.assertTrue((unit.bias.mem == 1).all())
+
+    def test_import_legacy_chunked(self):
+        # Chunked snapshots without the header
+        store = BlobStore(os.path.join(
+            self.directory, SnapshotterToFile.BLOBS_DIR))
+        file_name = os.path.join(self.directory, "legacy.pickle")
+        with open(file_name, "wb") as fout:
+            pickler = pickle.Pickler(fout, best_protocol)
+            pickler.persistent_id = store.persistent_id
+            pickler.dump(self.workflow)
+        unit = self._import(file_name)
+        self.assertIsInstance(unit.weights.mem, numpy.memmap)
+        self.assertTrue((unit.weights.mem == self.unit.weights.mem).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
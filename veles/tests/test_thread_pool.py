@@ -91,6 +91,39 @@ class TestThreadPool(unittest.TestCase):
         self.assertTrue(flag[0])
         pool.shutdown()
 
+    def test_map(self):
+        pool = thread_pool.ThreadPool(minthreads=1, maxthreads=4)
+
+        def square(x):
+            time.sleep(prng.rand() * 0.01)
+            return x * x
+
+        self.assertEqual(pool.map(square, range(20), window=3),
+                         [x * x for x in range(20)])
+
+        def fail(x):
+            raise ValueError(x)
+
+        self.assertRaises(ValueError, pool.map, fail, range(3))
+        pool.shutdown()
+        self.assert_exit()
+
+    def test_apply_async_shutdown(self):
+        pool = thread_pool.ThreadPool(minthreads=1, maxthreads=1)
+        pool.silent = True
+        results = [pool.apply_async(time.sleep, 0.5) for _ in range(3)]
+        pool.shutdown(execute_remaining=False)
+        for result in results[1:]:
+            result.wait(5)
+            self.assertTrue(result.ready())
+            self.assertRaises(RuntimeError, result.get)
+        # The pool started stopping after apply_async() checked it
+        result = thread_pool.AsyncResult()
+        pool.callInThreadWithCallback(result.set, time.sleep, 0)
+        self.assertTrue(result.ready())
+        self.assertRaises(RuntimeError, result.get)
+        self.assert_exit()
+
     def _do(self, threads_min, threads_max):
         logging.info("Will test ThreadPool with %d max threads.", threads_max)
         data_lock = threading.Lock()
@@ -78,6 +78,15 @@ class TestContainer(Container, TrivialUnit):
     pass
 
 
+class OrderedUnit(TrivialUnit):
+    def __init__(self, workflow, **kwargs):
+        super(OrderedUnit, self).__init__(workflow, **kwargs)
+        self.order = kwargs["order"]
+
+    def run(self):
+        self.order.append(self.name)
+
+
 class Test(unittest.TestCase):
 
     def testCalculate(self):
@@ -138,6 +147,34 @@ class Test(unittest.TestCase):
         self.assertEqual(tu.attr_name, 100)
         self.assertEqual(c.attr_name, 100)
 
+    def testCompilePlan(self):
+        workflow = DummyWorkflow()
+        order = []
+        units = [OrderedUnit(workflow, name="u%d" % i, order=order)
+                 for i in range(5)]
+        for src, dst in zip(units, units[1:]):
+            dst.link_from(src)
+        # The gate of the last unit waits for the extra source
+        extra = TrivialUnit(workflow)
+        units[-1].link_from(extra)
+        for unit in units:
+            unit.initialize()
+        units[0].run_dependent()
+        dynamic = list(order)
+        self.assertEqual(["u1", "u2", "u3"], dynamic)
+        del order[:]
+        self.assertEqual(3, units[0].compile_plan())
+        units[0].run_dependent()
+        self.assertEqual(dynamic, order)
+        self.assertEqual([0, 2, 2, 2, 0],
+                         [u._run_calls for u in units])
+        # The plan is dropped as soon as the links change
+        units[-1].unlink_from(extra)
+        del order[:]
+        units[0].run_dependent()
+        self.assertEqual(["u1", "u2", "u3", "u4"], order)
+        self.assertEqual(4, units[0].compile_plan())
+
 
 if __name__ == "__main__":
     unittest.main()
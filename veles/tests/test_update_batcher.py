@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 15, 2015
+
+Will test the batched application of the updates from slaves.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import threading
+import unittest
+
+from veles.dummy import DummyWorkflow
+from veles.units import TrivialUnit
+from veles.update_batcher import UpdateBatcher
+
+
+class SlaveMock(object):
+    def __init__(self, sid):
+        self.id = sid
+
+
+class SummingUnit(TrivialUnit):
+    def __init__(self, workflow, **kwargs):
+        super(SummingUnit, self).__init__(workflow, **kwargs)
+        self.applied = []
+
+    def merge_data_from_slaves(self, data):
+        return sum(data)
+
+    def apply_data_from_slave(self, data, slave):
+        self.applied.append((data, slave))
+
+
+class CountingUnit(SummingUnit):
+    merge_data_from_slaves = None
+
+
+class TestUpdateBatcher(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.applying = threading.Event()
+        self.release = threading.Event()
+
+    def apply(self, updates):
+        self.batches.append([data for data, _ in updates])
+        self.applying.set()
+        self.release.wait()
+        return [data * 10 for data, _ in updates]
+
+    def test_batching(self):
+        batcher = UpdateBatcher(self.apply, max_batch=3)
+        results = []
+        batcher.start()
+        for i in range(5):
+            batcher.submit(i, SlaveMock(str(i))).addCallback(results.append)
+            # The rest pile up while the first one is being applied
+            self.applying.wait()
+        batcher.call(lambda: results.append("dropped"))
+        batcher.submit(5, SlaveMock("5")).addCallback(results.append)
+        self.release.set()
+        batcher.stop()
+        self.assertEqual(results, [0, 10, 20, 30, 40, "dropped", 50])
+        self.assertEqual(self.batches[0], [0])
+        self.assertEqual(self.batches[1:], [[1, 2, 3], [4], [5]])
+        stats = batcher.stats
+        self.assertEqual(stats["updates"], 6)
+        self.assertEqual(stats["batches"], 4)
+        self.assertGreaterEqual(stats["max_queue_length"], 6)
+        self.assertGreaterEqual(stats["max_latency"],
+                                stats["average_latency"])
+
+    def test_overflow(self):
+        batcher = UpdateBatcher(self.apply, max_batch=1, max_queue=2)
+        results = []
+        batcher.start()
+        batcher.submit(0, SlaveMock("0")).addCallback(results.append)
+        self.applying.wait()
+        # None of these block although the queue holds only two items
+        for i in range(1, 4):
+            batcher.submit(i, SlaveMock(str(i))).addCallback(results.append)
+        batcher.call(lambda: results.append("dropped"))
+        batcher.submit(4, SlaveMock("4")).addCallback(results.append)
+        self.assertEqual(batcher.overflows, 3)
+        self.assertEqual(batcher.queue_length, 5)
+        self.release.set()
+        batcher.stop()
+        self.assertEqual(results, [0, 10, 20, 30, "dropped", 40])
+
+    def test_errors(self):
+        failures = []
+        batcher = UpdateBatcher(lambda updates: 1 / 0)
+        batcher.start()
+        batcher.submit(0, SlaveMock("0")).addErrback(failures.append)
+        batcher.stop()
+        self.assertEqual(len(failures), 1)
+        self.assertTrue(failures[0].check(ZeroDivisionError))
+        self.assertRaises(ValueError, UpdateBatcher, self.apply,
+                          max_batch=0)
+
+    def test_workflow_merge(self):
+        workflow = DummyWorkflow()
+        summing = SummingUnit(workflow)
+        counting = CountingUnit(workflow)
+        summing.link_from(workflow.start_point)
+        counting.link_from(summing)
+        workflow.end_point.link_from(counting)
+        index = list(workflow.units_in_dependency_order).index(summing)
+        updates = []
+        for i in range(3):
+            data = [None] * len(workflow)
+            data[index] = data[index + 1] = i + 1
+            updates.append((data, SlaveMock(str(i))))
+        self.assertEqual(workflow.apply_data_from_slaves(updates),
+                         [True] * 3)
+        self.assertEqual(summing.applied, [(6, None)])
+        self.assertEqual([(d, s.id) for d, s in counting.applied],
+                         [(1, "0"), (2, "1"), (3, "2")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 14, 2015
+
+Will test the delta encoding of the updates for master.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+import unittest
+
+import numpy
+
+from veles.dummy import DummyWorkflow
+from veles.error import BadFormatError
+from veles.memory import Array
+from veles.pickle2 import pickle, best_protocol
+from veles.prng import get as get_prng
+from veles.units import TrivialUnit
+from veles.update_codec import UpdateEncoder, UpdateDecoder, normalize_spec
+
+
+def transfer(data):
+    return pickle.loads(pickle.dumps(data, best_protocol))
+
+
+class SlaveMock(object):
+    id = "slave"
+
+
+class WeightsUnit(TrivialUnit):
+    def __init__(self, workflow, **kwargs):
+        super(WeightsUnit, self).__init__(workflow, **kwargs)
+        self.weights = Array(numpy.zeros(1000, numpy.float32))
+        self.applied = None
+
+    def generate_data_for_master(self):
+        return {"weights": self.weights, "epoch": 1}
+
+    def apply_data_from_slave(self, data, slave):
+        self.applied = data
+
+
+class TestUpdateCodec(unittest.TestCase):
+    def setUp(self):
+        self.prng = get_prng()
+        self.weights = self.prng.rand(50, 40)
+
+    def exchange(self, encoder, decoder, data, ack=True):
+        decoded = decoder.decode(SlaveMock.id, transfer(encoder.encode(data)))
+        if ack:
+            encoder.acknowledge()
+        return decoded
+
+    def test_delta(self):
+        encoder = UpdateEncoder({0: normalize_spec("delta")})
+        decoder = UpdateDecoder()
+        small = numpy.ones(10)
+        for i in range(4):
+            if i != 2:
+                self.weights[i] += 1
+            update = [{"w": self.weights, "b": small, "n": i}, None]
+            result = self.exchange(encoder, decoder, update)
+            self.assertEqual(result[1], None)
+            self.assertEqual(result[0]["n"], i)
+            self.assertTrue(numpy.array_equal(result[0]["b"], small))
+            self.assertTrue(numpy.allclose(result[0]["w"], self.weights))
+        # The first update is sent in full, the third has not changed
+        self.assertEqual(encoder.encoded_bytes, 3 * self.weights.nbytes)
+        self.assertEqual(decoder.stats, encoder.stats)
+        self.assertEqual(encoder.saved_per_update,
+                         self.weights.nbytes // 4)
+
+    def test_lossy(self):
+        for spec in ("fp16", {"codec": "topk", "ratio": 0.1}):
+            encoder = UpdateEncoder({0: normalize_spec(spec)})
+            decoder = UpdateDecoder()
+            self.exchange(encoder, decoder, [[Array(self.weights)]])
+            target = self.weights + self.prng.rand(*self.weights.shape)
+            for _ in range(10):
+                encoded = encoder.encode([[Array(target)]])
+                result = decoder.decode(SlaveMock.id, transfer(encoded))
+                local = encoder.decode(encoded)
+                encoder.acknowledge()
+                self.assertIsInstance(result[0][0], Array)
+                self.assertTrue(numpy.array_equal(
+                    result[0][0].mem, local[0][0].mem))
+            # Error feedback delivers the residuals
+            self.assertLess(numpy.abs(result[0][0].mem - target).max(), 1e-3,
+                            spec)
+            self.assertLess(encoder.encoded_bytes, encoder.raw_bytes / 2)
+
+    def test_acknowledge(self):
+        encoder = UpdateEncoder({0: normalize_spec("delta")})
+        decoder = UpdateDecoder()
+        first = self.exchange(encoder, decoder, [self.weights], ack=False)
+        second = self.exchange(encoder, decoder, [self.weights + 1])
+        self.assertEqual(encoder.encoded_bytes, 2 * self.weights.nbytes)
+        encoder.acknowledge()
+        third = self.exchange(encoder, decoder, [self.weights + 2])
+        for i, res in enumerate((first, second, third)):
+            self.assertTrue(numpy.allclose(res[0], self.weights + i))
+        other = UpdateDecoder()
+        self.assertRaises(BadFormatError, other.decode, SlaveMock.id,
+                          encoder.encode([self.weights]))
+        encoder.reset()
+        self.exchange(encoder, other, [self.weights])
+        decoder.drop(SlaveMock.id)
+        self.assertRaises(BadFormatError, decoder.decode, SlaveMock.id,
+                          encoder.encode([self.weights]))
+
+    def test_spec(self):
+        self.assertEqual(normalize_spec("topk"), {
+            "codec": "topk", "ratio": 0.01, "error_feedback": True})
+        self.assertEqual(normalize_spec(None), None)
+        self.assertRaises(ValueError, normalize_spec, "zip")
+        self.assertRaises(ValueError, normalize_spec,
+                          {"codec": "topk", "ratio": 2})
+
+    def test_workflow(self):
+        master, slave = DummyWorkflow(), DummyWorkflow()
+        for workflow in master, slave:
+            unit = WeightsUnit(workflow, update_encoding="fp16")
+            unit.link_from(workflow.start_point)
+            workflow.end_point.link_from(unit)
+        encodings = master.negotiate_update_encodings(("delta", "fp16"))
+        self.assertEqual(list(encodings.values()), [unit.update_encoding])
+        self.assertEqual(master.negotiate_update_encodings(("delta",)), {})
+        slave.apply_update_encodings(transfer(
+            {str(k): v for k, v in encodings.items()}))
+        for _ in range(3):
+            unit.weights.mem += 1
+            master.apply_data_from_slave(
+                transfer(slave.generate_data_for_master()), SlaveMock())
+            slave.acknowledge_update()
+        applied = master[unit.name].applied
+        self.assertEqual(applied["epoch"], 1)
+        self.assertTrue(numpy.array_equal(applied["weights"].mem,
+                                          unit.weights.mem))
+        self.assertEqual(master._update_decoder_.stats["encoded_bytes"],
+                         unit.weights.nbytes * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -35,6 +35,7 @@ under the License.
 
 from __future__ import print_function
 import argparse
+from collections import deque
 from copy import copy
 import functools
 import logging
@@ -48,12 +49,14 @@ from traceback import print_stack
 import types
 from twisted.internet import reactor
 from twisted.python import threadpool
+from twisted.python.failure import Failure
 import weakref
 
 from veles.external import manhole
 import veles.logger as logger
 from veles.cmdline import CommandLineArgumentsRegistry, classproperty
 from veles.compat import from_none, is_interactive
+from veles.profiler import profiler
 
 
 def errback(failure, thread_pool=None):
@@ -68,6 +71,38 @@ def errback(failure, thread_pool=None):
         thread_pool.shutdown(execute_remaining=False, force=True)
 
 
+class AsyncResult(object):
+    """
+    The outcome of ThreadPool.apply_async().
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._outcome = None
+
+    def ready(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+
+    def get(self):
+        """
+        Waits for the function to finish.
+        :return: The function's result. If it raised an exception, the
+        exception is reraised.
+        """
+        self._done.wait()
+        success, result = self._outcome
+        if not success:
+            result.raiseException()
+        return result
+
+    def set(self, success, result):
+        self._outcome = success, result
+        self._done.set()
+
+
 @add_metaclass(CommandLineArgumentsRegistry)
 class ThreadPool(threadpool.ThreadPool, logger.Logger):
     """
@@ -167,9 +202,13 @@ class ThreadPool(threadpool.ThreadPool, logger.Logger):
         """
         self._not_paused.wait()
         if self._stopping:
+            self._reject(onResult)
             return
+        if profiler.enabled:
+            func = profiler.dispatched(func)
         with self._lock:
-            if self._dead:
+            if self._dead or self.joined:
+                self._reject(onResult)
                 return
             super(ThreadPool, self).callInThreadWithCallback(
                 functools.partial(self._on_result, onResult),
@@ -199,6 +238,44 @@ class ThreadPool(threadpool.ThreadPool, logger.Logger):
     def paused(self):
         return not self._not_paused.is_set()
 
+    def apply_async(self, func, *args, **kwargs):
+        """
+        Schedules func(*args, **kwargs) to run in the pool's threads.
+        :return: AsyncResult instance.
+        """
+        if self._dead or self._stopping:
+            raise RuntimeError("%s is shut down" % self.name)
+        if not self.started:
+            self.start()
+        result = AsyncResult()
+        self.callInThreadWithCallback(result.set, func, *args, **kwargs)
+        return result
+
+    def imap(self, func, iterable, window=None):
+        """
+        Applies func to each item of iterable in the pool's threads and
+        yields the results in the order of items. At most window items
+        (2 * maxthreads by default) are queued at once. The exception raised
+        by func is reraised in the calling thread. Must not be called from
+        the pool's own threads.
+        """
+        if window is None:
+            window = 2 * self.max
+        pending = deque()
+        for item in iterable:
+            if len(pending) >= window:
+                yield pending.popleft().get()
+            pending.append(self.apply_async(func, item))
+        while len(pending) > 0:
+            yield pending.popleft().get()
+
+    def map(self, func, iterable, window=None):
+        """
+        Blocking version of imap().
+        :return: The list of results.
+        """
+        return list(self.imap(func, iterable, window))
+
     def register_on_thread_enter(self, func, weak=True):
         """
         Adds the specified function to the list of callbacks which are
@@ -250,6 +327,42 @@ class ThreadPool(threadpool.ThreadPool, logger.Logger):
     def shutdown(self, execute_remaining=True, force=False, timeout=1.0):
         self._stopping_call(self._shutdown, execute_remaining, force, timeout)
 
+    def _reject(self, onResult):
+        """
+        Reports the task which will never run to its result callback, so
+        that e.g. AsyncResult.get() does not block forever.
+        """
+        if isinstance(onResult, functools.partial) and \
+                onResult.func == self._on_result:
+            onResult = onResult.args[0]
+        if onResult is not None:
+            onResult(False, Failure(RuntimeError(
+                "%s is shut down, the task was discarded" % self.name)))
+
+    def _reject_queued(self):
+        """
+        Removes the tasks which were left in the queue after the threads
+        stopped and rejects them, see _reject().
+        """
+        rejected = []
+        stops = 0
+        while True:
+            try:
+                item = self.q.get_nowait()
+            except queue.Empty:
+                break
+            if item is threadpool.WorkerStop:
+                stops += 1
+            else:
+                rejected.append(item[-1])
+        # The threads which failed to join still need their WorkerStop-s
+        for _ in range(stops):
+            self.q.put(threadpool.WorkerStop)
+        for onResult in rejected:
+            self._reject(onResult)
+        if len(rejected) > 0:
+            self.debug("Rejected %d queued tasks", len(rejected))
+
     def _on_result(self, original, success, result):
         if original is not None:
             return original(success, result)
@@ -353,6 +466,7 @@ class ThreadPool(threadpool.ThreadPool, logger.Logger):
             else:
                 self.workers -= 1
         self.joined = True
+        self._reject_queued()
 
     def _shutdown(self, execute_remaining, force, timeout):
         """Safely brings thread pool down.
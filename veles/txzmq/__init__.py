@@ -39,3 +39,4 @@ under the License.
 
 from veles.txzmq.connection import ZmqConnection, ZmqEndpoint
 from veles.txzmq.sharedio import SharedIO
+from veles.txzmq.sharedring import SharedRing
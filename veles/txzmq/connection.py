@@ -41,10 +41,13 @@ from collections import deque, namedtuple
 import gzip
 import zlib
 import os
+import threading
 import time
 from tempfile import mkstemp
 
+import numpy
 import six
+from six import BytesIO
 from six.moves import cPickle as pickle
 import snappy
 from zmq import constants, error
@@ -60,7 +63,9 @@ ZMQ3 = zmq_version_info()[0] >= 3
 
 from veles.txzmq.manager import ZmqContextManager
 from veles.txzmq.sharedio import SharedIO
+from veles.txzmq.sharedring import SharedRing
 
+from veles.block_codec import BlockCompressor, BlockDecompressor
 from veles.compat import lzma, from_none
 from veles.logger import Logger
 from veles.pickle2 import best_protocol
@@ -122,6 +127,9 @@ class ZmqConnection(Logger):
     :vartype fd: int
     :var queue: output message queue
     :vartype queue: deque
+    :var zero_copy: send numpy arrays as separate raw frames without copying
+        them (see :meth:`send`)
+    :vartype zero_copy: bool
     """
 
     class IOOverflow(Exception):
@@ -140,8 +148,14 @@ class ZmqConnection(Logger):
 
     PICKLE_START = b'vpb'
     PICKLE_END = b'vpe'
+    PICKLE_OOB_START = b'vpo'
+    PICKLE_SHM_START = b'vps'
+    #: Smaller arrays are pickled together with the rest of the object
+    OOB_THRESHOLD = 64 * 1024
     CODECS = {None: b'\x00', "": b'\x00', "gzip": b'\x01', "snappy": b'\x02',
-              "xz": b'\x03'}
+              "xz": b'\x03', "pgzip": b'\x04', "pbz2": b'\x05', "pxz": b'\x06'}
+    #: Codec id -> the name of the block-parallel codec (veles.block_codec)
+    BLOCK_CODECS = {4: "gz", 5: "bz2", 6: "xz"}
 
     def __init__(self, endpoints, identity=None, **kwargs):
         """
@@ -163,7 +177,11 @@ class ZmqConnection(Logger):
         self.read_scheduled = None
         self.shutted_down = False
         self.pickles_compression = "snappy"
+        self.zero_copy = False
         self._last_read_time = 0.0
+        # buffers key -> the trackers of the arrays sent with zero_copy
+        self._trackers = {}
+        self._trackers_lock = threading.Lock()
 
         self.fd = self.socket.get(constants.FD)
         self.socket.set(constants.LINGER, self.factory.lingerPeriod)
@@ -234,10 +252,22 @@ class ZmqConnection(Logger):
 
     @pickles_compression.setter
     def pickles_compression(self, value):
-        if value not in (None, "", "gzip", "snappy", "xz"):
-            raise ValueError()
+        if value not in ZmqConnection.CODECS:
+            raise ValueError("Unsupported pickles compression \"%s\"" %
+                             value)
         self._pickles_compression = value
 
+    @property
+    def zero_copy(self):
+        return self._zero_copy
+
+    @zero_copy.setter
+    def zero_copy(self, value):
+        if not isinstance(value, bool):
+            raise TypeError("zero_copy must be boolean (got %s)" %
+                            type(value))
+        self._zero_copy = value
+
     def connectionLost(self, reason):
         """
         Called when the connection was lost.
@@ -259,7 +289,18 @@ class ZmqConnection(Logger):
         or raising exception (in case of no more messages available).
         """
         while True:
+            if unpickler.awaiting_buffers:
+                unpickler.receive_buffer(self.socket)
+                continue
             part = self.socket.recv(constants.NOBLOCK)
+            if part == ZmqConnection.PICKLE_OOB_START:
+                self.messageHeaderReceived(self.recv_parts)
+                unpickler.start_out_of_band()
+                continue
+            if part == ZmqConnection.PICKLE_SHM_START:
+                self.messageHeaderReceived(self.recv_parts)
+                unpickler.start_shared()
+                continue
             if part.startswith(ZmqConnection.PICKLE_START):
                 self.messageHeaderReceived(self.recv_parts)
                 unpickler.active = True
@@ -286,6 +327,9 @@ class ZmqConnection(Logger):
             self._data = []
             self._active = False
             self._decompressor = None
+            self._buffers = None
+            self._received_buffers = 0
+            self._shared = False
 
         @property
         def active(self):
@@ -295,10 +339,63 @@ class ZmqConnection(Logger):
         def active(self, value):
             self._active = value
             if not value:
-                buffer = self.merge_chunks()
-                self._object = pickle.loads(buffer if six.PY3 else str(buffer))
+                if self._shared:
+                    self._object = self._load_shared()
+                    self._shared = False
+                elif self._buffers is not None:
+                    self._object = self._load_out_of_band(self._buffers)
+                    self._buffers = None
+                else:
+                    buffer = self.merge_chunks()
+                    self._object = pickle.loads(
+                        buffer if six.PY3 else str(buffer))
             self._data = []
 
+        @property
+        def awaiting_buffers(self):
+            return self._buffers is not None and len(self._data) == 2 and \
+                self._received_buffers < len(self._buffers)
+
+        def start_out_of_band(self):
+            """
+            Prepares to receive the pickle with out-of-band buffers: the frame
+            with the buffers' descriptors, the frame with the pickle and the
+            raw buffers (see :meth:`ZmqConnection._send_out_of_band`).
+            """
+            self._active = True
+            self._codec = 0
+            self._buffers = []
+            self._received_buffers = 0
+
+        def start_shared(self):
+            """
+            Prepares to receive the pickle with the buffers in the shared
+            memory ring: the frame with the ring's descriptor and the frame
+            with the pickle (see :meth:`ZmqConnection._send_shared`).
+            """
+            self._active = True
+            self._codec = 0
+            self._shared = True
+
+        def receive_buffer(self, socket):
+            """
+            Receives the next out-of-band frame into the preallocated array.
+            """
+            target = self._buffers[self._received_buffers]
+            flat = target.reshape(-1).view(numpy.uint8)
+            if hasattr(socket, "recv_into"):
+                size = socket.recv_into(flat, flags=constants.NOBLOCK)
+            else:
+                frame = socket.recv(constants.NOBLOCK, copy=False)
+                size = len(frame)
+                if size == flat.nbytes:
+                    flat[:] = numpy.frombuffer(frame, numpy.uint8)
+            if size != flat.nbytes:
+                raise ValueError(
+                    "Out-of-band buffer %d has %d bytes (expected %d)" %
+                    (self._received_buffers, size, flat.nbytes))
+            self._received_buffers += 1
+
         @property
         def codec(self):
             return self._codec
@@ -315,6 +412,8 @@ class ZmqConnection(Logger):
                 self._decompressor = snappy.StreamDecompressor()
             elif self.codec == 3:
                 self._decompressor = lzma.LZMADecompressor()
+            elif self.codec in ZmqConnection.BLOCK_CODECS:
+                self._decompressor = BlockDecompressor()
             else:
                 raise ValueError("Unknown compression type")
 
@@ -336,10 +435,30 @@ class ZmqConnection(Logger):
             return buffer
 
         def consume(self, data):
+            if self._shared:
+                self._data.append(data)
+                return
+            if self._buffers is not None:
+                if len(self._data) == 0:
+                    self._buffers = [numpy.empty(shape, dtype) for dtype, shape
+                                     in pickle.loads(data)]
+                self._data.append(data)
+                return
             if self.codec > 0:
                 data = self._decompressor.decompress(data)
             self._data.append(data)
 
+        def _load_out_of_band(self, buffers):
+            unpickler = pickle.Unpickler(BytesIO(self._data[1]))
+            unpickler.persistent_load = lambda pid: buffers[pid]
+            return unpickler.load()
+
+        def _load_shared(self):
+            name, segment, capacity, descriptors, end = \
+                pickle.loads(self._data[0])
+            ring = SharedRing.attach(name, segment, capacity)
+            return self._load_out_of_band(ring.read(descriptors, end))
+
     def doRead(self):
         """
         Some data is available for reading on ZeroMQ descriptor.
@@ -408,10 +527,23 @@ class ZmqConnection(Logger):
         an instance of bytes, it will be sent as-is, otherwise, it will be\
         pickled and optionally compressed. Object must not be a string.
         :param pickles_compression: the compression to apply to pickled\
-        objects. Supported values are None or "", "gzip", "snappy" and "xz".
+        objects. Supported values are None or "", "gzip", "snappy", "xz" and\
+        the block-parallel "pgzip", "pbz2" and "pxz".
         :type pickles_compression: str
         :param io: a SharedIO object where to put pickles into instead of the\
         socket. Can be None.
+        :param zero_copy: if True and io is None, numpy arrays are not\
+        pickled but sent as separate frames without copying them; the\
+        receiver allocates the arrays and fills them directly from the\
+        frames. The sent arrays must not change until\
+        :meth:`wait_buffers_sent` returns. Defaults to :attr:`zero_copy`.
+        :type zero_copy: bool
+        :param ring: a :class:`veles.txzmq.sharedring.SharedRing` where to\
+        put numpy arrays into instead of the socket; only their descriptors\
+        are sent. The receiver must be on the same host. If the arrays do not\
+        fit into the ring, they are sent as usual. Can be None.
+        :param buffers_key: the key which the arrays sent with zero_copy are\
+        tracked by, e.g. the receiver's ID, see :meth:`wait_buffers_sent`.
         """
         if self.shutted_down:
             return
@@ -419,6 +551,9 @@ class ZmqConnection(Logger):
         pickles_size = 0
         io = kwargs.get("io")
         io_overflow = False
+        zero_copy = kwargs.get("zero_copy", self.zero_copy)
+        ring = kwargs.get("ring")
+        buffers_key = kwargs.get("buffers_key")
 
         def send_part(msg, last):
             flag = constants.SNDMORE if not last else 0
@@ -427,8 +562,13 @@ class ZmqConnection(Logger):
                 return 0
             if isinstance(msg, str):
                 raise ValueError("All strings must be encoded into bytes")
-            return self._send_pickled(msg, last, pickles_compression,
-                                      io if not io_overflow else None)
+            if ring is not None:
+                return self._send_shared(msg, last, ring, zero_copy,
+                                         pickles_compression, buffers_key)
+            io_ = io if not io_overflow else None
+            if zero_copy and io_ is None:
+                return self._send_out_of_band(msg, last, buffers_key)
+            return self._send_pickled(msg, last, pickles_compression, io_)
 
         for i, m in enumerate(message):
             try:
@@ -495,6 +635,10 @@ class ZmqConnection(Logger):
             elif self.codec == 3:
                 self._compressor = ZmqConnection.CompressedFile(
                     self._socketobj, lzma.LZMACompressor(lzma.FORMAT_XZ))
+            elif self.codec in ZmqConnection.BLOCK_CODECS:
+                self._compressor = ZmqConnection.CompressedFile(
+                    self._socketobj, BlockCompressor(
+                        ZmqConnection.BLOCK_CODECS[self.codec]))
             else:
                 raise ValueError("Unknown compression type")
 
@@ -562,6 +706,133 @@ class ZmqConnection(Logger):
                 send_to_socket()
                 raise ZmqConnection.IOOverflow()
 
+    def _send_out_of_band(self, message, last, buffers_key=None,
+                          pickled=None, copy=False):
+        """
+        Sends the object as the pickle with out-of-band buffers:
+        PICKLE_OOB_START, the descriptors of the arrays, the pickle which
+        refers to the arrays by their indices, the raw contents of the arrays
+        and PICKLE_END. If copy is False, the arrays are sent without copying
+        and tracked under buffers_key.
+        :param pickled: the result of :meth:`_pickle_out_of_band` if the\
+        message has already been pickled.
+        """
+        if pickled is None:
+            pickled = self._pickle_out_of_band(message)
+        data, arrays = pickled
+        descriptors = pickle.dumps([(a.dtype.str, a.shape) for a in arrays],
+                                   protocol=best_protocol)
+        flags = constants.NOBLOCK | constants.SNDMORE
+        self.socket.send(ZmqConnection.PICKLE_OOB_START, flags)
+        self.socket.send(descriptors, flags)
+        self.socket.send(data, flags)
+        if copy:
+            for arr in arrays:
+                self.socket.send(arr, flags)
+        else:
+            self._track_buffers(buffers_key, [
+                self.socket.send(arr, flags, copy=False, track=True)
+                for arr in arrays])
+        self.socket.send(ZmqConnection.PICKLE_END,
+                         constants.NOBLOCK | (constants.SNDMORE if not last
+                                              else 0))
+        return len(descriptors) + len(data) + sum(a.nbytes for a in arrays)
+
+    def _track_buffers(self, buffers_key, trackers):
+        with self._trackers_lock:
+            trackers.extend(t for t in self._trackers.get(buffers_key, ())
+                            if not t.done)
+            self._trackers[buffers_key] = trackers
+
+    def _send_shared(self, message, last, ring, zero_copy, compression=None,
+                     buffers_key=None):
+        """
+        Copies the numpy arrays of the object into the shared memory ring and
+        sends PICKLE_SHM_START, the ring's descriptor, the pickle which refers
+        to the arrays by their indices and PICKLE_END. Falls back to the
+        regular transport if the arrays do not fit into the ring.
+        """
+        data, arrays = self._pickle_out_of_band(message)
+        try:
+            descriptor = pickle.dumps(ring.write(arrays),
+                                      protocol=best_protocol)
+        except SharedRing.Overflow:
+            if zero_copy or not compression:
+                # Reuse the pickle, the arrays are sent as raw frames
+                return self._send_out_of_band(
+                    message, last, buffers_key, (data, arrays),
+                    copy=not zero_copy)
+            # The compressed pickle must include the arrays
+            return self._send_pickled(message, last, compression, None)
+        flags = constants.NOBLOCK | constants.SNDMORE
+        self.socket.send(ZmqConnection.PICKLE_SHM_START, flags)
+        self.socket.send(descriptor, flags)
+        self.socket.send(data, flags)
+        self.socket.send(ZmqConnection.PICKLE_END,
+                         constants.NOBLOCK | (constants.SNDMORE if not last
+                                              else 0))
+        return len(descriptor) + len(data) + sum(a.nbytes for a in arrays)
+
+    def _pickle_out_of_band(self, message):
+        """
+        Pickles the object with the big numpy arrays replaced by their
+        indices.
+        :return: The pickle and the list of the C-contiguous arrays.
+        """
+        arrays = []
+        indices = {}
+
+        def persistent_id(obj):
+            if not isinstance(obj, numpy.ndarray) or obj.dtype.hasobject or \
+                    obj.nbytes < ZmqConnection.OOB_THRESHOLD:
+                return None
+            index = indices.get(id(obj))
+            if index is None:
+                index = indices[id(obj)] = len(arrays)
+                arrays.append(numpy.ascontiguousarray(obj))
+            return index
+
+        fio = BytesIO()
+        pickler = pickle.Pickler(fio, best_protocol)
+        pickler.persistent_id = persistent_id
+        pickler.dump(message)
+        return fio.getvalue(), arrays
+
+    def wait_buffers_sent(self, timeout=-1):
+        """
+        Blocks until ZeroMQ releases all the arrays which were sent with
+        zero_copy, so that they can be safely changed.
+        :param timeout: the maximal time to wait in seconds; -1 means forever.
+        :return: The set of the buffers keys (see :meth:`send`) whose arrays
+                 were not released before the timeout.
+        """
+        with self._trackers_lock:
+            trackers = list(self._trackers.items())
+        deadline = time.time() + timeout if timeout >= 0 else None
+        pending = set()
+        for key, key_trackers in trackers:
+            for tracker in key_trackers:
+                if tracker.done:
+                    continue
+                if deadline is None:
+                    tracker.wait()
+                    continue
+                try:
+                    tracker.wait(max(deadline - time.time(), 0))
+                except error.NotDone:
+                    pending.add(key)
+                    break
+        return pending
+
+    def forget_buffers(self, keys):
+        """
+        Stops tracking the arrays sent with zero_copy under the specified
+        buffers keys, so that :meth:`wait_buffers_sent` skips them.
+        """
+        with self._trackers_lock:
+            for key in keys:
+                self._trackers.pop(key, None)
+
     def messageReceived(self, message):
         """
         Called when complete message is received.
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+Created on Jul 16, 2015
+
+Ring buffer of numpy arrays in the shared memory. It lets the master pass the
+jobs to the slaves on the same host without pushing the arrays through the
+ZeroMQ socket: only the descriptors of the arrays are sent.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from binascii import hexlify
+from mmap import mmap
+import os
+
+import numpy
+from posix_ipc import SharedMemory, O_CREAT, ExistentialError
+
+
+class SharedRing(object):
+    """
+    Single producer, single consumer ring buffer in the shared memory.
+
+    The segment starts with the header which holds the absolute head (the
+    number of bytes written so far) and tail (the number of bytes consumed
+    so far) positions. The producer copies the arrays after the head and
+    sends the descriptors returned by :meth:`write` by other means; the
+    consumer copies the arrays out in :meth:`read` and moves the tail, so
+    the producer never overwrites the data which was not read yet.
+
+    Each shared memory segment has the unique name, so that the consumer
+    never reads from the stale segment of the previous ring with the same
+    name. If the arrays do not fit and the ring is empty, it is recreated
+    with the bigger capacity in the new segment. If they do not
+    fit otherwise, :class:`SharedRing.Overflow` is raised and the caller is
+    expected to send the arrays some other way.
+    """
+
+    HEADER_SIZE = 64
+    ALIGNMENT = 64
+    #: ring name -> the consumer's ring
+    CACHE = {}
+
+    class Overflow(Exception):
+        pass
+
+    def __init__(self, name, capacity=1 << 20, max_capacity=1 << 31,
+                 segment=None):
+        """
+        :param name: the name of the ring.
+        :param capacity: the initial size of the ring in bytes.
+        :param max_capacity: the ring never grows bigger than this.
+        :param segment: the name of the existing shared memory segment to\
+        open; if it is None, the new segment is created and owned.
+        """
+        self.name = name
+        self.max_capacity = max_capacity
+        self.owner = segment is None
+        self.writes = 0
+        self.overflows = 0
+        self.grows = 0
+        self._shmem = None
+        self._open(capacity, segment)
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def segment(self):
+        return self._shmem.name
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def used(self):
+        """
+        The number of bytes which were written but not consumed yet.
+        """
+        return int(self._header[0] - self._header[1])
+
+    @staticmethod
+    def attach(name, segment, capacity):
+        """
+        Opens the consumer's side of the ring which was created by the
+        producer, reusing the already opened one.
+        """
+        ring = SharedRing.CACHE.get(name)
+        if ring is None or ring._shmem is None or ring.segment != segment:
+            if ring is not None:
+                ring.close()
+            ring = SharedRing.CACHE[name] = SharedRing(
+                name, capacity, segment=segment)
+        return ring
+
+    def write(self, arrays):
+        """
+        Copies the arrays into the ring.
+        :param arrays: the list of C-contiguous numpy arrays.
+        :return: The descriptor: the ring's name, segment and capacity (see
+        :meth:`attach`), the list of (offset, dtype, shape) of each array and
+        the new head position (see :meth:`read`).
+        """
+        head, tail = (int(p) for p in self._header)
+        offsets, end = self._place(head, arrays)
+        if end - tail > self.capacity:
+            if head != tail:
+                self.overflows += 1
+                raise SharedRing.Overflow()
+            self._grow(end - head)
+            head = tail = 0
+            offsets, end = self._place(head, arrays)
+        data = self._data
+        for offset, arr in zip(offsets, arrays):
+            data[offset:offset + arr.nbytes] = arr.reshape(-1).view(
+                numpy.uint8)
+        self._header[0] = end
+        self.writes += 1
+        return (self.name, self.segment, self.capacity,
+                [(offset, arr.dtype.str, arr.shape)
+                 for offset, arr in zip(offsets, arrays)], end)
+
+    def read(self, descriptors, end):
+        """
+        Copies the arrays out of the ring and releases their space.
+        :param descriptors: the list of (offset, dtype, shape) of each array.
+        :param end: the head position after the arrays were written.
+        :return: The list of numpy arrays.
+        """
+        arrays = []
+        for offset, dtype, shape in descriptors:
+            arr = numpy.empty(shape, dtype)
+            arr.reshape(-1).view(numpy.uint8)[:] = \
+                self._data[offset:offset + arr.nbytes]
+            arrays.append(arr)
+        self._header[1] = end
+        return arrays
+
+    def close(self):
+        if self._shmem is None:
+            return
+        self._header = self._data = None
+        self._mmap.close()
+        self._shmem.close_fd()
+        if self.owner:
+            try:
+                self._shmem.unlink()
+            except ExistentialError:
+                pass
+        self._shmem = None
+
+    def _open(self, capacity, segment):
+        self._capacity = capacity
+        size = SharedRing.HEADER_SIZE + capacity
+        if self.owner:
+            segment = "%s-%s" % (self.name, hexlify(os.urandom(4)).decode())
+            self._shmem = SharedMemory(segment, flags=O_CREAT, mode=0o666,
+                                       size=size)
+        else:
+            self._shmem = SharedMemory(segment)
+        self._mmap = mmap(self._shmem.fd, size)
+        self._header = numpy.ndarray((2,), numpy.uint64, buffer=self._mmap)
+        self._data = numpy.ndarray((capacity,), numpy.uint8,
+                                   buffer=self._mmap,
+                                   offset=SharedRing.HEADER_SIZE)
+        if self.owner:
+            self._header[:] = 0
+
+    def _grow(self, size):
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+        if capacity > self.max_capacity:
+            self.overflows += 1
+            raise SharedRing.Overflow()
+        if capacity == self.capacity:
+            # The ring is empty, so start from the beginning
+            self._header[:] = 0
+            return
+        self.close()
+        self._open(capacity, None)
+        self.grows += 1
+
+    def _place(self, head, arrays):
+        """
+        Calculates the offsets of the arrays so that each of them is
+        contiguous in the ring.
+        :return: The offsets and the new head position.
+        """
+        offsets = []
+        pos = head
+        for arr in arrays:
+            size = -(-arr.nbytes // SharedRing.ALIGNMENT) * \
+                SharedRing.ALIGNMENT
+            offset = pos % self.capacity
+            if offset + size > self.capacity:
+                pos += self.capacity - offset
+                offset = 0
+            offsets.append(offset)
+            pos += size
+        return offsets, pos
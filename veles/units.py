@@ -50,9 +50,11 @@ from veles.distributable import Distributable, TriviallyDistributable, \
 from veles.external.progressbar import spin
 from veles.mutable import Bool, LinkableAttribute
 from veles.prng.random_generator import RandomGenerator
+from veles.profiler import profiler
 import veles.thread_pool as thread_pool
-from veles.timeit2 import timeit
+from veles.timeit2 import timeit, perf_counter
 from veles.unit_registry import UnitRegistry
+from veles.update_codec import normalize_spec
 from veles.verified import Verified
 
 
@@ -119,12 +121,17 @@ class Unit(Distributable, Verified):
                      executed and notification is not sent farther.
         _gate_skip: if evaluates to True, open_gate() and run() will are
                     executed, but notification is not sent farther.
+        _update_encoding: the encoding of the updates which this unit
+                          generates for master (see veles.update_codec).
     """
 
     _pool_ = None
     _pool_lock_ = threading.Lock()
+    # Incremented on every link change, invalidates the compiled plans
+    _plan_generation_ = 0
     timers = {}
     visible = True
+    _update_encoding = None
 
     def __init__(self, workflow, **kwargs):
         self.name = kwargs.get("name")
@@ -148,6 +155,7 @@ class Unit(Distributable, Verified):
             timings = False
         self._timings = kwargs.get("timings", timings)
         assert isinstance(self._timings, bool)
+        self.update_encoding = kwargs.get("update_encoding")
         self.workflow = workflow
         self.add_method_to_storage("initialize")
         self.add_method_to_storage("run")
@@ -165,7 +173,8 @@ class Unit(Distributable, Verified):
         def wrap_to_measure_time(name):
             func = getattr(self, name, None)
             if func is not None:
-                setattr(self, name, self._measure_time(func, Unit.timers))
+                setattr(self, name, self._measure_time(
+                    func, Unit.timers, name))
 
         # Important: these 4 decorator applications must stand before
         # super(...).init_unpickled since it will call
@@ -179,10 +188,11 @@ class Unit(Distributable, Verified):
         self._run_lock_ = threading.Lock()
         self._is_initialized = False
         self._stopped_ = False
+        self._plan_ = None
         if hasattr(self, "run"):
             self.run = self._check_run_conditions(self.run)
             self.run = self._track_call(self.run, "run_was_called")
-            self.run = self._measure_time(self.run, Unit.timers)
+            self.run = self._measure_time(self.run, Unit.timers, "run")
         if hasattr(self, "initialize"):
             self.initialize = self._ensure_reproducible_rg(self.initialize)
             self.initialize = self._retry_call(
@@ -362,6 +372,19 @@ class Unit(Distributable, Verified):
     def timings(self):
         return self._timings
 
+    @property
+    def update_encoding(self):
+        """
+        The encoding of the arrays in the updates for master: None, "delta",
+        "fp16", "topk" or the dictionary with "codec", "ratio" and
+        "error_feedback" keys. It is used only if master agrees.
+        """
+        return self._update_encoding
+
+    @update_encoding.setter
+    def update_encoding(self, value):
+        self._update_encoding = normalize_spec(value)
+
     @property
     def thread_pool(self):
         with Unit._pool_lock_:
@@ -484,6 +507,11 @@ class Unit(Distributable, Verified):
         """
         if self.stopped and not isinstance(self, Container):
             return
+        plan = self._plan_
+        if plan is not None and plan[0] == Unit._plan_generation_ and \
+                not profiler.enabled:
+            self._run_plan(plan[1])
+            return
         links = self.links_to_sorted
         # We must create a copy of gate_block-s because they can change
         # while the loop is working
@@ -501,6 +529,80 @@ class Unit(Distributable, Verified):
                     self.thread_pool.start()
                 self.thread_pool.callInThread(dst._check_gate_and_run, self)
 
+    def compile_plan(self):
+        """
+        Precomputes the chain of the units which run_dependent() runs in a
+        loop instead of going through _check_gate_and_run() and the thread
+        pool. Every unit in the chain is the only destination of the previous
+        one and has no other sources, so its gate always opens. The plan is
+        dropped as soon as any link changes.
+        :return: The number of units in the plan.
+        """
+        chain = []
+        visited = {self}
+        unit = self
+        while len(unit.links_to) == 1:
+            dst = next(Unit._iter_links(unit.links_to))
+            if dst in visited or not dst.runs_inline:
+                break
+            chain.append((dst, type(dst).run.__get__(dst, type(dst)), dst.id))
+            visited.add(dst)
+            unit = dst
+        self._plan_ = (Unit._plan_generation_, chain) \
+            if len(chain) > 0 else None
+        return len(chain)
+
+    @property
+    def runs_inline(self):
+        """
+        :return: True if this unit can be run by the compiled plan of its
+                 source, see compile_plan(); otherwise, False.
+        """
+        if isinstance(self, Container) or self.timings or \
+                len(self.links_from) != 1 or not hasattr(self, "run"):
+            return False
+        for name in "open_gate", "_check_gate_and_run", "run_dependent":
+            if name in self.__dict__ or six.get_unbound_function(getattr(
+                    type(self), name)) is not six.get_unbound_function(
+                    getattr(Unit, name)):
+                return False
+        return True
+
+    def _run_plan(self, chain):
+        """
+        Runs the compiled chain of dependent units, see compile_plan(). The
+        gates are checked the same way as in run_dependent() and
+        _check_gate_and_run(), but run() is called without the wrappers
+        of init_unpickled().
+        """
+        pool = self.thread_pool
+        timers = Unit.timers
+        spinning = not root.common.disable.spinning_run_progress and (
+            self.workflow is None or not self.interactive)
+        src = self
+        for unit, run, uid in chain:
+            if src.stopped or unit.gate_block or pool.failure is not None:
+                return
+            if unit.stopped or not unit._is_initialized:
+                # Let the dynamic dispatcher handle it
+                unit._check_gate_and_run(src)
+                return
+            if not unit.gate_skip:
+                if not unit._run_lock_.acquire(False):
+                    return
+                try:
+                    start = perf_counter()
+                    run()
+                    if uid in timers:
+                        timers[uid] += perf_counter() - start
+                    unit._run_calls += 1
+                finally:
+                    unit._run_lock_.release()
+                if spinning:
+                    spin()
+            src = unit
+        src.run_dependent()
+
     def dependent_units(self, with_open_gate=False):
         yield self
         walk = []
@@ -551,6 +653,7 @@ class Unit(Distributable, Verified):
     def link_from(self, *args):
         """Adds notification link.
         """
+        Unit._plan_generation_ += 1
         with self._gate_lock_:
             for src in args:
                 self.links_from[src] = False
@@ -750,6 +853,7 @@ class Unit(Distributable, Verified):
 
     @staticmethod
     def _del_link(container, obj):
+        Unit._plan_generation_ += 1
         if obj in container:
             del container[obj]
         else:
@@ -799,9 +903,16 @@ class Unit(Distributable, Verified):
                 self._run_lock_.release()
         self.run_dependent()
 
-    def _measure_time(self, fn, storage):
+    def _measure_time(self, fn, storage, event):
         def wrapped_measure_time(*args, **kwargs):
-            res, delta = timeit(fn, *args, **kwargs)
+            if profiler.enabled:
+                start = profiler.clock()
+                res = fn(*args, **kwargs)
+                end = profiler.clock()
+                profiler.record(event, "unit", start, end, self)
+                delta = end - start
+            else:
+                res, delta = timeit(fn, *args, **kwargs)
             if self.id in storage:
                 storage[self.id] += delta
             if self.timings:
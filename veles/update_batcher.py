@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+
+Created on Jul 15, 2015
+
+Applies the updates from slaves on a dedicated thread. The updates which
+have piled up while the previous batch was being applied are applied in one
+pass, so the units which can merge updates (see
+Distributable.merge_data_from_slaves()) do the heavy work once per batch.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from collections import deque
+import threading
+import time
+
+from six.moves import queue
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+
+from veles.external.prettytable import PrettyTable
+from veles.logger import Logger
+
+
+class UpdateBatcher(Logger):
+    """
+    Bounded queue of the updates from slaves and the thread which applies
+    them in batches. apply is called with the list of (data, slave) tuples
+    and must return the list of the results in the same order.
+    """
+
+    def __init__(self, apply, max_batch=8, max_queue=64, **kwargs):
+        super(UpdateBatcher, self).__init__(**kwargs)
+        if max_batch < 1:
+            raise ValueError("max_batch must be positive (got %d)" %
+                             max_batch)
+        self.apply = apply
+        self.max_batch = max_batch
+        self._queue = queue.Queue(max_queue)
+        # The items which did not fit into the queue, in the arrival order
+        self._overflow = deque()
+        self._overflow_lock = threading.Lock()
+        self._thread = None
+        self.updates = 0
+        self.batches = 0
+        self.overflows = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_queue_length = 0
+        self.max_queue_length = 0
+
+    @property
+    def queue_length(self):
+        return self._queue.qsize() + len(self._overflow)
+
+    @property
+    def stats(self):
+        return {"updates": self.updates,
+                "batches": self.batches,
+                "average_batch": float(self.updates) / (self.batches or 1),
+                "average_latency": self.total_latency / (self.updates or 1),
+                "max_latency": self.max_latency,
+                "average_queue_length":
+                float(self.total_queue_length) / (self.batches or 1),
+                "max_queue_length": self.max_queue_length,
+                "overflows": self.overflows}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name="update_batcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._enqueue(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, data, slave):
+        """
+        Enqueues the update. Must be called from the reactor's thread.
+        :return: Deferred which fires with the result of the update.
+        """
+        return self._put(("update", (data, slave)))
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Executes fn on the batcher's thread after all the updates which have
+        been already submitted, e.g., to drop a slave after its updates.
+        :return: Deferred which fires with the result of fn.
+        """
+        return self._put(("call", (fn, args, kwargs)))
+
+    def print_stats(self):
+        if self.updates == 0:
+            return
+        stats = self.stats
+        table = PrettyTable("updates", "batch", "latency", "max latency",
+                            "queue", "max queue", "overflows")
+        table.add_row(stats["updates"], "%.1f" % stats["average_batch"],
+                      "%.3f" % stats["average_latency"],
+                      "%.3f" % stats["max_latency"],
+                      "%.1f" % stats["average_queue_length"],
+                      stats["max_queue_length"], stats["overflows"])
+        self.info("Update application:\n%s", table)
+
+    def _put(self, item):
+        deferred = Deferred()
+        item += (deferred, time.time())
+        if not self._enqueue(item):
+            self.overflows += 1
+            self.debug("The update queue is full")
+        return deferred
+
+    def _enqueue(self, item):
+        """
+        Puts the item into the queue without blocking. If the queue is full
+        or the previous items are still waiting, the item waits in the
+        overflow list which the batcher's thread drains in order.
+        :return: False if the item was put into the overflow list.
+        """
+        with self._overflow_lock:
+            if len(self._overflow) == 0:
+                try:
+                    self._queue.put_nowait(item)
+                    return True
+                except queue.Full:
+                    pass
+            self._overflow.append(item)
+            return False
+
+    def _drain_overflow(self):
+        with self._overflow_lock:
+            while len(self._overflow) > 0:
+                try:
+                    self._queue.put_nowait(self._overflow[0])
+                except queue.Full:
+                    break
+                self._overflow.popleft()
+
+    def _get(self, block=True):
+        item = self._queue.get(block)
+        if len(self._overflow) > 0:
+            self._drain_overflow()
+        return item
+
+    def _run(self):
+        pending = []
+        while True:
+            item = pending.pop() if len(pending) > 0 else self._get()
+            if item is None:
+                break
+            if item[0] == "call":
+                fn, args, kwargs = item[1]
+                self._fire(item, lambda: fn(*args, **kwargs))
+                continue
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._get(False)
+                except queue.Empty:
+                    break
+                if item is None or item[0] != "update":
+                    pending.append(item)
+                    break
+                batch.append(item)
+            self._apply_batch(batch)
+        self.debug("Stopped")
+
+    def _apply_batch(self, batch):
+        queue_length = len(batch) + self._queue.qsize()
+        self.total_queue_length += queue_length
+        self.max_queue_length = max(self.max_queue_length, queue_length)
+        self.batches += 1
+        try:
+            results = self.apply([item[1] for item in batch])
+        except:
+            failure = Failure()
+            for item in batch:
+                self._resolve(item[2].errback, failure)
+            return
+        now = time.time()
+        for item, result in zip(batch, results):
+            latency = now - item[3]
+            self.updates += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self._resolve(item[2].callback, result)
+
+    def _fire(self, item, fn):
+        try:
+            result = fn()
+        except:
+            self._resolve(item[2].errback, Failure())
+        else:
+            self._resolve(item[2].callback, result)
+
+    @staticmethod
+    def _resolve(fn, value):
+        if reactor.running:
+            reactor.callFromThread(fn, value)
+        else:
+            fn(value)
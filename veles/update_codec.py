@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+.. invisible:
+     _   _ _____ _     _____ _____
+    | | | |  ___| |   |  ___/  ___|
+    | | | | |__ | |   | |__ \ `--.
+    | | | |  __|| |   |  __| `--. \
+    \ \_/ / |___| |___| |___/\__/ /
+     \___/\____/\_____|____/\____/
+
+
+Created on Jul 14, 2015
+
+Delta encoding of the updates which slaves send to master. Each floating
+point array in the unit's update is replaced with its difference from the
+version which the master has already acknowledged; the difference may be
+further converted to float16 or reduced to the top-k elements by magnitude.
+Both sides keep the reconstructed reference, so the error of the lossy
+encodings is fed back into the next update.
+
+███████████████████████████████████████████████████████████████████████████████
+
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+  http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing,
+software distributed under the License is distributed on an
+"AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+KIND, either express or implied.  See the License for the
+specific language governing permissions and limitations
+under the License.
+
+███████████████████████████████████████████████████████████████████████████████
+"""
+
+
+from collections import deque
+import threading
+
+import numpy
+
+from veles.error import BadFormatError
+from veles.logger import Logger
+from veles.memory import Array
+
+
+#: The supported encodings of the arrays' differences
+CODECS = "delta", "fp16", "topk"
+#: Smaller arrays are sent as is
+MIN_ELEMENTS = 64
+
+
+def normalize_spec(value):
+    """
+    Converts the unit's update_encoding to the canonical form.
+    :param value: None, the codec name or the dictionary with "codec",
+    "ratio" (the fraction of the elements which "topk" sends) and
+    "error_feedback" keys.
+    :return: None or the dictionary with all the keys set.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, dict):
+        value = {"codec": value}
+    spec = {"codec": value.get("codec"),
+            "ratio": float(value.get("ratio", 0.01)),
+            "error_feedback": bool(value.get("error_feedback", True))}
+    if spec["codec"] not in CODECS:
+        raise ValueError("Unsupported update encoding \"%s\" (choose one of "
+                         "%s)" % (spec["codec"], ", ".join(CODECS)))
+    if not 0 < spec["ratio"] <= 1:
+        raise ValueError("ratio must be in (0, 1] (got %f)" % spec["ratio"])
+    return spec
+
+
+class EncodedArray(object):
+    """
+    The encoded array inside the unit's update. codec is "full" (payload is
+    the array itself), "delta", "fp16" or "topk" (payload is the tuple of the
+    flat indices and the values). payload is None if the array has not
+    changed.
+    """
+
+    def __init__(self, codec, payload, shape, dtype, wrap):
+        self.codec = codec
+        self.payload = payload
+        self.shape = shape
+        self.dtype = dtype
+        self.wrap = wrap
+
+    @property
+    def nbytes(self):
+        if self.payload is None:
+            return 0
+        if self.codec == "topk":
+            return sum(p.nbytes for p in self.payload)
+        return self.payload.nbytes
+
+    def difference(self):
+        """
+        :return: The decoded difference or None if the array has not changed.
+        """
+        if self.payload is None:
+            return None
+        if self.codec == "topk":
+            indices, values = self.payload
+            diff = numpy.zeros(self.shape, self.dtype)
+            diff.ravel()[indices] = values
+            return diff
+        return self.payload.astype(self.dtype, copy=False)
+
+    def decode(self, base):
+        if self.codec == "full":
+            return self.payload
+        if base is None:
+            raise BadFormatError("No reference to apply the difference to")
+        diff = self.difference()
+        return base if diff is None else base + diff
+
+
+class EncodedUpdate(object):
+    """
+    The unit's update with the arrays replaced with :class:`EncodedArray`.
+    base is the version the differences are computed against or None.
+    """
+
+    def __init__(self, version, base, data):
+        self.version = version
+        self.base = base
+        self.data = data
+
+
+def walk(data, func, path=()):
+    """
+    Rebuilds the nested dicts, lists and tuples, replacing the arrays and
+    :class:`EncodedArray`-s with the results of func(path, value, wrap).
+    """
+    if isinstance(data, dict):
+        return {k: walk(v, func, path + (k,)) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        res = [walk(v, func, path + (i,)) for i, v in enumerate(data)]
+        return res if isinstance(data, list) else type(data)(res)
+    if isinstance(data, Array):
+        return func(path, data.mem, True) if data.mem is not None else data
+    if isinstance(data, (numpy.ndarray, EncodedArray)):
+        return func(path, data, False)
+    return data
+
+
+def _unwrap(value, wrap):
+    return Array(value) if wrap else value
+
+
+class UpdateCodecStats(Logger):
+    """
+    Counts the updates and the bytes before and after the encoding.
+    """
+
+    def __init__(self, **kwargs):
+        super(UpdateCodecStats, self).__init__(**kwargs)
+        self.updates = 0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+
+    @property
+    def saved_per_update(self):
+        return (self.raw_bytes - self.encoded_bytes) // (self.updates or 1)
+
+    @property
+    def stats(self):
+        return {"updates": self.updates, "raw_bytes": self.raw_bytes,
+                "encoded_bytes": self.encoded_bytes,
+                "saved_per_update": self.saved_per_update}
+
+    def _account(self, encoded_arrays):
+        raw = encoded = 0
+        for arr in encoded_arrays:
+            raw += numpy.prod(arr.shape, dtype=numpy.int64) * \
+                numpy.dtype(arr.dtype).itemsize
+            encoded += arr.nbytes
+        self.raw_bytes += int(raw)
+        self.encoded_bytes += encoded
+        return int(raw), encoded
+
+
+class UpdateEncoder(UpdateCodecStats):
+    """
+    Encodes the updates on the slave's side. The updates must be
+    acknowledged in the order they were sent.
+    """
+
+    def __init__(self, specs):
+        """
+        :param specs: unit index -> normalized update_encoding.
+        """
+        super(UpdateEncoder, self).__init__()
+        self.specs = specs
+        self.version = 0
+        self._lock = threading.Lock()
+        self._acked_version = None
+        # unit index -> path -> (the next reference, the master's copy)
+        self._acked = {}
+        self._pending = deque()
+
+    def encode(self, data):
+        """
+        :param data: the list of the units' updates in dependency order.
+        :return: The list with the updates of the negotiated units encoded.
+        """
+        with self._lock:
+            self.version += 1
+            base = self._acked_version
+            references = {}
+            encoded_arrays = []
+            result = list(data)
+            for index, spec in self.specs.items():
+                if index >= len(data) or data[index] is None:
+                    continue
+                acked = self._acked.get(index, {}) if base is not None \
+                    else {}
+                refs = references[index] = {}
+
+                def encode_array(path, arr, wrap):
+                    if arr.dtype.kind != "f" or arr.size < MIN_ELEMENTS:
+                        return _unwrap(arr, wrap)
+                    enc, refs[path] = self._encode_array(
+                        arr, acked.get(path), spec, wrap)
+                    encoded_arrays.append(enc)
+                    return enc
+
+                result[index] = EncodedUpdate(
+                    self.version, base, walk(data[index], encode_array))
+            self._pending.append((self.version, references))
+            self.updates += 1
+            raw, encoded = self._account(encoded_arrays)
+            self.debug("Encoded update %d: %d bytes -> %d bytes",
+                       self.version, raw, encoded)
+            return result
+
+    def acknowledge(self):
+        """
+        Marks the oldest sent update as received by the master.
+        """
+        with self._lock:
+            if len(self._pending) == 0:
+                self.warning("Received an unexpected update acknowledgement")
+                return
+            self._acked_version, self._acked = self._pending.popleft()
+
+    def decode(self, data):
+        """
+        Reconstructs the encoded update exactly as the master does.
+        """
+        with self._lock:
+            versions = dict(self._pending)
+            versions[self._acked_version] = self._acked
+        result = list(data)
+        for index, update in enumerate(data):
+            if not isinstance(update, EncodedUpdate):
+                continue
+            if update.version not in versions:
+                raise BadFormatError("Update %d was not sent" %
+                                     update.version)
+            refs = versions[update.version].get(index, {})
+            result[index] = walk(update.data, lambda path, enc, wrap: _unwrap(
+                refs[path][1].copy(), enc.wrap) if path in refs else enc)
+        return result
+
+    def reset(self):
+        """
+        Forgets all the updates, so that the next one is sent in full.
+        """
+        with self._lock:
+            self._acked_version = None
+            self._acked = {}
+            self._pending.clear()
+
+    @staticmethod
+    def _encode_array(arr, acked, spec, wrap):
+        """
+        :return: The encoded array and the tuple (the reference for the next
+        difference, the master's copy).
+        """
+        arr = numpy.ascontiguousarray(arr)
+        if acked is None or acked[0].shape != arr.shape or \
+                acked[0].dtype != arr.dtype:
+            copy = arr.copy()
+            return EncodedArray("full", copy, arr.shape, arr.dtype.str,
+                                wrap), (copy, copy)
+        reference, mirror = acked
+        diff = arr - reference
+        codec = spec["codec"]
+        if not diff.any():
+            payload = None
+        elif codec == "fp16":
+            payload = diff.astype(numpy.float16)
+        elif codec == "topk" and int(diff.size * spec["ratio"]) < diff.size:
+            flat = diff.ravel()
+            k = max(1, int(flat.size * spec["ratio"]))
+            indices = numpy.argpartition(
+                numpy.abs(flat), flat.size - k)[flat.size - k:]
+            indices.sort()
+            payload = indices.astype(numpy.int32 if flat.size < 2 ** 31
+                                     else numpy.int64), flat[indices]
+        else:
+            codec = "delta"
+            payload = diff
+        enc = EncodedArray(codec, payload, arr.shape, arr.dtype.str, wrap)
+        mirror = enc.decode(mirror)
+        return enc, (mirror if spec["error_feedback"] else arr.copy(), mirror)
+
+
+class UpdateDecoder(UpdateCodecStats):
+    """
+    Decodes the updates on the master's side.
+    """
+
+    def __init__(self):
+        super(UpdateDecoder, self).__init__()
+        self._lock = threading.Lock()
+        # slave id -> version -> unit index -> path -> reference
+        self._references = {}
+
+    def decode(self, slave_id, data):
+        """
+        :param data: the list of the units' updates in dependency order.
+        :return: The list with all the encoded updates restored.
+        """
+        result = list(data)
+        encoded_arrays = []
+        with self._lock:
+            versions = self._references.setdefault(slave_id, {})
+            for index, update in enumerate(data):
+                if isinstance(update, EncodedUpdate):
+                    result[index] = self._decode_update(
+                        slave_id, versions, index, update, encoded_arrays)
+            if len(encoded_arrays) > 0:
+                self.updates += 1
+                self._account(encoded_arrays)
+        return result
+
+    def drop(self, slave_id):
+        """
+        Forgets the references of the slave, e.g., when it disconnects.
+        """
+        with self._lock:
+            self._references.pop(slave_id, None)
+
+    @staticmethod
+    def _decode_update(slave_id, versions, index, update, encoded_arrays):
+        if update.base is not None:
+            if update.base not in versions:
+                raise BadFormatError(
+                    "The base version %d of the update from %s is unknown" %
+                    (update.base, slave_id))
+            base = versions[update.base].get(index, {})
+            for version in list(versions):
+                if version < update.base:
+                    del versions[version]
+        else:
+            # The slave has started from scratch
+            versions.clear()
+            base = {}
+        refs = versions.setdefault(update.version, {}).setdefault(index, {})
+
+        def decode_array(path, enc, wrap):
+            if not isinstance(enc, EncodedArray):
+                return _unwrap(enc, wrap)
+            encoded_arrays.append(enc)
+            value = refs[path] = enc.decode(base.get(path))
+            return _unwrap(value.copy(), enc.wrap)
+
+        return walk(update.data, decode_array)
@@ -54,13 +54,16 @@ from zope.interface import implementer
 
 from veles.compat import from_none, FileExistsError
 from veles.config import root
+from veles.critical_path import ParallelismAnalysis
 from veles.distributable import IDistributable
 from veles.error import VelesException
 from veles.mutable import LinkableAttribute
 from veles.json_encoders import NumpyJSONEncoder
 from veles.result_provider import IResultProvider
 from veles.units import Unit, IUnit, Container
+from veles.update_codec import UpdateEncoder, UpdateDecoder
 from veles.plumbing import StartPoint, EndPoint, Repeater
+from veles.profiler import profiler, PERCENTILES
 from veles.external.prettytable import PrettyTable
 from veles.external.progressbar import ProgressBar, Percentage, Bar
 import veles.external.pydot as pydot
@@ -130,6 +133,8 @@ class Workflow(Container):
         self._sync_event_.set()
         self._run_time_ = 0
         self._method_time_ = {"run": 0}
+        self._update_encoder_ = None
+        self._update_decoder_ = UpdateDecoder()
         del Unit.timers[self.id]
         units = self._units
         self._units = MultiMap()
@@ -342,6 +347,32 @@ class Workflow(Container):
                          units_number - initialized_units_number,
                          set(self) - set(units_in_dependency_order))
         self._restored_from_snapshot_ = None
+        if root.common.engine.inline_run:
+            self.compile_plans()
+
+    def compile_plans(self):
+        """
+        Compiles the static run plans of the heads of the unit chains, see
+        :meth:`veles.units.Unit.compile_plan()`.
+        :return: The number of units which are run inline.
+        """
+        for unit in self:
+            unit._plan_ = None
+        if root.common.trace.run:
+            return 0
+        inline = 0
+        for unit in self:
+            if isinstance(unit, Container) or len(unit.links_to) != 1:
+                continue
+            if len(unit.links_from) == 1 and unit.runs_inline:
+                src = next(Unit._iter_links(unit.links_from))
+                if len(src.links_to) == 1 and \
+                        not isinstance(src, Container):
+                    # Not a head, runs inline in the plan of its source
+                    continue
+            inline += unit.compile_plan()
+        self.debug("%d units run inline", inline)
+        return inline
 
     def run(self):
         """Starts executing the workflow. This function is synchronous
@@ -464,6 +495,8 @@ class Workflow(Container):
                     raise
             else:
                 data.append(None)
+        if self._update_encoder_ is not None:
+            data = self._update_encoder_.encode(data)
         self.event("generate_data", "end")
         self.debug("Done with generating the update for master")
         return data
@@ -531,6 +564,10 @@ class Workflow(Container):
         sid = slave.id if slave is not None else "self"
         self.debug("Applying the update from slave %s", sid)
         self.event("apply_data", "begin", slave=sid)
+        if slave is not None:
+            data = self._update_decoder_.decode(sid, data)
+        elif self._update_encoder_ is not None:
+            data = self._update_encoder_.decode(data)
         for i, unit in enumerate(self.units_in_dependency_order):
             if data[i] is not None and not unit.negotiates_on_connect:
                 try:
@@ -542,11 +579,57 @@ class Workflow(Container):
         self.debug("Done with applying the update from slave %s", sid)
         return True
 
+    @run_timed
+    @method_timed
+    def apply_data_from_slaves(self, updates):
+        """
+        Applies several updates at once. Run by a master.
+        The units which define merge_data_from_slaves() receive a single
+        merged update, the rest receive the updates one by one.
+        :param updates: the list of (data, slave) tuples in arrival order.
+        :return: The list of the results of every update.
+        """
+        mergers = [i for i, unit in enumerate(self.units_in_dependency_order)
+                   if not unit.negotiates_on_connect and
+                   getattr(unit, "merge_data_from_slaves", None) is not None]
+        if len(updates) == 1 or len(mergers) == 0:
+            return [self.apply_data_from_slave(data, slave)
+                    for data, slave in updates]
+        decoded = []
+        for data, slave in updates:
+            if not isinstance(data, list):
+                raise ValueError("data must be a list")
+            decoded.append(self._update_decoder_.decode(slave.id, data))
+        self.debug("Applying %d updates from slaves %s", len(updates),
+                   ", ".join(slave.id for _, slave in updates))
+        self.event("apply_data", "begin", slaves=len(updates))
+        for i, unit in enumerate(self.units_in_dependency_order):
+            if unit.negotiates_on_connect:
+                continue
+            items = [(data[i], slave)
+                     for data, (_, slave) in zip(decoded, updates)
+                     if data[i] is not None]
+            if len(items) == 0:
+                continue
+            try:
+                if i in mergers and len(items) > 1:
+                    unit.apply_data_from_slave(unit.merge_data_from_slaves(
+                        [data for data, _ in items]), None)
+                else:
+                    for data, slave in items:
+                        unit.apply_data_from_slave(data, slave)
+            except:
+                self.error("Unit %s failed to apply data from slaves", unit)
+                raise
+        self.event("apply_data", "end", slaves=len(updates))
+        return [True] * len(updates)
+
     @run_timed
     @method_timed
     def drop_slave(self, slave):
         for i in range(len(self)):
             self[i].drop_slave(slave)
+        self._update_decoder_.drop(slave.id)
         self.event("drop_slave", "single", slave=slave.id)
         self.warning("Dropped the job from %s", slave.id)
 
@@ -570,6 +653,51 @@ class Workflow(Container):
     run_timed = staticmethod(run_timed)
     method_timed = staticmethod(method_timed)
 
+    def negotiate_update_encodings(self, supported):
+        """
+        Chooses the encodings of the updates which the slave is going to use.
+        Run by a master.
+        :param supported: the encodings which the slave supports.
+        :return: unit index in dependency order -> update encoding.
+        """
+        encodings = {}
+        for i, unit in enumerate(self.units_in_dependency_order):
+            spec = unit.update_encoding
+            if spec is not None and spec["codec"] in supported:
+                encodings[i] = spec
+        return encodings
+
+    def apply_update_encodings(self, encodings):
+        """
+        Starts encoding the updates for master as negotiated. Run by a slave.
+        :param encodings: the result of negotiate_update_encodings().
+        """
+        if not encodings:
+            self._update_encoder_ = None
+            return
+        self._update_encoder_ = UpdateEncoder(
+            {int(k): v for k, v in encodings.items()})
+        self.info("Will encode the updates of %d units", len(encodings))
+
+    def acknowledge_update(self):
+        """
+        Called when master has received the last sent update. Run by a slave.
+        """
+        if self._update_encoder_ is not None:
+            self._update_encoder_.acknowledge()
+
+    @property
+    def update_codec_stats(self):
+        """
+        Returns the numbers of bytes in the updates before and after the
+        encoding or None if the updates are not encoded.
+        """
+        codec = self._update_encoder_ if self.is_slave else \
+            self._update_decoder_
+        if codec is None or codec.updates == 0:
+            return None
+        return codec.stats
+
     def generate_initial_data_for_master(self):
         data = []
         self.debug("Generating the initial data for master...")
@@ -818,12 +946,61 @@ class Workflow(Container):
                               datetime.timedelta(seconds=time_all))
             if time_all > 0:
                 self.info(u"Workflow methods run time:\n%s", table)
+        if len(profiler) > 0:
+            self.print_run_percentiles(by_name, top_number)
+        stats = self.update_codec_stats
+        if stats is not None:
+            self.info("Update encoding saved %d bytes per update on average "
+                      "(%d -> %d bytes in %d updates)",
+                      stats["saved_per_update"], stats["raw_bytes"],
+                      stats["encoded_bytes"], stats["updates"])
+
+    def get_unit_run_percentiles(self, by_name=False):
+        """
+        Returns the list of tuples (unit identifier, number of calls, total
+        time and the values of veles.profiler.PERCENTILES) sorted by the total
+        time. Requires veles.profiler.profiler to be enabled.
+        :param by_name: If True, use unit name as identifier; otherwise, \
+            unit class name.
+        """
+        durations = profiler.durations("run")
+        stats = []
+        for unit in self:
+            times = durations.get(unit.id)
+            if times is None:
+                continue
+            stats.append((unit.name if by_name else unit.__class__.__name__,
+                          len(times), times.sum()) +
+                         profiler.percentiles(times))
+        return sorted(stats, key=lambda x: x[2], reverse=True)
+
+    def print_run_percentiles(self, by_name=False, top_number=5):
+        stats = self.get_unit_run_percentiles(by_name)
+        if len(stats) == 0:
+            return
+        table = PrettyTable(*(("unit", "calls", "time") + tuple(
+            "p%d" % p for p in PERCENTILES)))
+        table.align["unit"] = "l"
+        for row in stats[:top_number]:
+            table.add_row(*(row[:2] + tuple(
+                datetime.timedelta(seconds=t) for t in row[2:])))
+        self.info(u"Unit run time percentiles top:\n%s", table)
+
+    def analyze_parallelism(self):
+        """
+        :return: :class:`veles.critical_path.ParallelismAnalysis` of the run
+                 times recorded by veles.profiler.profiler.
+        """
+        return ParallelismAnalysis(self)
 
     def gather_results(self):
         results = {"id": self.launcher.id, "log_id": self.launcher.log_id}
         for unit in self:
             if IResultProvider.providedBy(unit):
                 results.update(unit.get_metric_values())
+        stats = self.update_codec_stats
+        if stats is not None:
+            results["Update encoding"] = stats
         return results
 
     def write_results(self, file=None):
@@ -250,7 +250,13 @@ global.activateListItem = function(item_id) {
       rows += ' <span class="glyphicon glyphicon-flag"></span>';
     }
     rows += '</div></td>\n<td>';
-    rows += '<div class="progress"><div class="progress-bar ';
+    rows += '<div class="progress"';
+    if (slave.throughput != null) {
+      rows += ' title="' + slave.throughput.toFixed(2) + ' jobs/s, job ';
+      rows += slave.job_time.toFixed(3) + ' s, transfer ';
+      rows += (slave.transfer_time || 0).toFixed(3) + ' s"';
+    }
+    rows += '><div class="progress-bar ';
     var pwr = slave.power / max_power;
     if (pwr >= 0.7) {
       rows += 'progress-bar-success';